@@ -0,0 +1,4 @@
+"""
+Ad-hoc performance benchmarks, run as modules from the project root, e.g.
+``python -m benchmarks.manifest``.
+"""
@@ -0,0 +1,168 @@
+"""
+Benchmark of database connection handling: how much of a short request is
+spent setting up its Postgres connection with each connection mode.
+
+Every simulated request goes through Django's request signals, which open
+and close connections exactly as for a real request, and runs the query of
+a balance lookup. The modes are those of ``settings.DATABASES``:
+
+    - ``fresh``: ``CONN_MAX_AGE=0``, a new connection per request
+    - ``persistent``: ``CONN_MAX_AGE`` with health checks, one connection
+      per worker thread, reused across requests
+    - ``pool``: ``DJANGO_DATABASE_POOL``, a psycopg pool per process
+
+Each mode runs in its own process, configured through the environment like
+a deployment would be:
+
+    python -m benchmarks.connections --requests 2000 --concurrency 4
+
+Connection setup costs most over TCP with TLS and password authentication,
+so point ``DJANGO_DATABASE_HOST`` at a database like production's rather
+than a local socket. Also available as ``inv connbench``.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from statistics import mean
+
+import django
+
+from benchmarks.load import SHOPPER_PREFIX, percentile
+
+MODES = {
+    "fresh": {"DJANGO_DATABASE_CONN_MAX_AGE": "0", "DJANGO_DATABASE_POOL": "False"},
+    "persistent": {"DJANGO_DATABASE_CONN_MAX_AGE": "600", "DJANGO_DATABASE_POOL": "False"},
+    "pool": {"DJANGO_DATABASE_POOL": "True"},
+}
+WARMUP_REQUESTS = 20
+
+
+def measure(requests_per_thread, concurrency):
+    """
+    Runs the simulated requests in this process. Returns their latencies in
+    ms, and the number of server connections they used (distinct backend
+    pids), i.e. how many were opened for the measured requests.
+    """
+    from django.core.signals import request_finished, request_started
+    from django.db import connection, connections
+
+    from stickers.models import Shopper
+
+    def request(shopper_id, backend_pids):
+        started = time.perf_counter()
+        request_started.send(sender=None)
+        try:
+            Shopper.objects.filter(id=shopper_id).values_list("balance", flat=True).first()
+            backend_pids.add(connection.connection.info.backend_pid)
+        finally:
+            request_finished.send(sender=None)
+        return (time.perf_counter() - started) * 1000
+
+    def worker(index):
+        shopper_id = f"{SHOPPER_PREFIX}{index}"
+        warmup_pids = set()
+        for _ in range(WARMUP_REQUESTS):
+            request(shopper_id, warmup_pids)
+        backend_pids = set()
+        try:
+            latencies = [request(shopper_id, backend_pids) for _ in range(requests_per_thread)]
+        finally:
+            connections.close_all()
+        return latencies, backend_pids - warmup_pids
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(worker, range(concurrency)))
+
+    latencies = [latency for batch, _ in results for latency in batch]
+    return latencies, len(set().union(*(pids for _, pids in results)))
+
+
+def run_mode(mode, args):
+    """Runs ``mode`` in a child process configured through its environment."""
+    env = {**os.environ, **MODES[mode]}
+    command = [
+        sys.executable,
+        "-m",
+        "benchmarks.connections",
+        "--child",
+        "--requests",
+        str(args.requests),
+        "--concurrency",
+        str(args.concurrency),
+    ]
+    result = subprocess.run(command, env=env, capture_output=True, text=True)
+    if result.returncode != 0:
+        print(f"  {mode:<11} failed:\n{result.stderr.strip()}", flush=True)
+        return None
+    return json.loads(result.stdout)
+
+
+def summarize(latencies, connections_opened):
+    latencies = sorted(latencies)
+    return {
+        "requests": len(latencies),
+        "connections_opened": connections_opened,
+        "mean_ms": round(mean(latencies), 3),
+        "p50_ms": round(percentile(latencies, 0.50), 3),
+        "p95_ms": round(percentile(latencies, 0.95), 3),
+        "p99_ms": round(percentile(latencies, 0.99), 3),
+    }
+
+
+def print_report(report):
+    fresh = report.get("fresh")
+    print(f"\n{'mode':<11} {'requests':>9} {'connects':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'p50 saved':>10}")
+    for mode, row in report.items():
+        saved = f"{fresh['p50_ms'] - row['p50_ms']:>10.3f}" if fresh and mode != "fresh" else f"{'':>10}"
+        print(
+            f"{mode:<11} {row['requests']:>9} {row['connections_opened']:>9} {row['p50_ms']:>9.3f} "
+            f"{row['p95_ms']:>9.3f} {row['p99_ms']:>9.3f} {saved}"
+        )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modes", default=",".join(MODES), help="Connection modes to compare, comma separated")
+    parser.add_argument("--requests", type=int, default=1000, help="Requests per thread")
+    parser.add_argument("--concurrency", type=int, default=1, help="Threads per process, as in a threaded worker")
+    parser.add_argument("--output", help="Write the report to this JSON file")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "looplink.project.settings")
+
+    if args.child:
+        django.setup()
+        latencies, connections_opened = measure(args.requests, args.concurrency)
+        print(json.dumps(summarize(latencies, connections_opened)))
+        return 0
+
+    modes = args.modes.split(",")
+    unknown = set(modes) - set(MODES)
+    if unknown:
+        parser.error(f"Unknown modes: {', '.join(sorted(unknown))}")
+
+    print(f"Connection benchmark, {args.requests} requests x {args.concurrency} threads per mode")
+    report = {}
+    for mode in modes:
+        print(f"  {mode}...", flush=True)
+        row = run_mode(mode, args)
+        if row is not None:
+            report[mode] = row
+    print_report(report)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+            f.write("\n")
+        print(f"\nWrote {args.output}")
+    return 0 if len(report) == len(modes) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
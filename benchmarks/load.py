@@ -0,0 +1,318 @@
+"""
+Load test for the sticker API.
+
+Seed a dataset into the configured database, then drive a running server
+(``./manage.py runserver`` or gunicorn) with concurrent clients:
+
+    python -m benchmarks.load seed --shoppers 1000 --transactions 20 --items 5
+    python -m benchmarks.load run --url http://127.0.0.1:8000 --concurrency 16 --duration 30 \\
+        --output benchmarks/results/run.json
+    python -m benchmarks.load compare before.json after.json
+
+``run`` reports latency percentiles, requests/s and DB queries per request
+(read from the ``Server-Timing`` header of ``RequestTimingMiddleware``) per
+endpoint, and writes them as JSON so runs can be diffed. Also available as
+``inv loadtest``.
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import UTC, datetime
+from decimal import Decimal
+from statistics import mean
+
+import requests
+
+SHOPPER_PREFIX = "bench-shopper-"
+TRANSACTION_PREFIX = "bench-tx-"
+CATEGORIES = ["grocery", "grocery", "grocery", "household", "promo"]
+
+# Relative weight of each endpoint in the default traffic mix
+DEFAULT_MIX = "ingest=4,replay=1,shopper=3,stats=1,redeem=1"
+
+_QUERIES = re.compile(r'db;[^,]*desc="(\d+) queries"')
+
+
+def make_transaction(transaction_id, shopper_id, items, rng):
+    return {
+        "transaction_id": transaction_id,
+        "shopper_id": shopper_id,
+        "store_id": f"store-{rng.randrange(20):02d}",
+        "items": [
+            {
+                "sku": f"SKU-{rng.randrange(5000)}",
+                "name": "Benchmark item",
+                "quantity": rng.randint(1, 4),
+                "unit_price": f"{rng.randint(50, 5000) / 100:.2f}",
+                "category": rng.choice(CATEGORIES),
+            }
+            for _ in range(items)
+        ],
+    }
+
+
+# ─── Seeding ──────────────────────────────────────────────────────────────────
+
+
+def seed(args):
+    """
+    Bulk-generates shoppers and transactions through TransactionIngestService,
+    so balances, ledger and stats rollups stay consistent with the data.
+    """
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "looplink.project.settings")
+    import django
+
+    django.setup()
+
+    from stickers.models import Shopper
+    from stickers.services import StatsRollupService, TransactionIngestService
+
+    if args.reset:
+        deleted, _ = Shopper.objects.filter(id__startswith=SHOPPER_PREFIX).delete()
+        StatsRollupService.rebuild()
+        print(f"Deleted {deleted} rows of earlier benchmark data")
+
+    rng = random.Random(args.seed)
+    total = args.shoppers * args.transactions
+    batch = []
+    created = 0
+    start = time.perf_counter()
+
+    for shopper in range(args.shoppers):
+        for number in range(args.transactions):
+            transaction_id = f"{TRANSACTION_PREFIX}{shopper}-{number}"
+            batch.append(make_transaction(transaction_id, f"{SHOPPER_PREFIX}{shopper}", args.items, rng))
+            if len(batch) == args.batch_size:
+                created += _ingest(TransactionIngestService, batch)
+                batch = []
+                print(f"\r{created}/{total} transactions", end="", flush=True)
+    if batch:
+        created += _ingest(TransactionIngestService, batch)
+
+    elapsed = time.perf_counter() - start
+    print(f"\rSeeded {created} new transactions for {args.shoppers} shoppers in {elapsed:.1f}s")
+
+
+def _ingest(service, batch):
+    # ingest_many expects validated data, i.e. Decimal prices
+    for transaction in batch:
+        for item in transaction["items"]:
+            item["unit_price"] = Decimal(item["unit_price"])
+    return sum(result["status"] == "created" for result in service.ingest_many(batch))
+
+
+# ─── Load generation ──────────────────────────────────────────────────────────
+
+
+class Workload:
+    """Picks the next request to make, according to the traffic mix."""
+
+    def __init__(self, base_url, shoppers, items, mix, rng_seed):
+        self.base_url = base_url.rstrip("/")
+        self.shoppers = shoppers
+        self.items = items
+        self.endpoints, self.weights = zip(*mix.items())
+        self.rng_seed = rng_seed
+        self._local = threading.local()
+        self._sent = []
+        self._sent_lock = threading.Lock()
+
+    @property
+    def rng(self):
+        if not hasattr(self._local, "rng"):
+            self._local.rng = random.Random(f"{self.rng_seed}-{threading.get_ident()}")
+        return self._local.rng
+
+    def next_request(self):
+        endpoint = self.rng.choices(self.endpoints, self.weights)[0]
+        shopper_id = f"{SHOPPER_PREFIX}{self.rng.randrange(self.shoppers)}"
+
+        if endpoint == "replay":
+            with self._sent_lock:
+                payload = self.rng.choice(self._sent) if self._sent else None
+            if payload is not None:
+                return endpoint, "POST", "/api/transactions/", payload
+            endpoint = "ingest"
+
+        if endpoint == "ingest":
+            payload = make_transaction(f"{TRANSACTION_PREFIX}{uuid.uuid4().hex}", shopper_id, self.items, self.rng)
+            with self._sent_lock:
+                if len(self._sent) < 10_000:
+                    self._sent.append(payload)
+            return endpoint, "POST", "/api/transactions/", payload
+        if endpoint == "shopper":
+            return endpoint, "GET", f"/api/shoppers/{shopper_id}/", None
+        if endpoint == "stats":
+            return endpoint, "GET", "/api/stats/", None
+        if endpoint == "redeem":
+            return endpoint, "POST", "/api/redeem/", {"shopper_id": shopper_id, "reward_code": "MUG"}
+        raise ValueError(f"Unknown endpoint {endpoint!r}")
+
+
+def run(args):
+    mix = parse_mix(args.mix)
+    workload = Workload(args.url, args.shoppers, args.items, mix, args.seed)
+    samples = defaultdict(list)
+    samples_lock = threading.Lock()
+    deadline = time.perf_counter() + args.warmup + args.duration
+    measure_from = time.perf_counter() + args.warmup
+
+    def client():
+        session = requests.Session()
+        while (now := time.perf_counter()) < deadline:
+            endpoint, method, path, payload = workload.next_request()
+            start = time.perf_counter()
+            try:
+                response = session.request(method, workload.base_url + path, json=payload, timeout=args.timeout)
+                status, server_timing = response.status_code, response.headers.get("Server-Timing", "")
+            except requests.RequestException:
+                status, server_timing = None, ""
+            latency = time.perf_counter() - start
+            if now >= measure_from:
+                match = _QUERIES.search(server_timing)
+                with samples_lock:
+                    samples[endpoint].append((latency, status, int(match[1]) if match else None))
+
+    started_at = datetime.now(UTC).isoformat()
+    print(f"Running {args.concurrency} clients against {args.url} for {args.duration}s (+{args.warmup}s warmup)")
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        for future in [pool.submit(client) for _ in range(args.concurrency)]:
+            future.result()
+
+    report = {
+        "started_at": started_at,
+        "config": {
+            "url": args.url,
+            "concurrency": args.concurrency,
+            "duration": args.duration,
+            "shoppers": args.shoppers,
+            "items": args.items,
+            "mix": mix,
+        },
+        "host": {"python": platform.python_version(), "platform": platform.platform()},
+        "endpoints": {endpoint: summarize(rows, args.duration) for endpoint, rows in sorted(samples.items())},
+        "total": summarize([row for rows in samples.values() for row in rows], args.duration),
+    }
+
+    print_report(report)
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nWrote {args.output}")
+
+
+def parse_mix(value):
+    mix = {}
+    for part in value.split(","):
+        endpoint, _, weight = part.partition("=")
+        mix[endpoint.strip()] = float(weight)
+    return mix
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, round(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def summarize(rows, duration):
+    latencies = sorted(latency * 1000 for latency, _, _ in rows)
+    queries = [count for _, _, count in rows if count is not None]
+    statuses = defaultdict(int)
+    for _, status, _ in rows:
+        statuses[str(status)] += 1
+    return {
+        "requests": len(rows),
+        "requests_per_second": round(len(rows) / duration, 1),
+        "p50_ms": _round(percentile(latencies, 0.50)),
+        "p95_ms": _round(percentile(latencies, 0.95)),
+        "p99_ms": _round(percentile(latencies, 0.99)),
+        "max_ms": _round(latencies[-1] if latencies else None),
+        "queries_per_request": _round(mean(queries) if queries else None),
+        "status_codes": dict(statuses),
+    }
+
+
+def _round(value):
+    return None if value is None else round(value, 2)
+
+
+def print_report(report):
+    print(f"\n{'endpoint':<10} {'requests':>9} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'queries':>8}")
+    for endpoint, stats in [*report["endpoints"].items(), ("total", report["total"])]:
+        print(
+            f"{endpoint:<10} {stats['requests']:>9} {stats['requests_per_second']:>8} "
+            f"{_fmt(stats['p50_ms'])} {_fmt(stats['p95_ms'])} {_fmt(stats['p99_ms'])} "
+            f"{_fmt(stats['queries_per_request'])}"
+        )
+
+
+def _fmt(value):
+    return f"{value:>8}" if value is not None else f"{'-':>8}"
+
+
+def compare(args):
+    with open(args.before, encoding="utf-8") as f:
+        before = json.load(f)
+    with open(args.after, encoding="utf-8") as f:
+        after = json.load(f)
+
+    print(f"{'endpoint':<10} {'metric':<20} {'before':>10} {'after':>10} {'change':>8}")
+    for endpoint in sorted(set(before["endpoints"]) | set(after["endpoints"])) + ["total"]:
+        old = before["total"] if endpoint == "total" else before["endpoints"].get(endpoint, {})
+        new = after["total"] if endpoint == "total" else after["endpoints"].get(endpoint, {})
+        for metric in ["requests_per_second", "p50_ms", "p95_ms", "p99_ms", "queries_per_request"]:
+            a, b = old.get(metric), new.get(metric)
+            change = f"{(b - a) / a * 100:+.1f}%" if a and b is not None else "-"
+            print(f"{endpoint:<10} {metric:<20} {_fmt(a):>10} {_fmt(b):>10} {change:>8}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    seed_parser = commands.add_parser("seed", help="Generate benchmark shoppers and transactions")
+    seed_parser.add_argument("--shoppers", type=int, default=1000)
+    seed_parser.add_argument("--transactions", type=int, default=20, help="Transactions per shopper")
+    seed_parser.add_argument("--items", type=int, default=5, help="Items per basket")
+    seed_parser.add_argument("--batch-size", type=int, default=1000)
+    seed_parser.add_argument("--seed", type=int, default=42)
+    seed_parser.add_argument("--reset", action="store_true", help="Delete earlier benchmark data first")
+    seed_parser.set_defaults(handler=seed)
+
+    run_parser = commands.add_parser("run", help="Drive a running server and report latencies")
+    run_parser.add_argument("--url", default="http://127.0.0.1:8000")
+    run_parser.add_argument("--concurrency", type=int, default=8)
+    run_parser.add_argument("--duration", type=float, default=30, help="Seconds to measure")
+    run_parser.add_argument("--warmup", type=float, default=3, help="Seconds to run before measuring")
+    run_parser.add_argument("--shoppers", type=int, default=1000, help="As seeded")
+    run_parser.add_argument("--items", type=int, default=5, help="Items per ingested basket")
+    run_parser.add_argument("--mix", default=DEFAULT_MIX, help=f"Endpoint weights (default: {DEFAULT_MIX})")
+    run_parser.add_argument("--timeout", type=float, default=10)
+    run_parser.add_argument("--seed", type=int, default=42)
+    run_parser.add_argument("--output", help="Write the results to this JSON file")
+    run_parser.set_defaults(handler=run)
+
+    compare_parser = commands.add_parser("compare", help="Compare two result files")
+    compare_parser.add_argument("before")
+    compare_parser.add_argument("after")
+    compare_parser.set_defaults(handler=compare)
+
+    args = parser.parse_args(argv)
+    args.handler(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
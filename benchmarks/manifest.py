@@ -0,0 +1,87 @@
+"""
+Times rendering a page on ``base/layout.html`` with a webpack entry point,
+comparing the cached manifest loader with reading the manifest on every
+call, as it used to.
+
+    python -m benchmarks.manifest [-n ITERATIONS]
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import timeit
+from contextlib import nullcontext
+from pathlib import Path
+from unittest.mock import patch
+
+import django
+
+ENTRY_TEMPLATE = '{% extends "base/layout.html" %}{% load common_tags %}{% js_entry "base/common_entry" %}'
+
+
+def uncached_get_webpack_bundles(entry_name, filename=None, is_css=False):
+    """The previous loader: reads and parses the manifest on every call."""
+    from django.conf import settings
+
+    from looplink.django_ext.js_entry import WebpackManifestNotFoundError
+
+    path = settings.WEBPACK_BUILD_DIR / (filename or ("manifest.css.json" if is_css else "manifest.json"))
+    if not path.is_file():
+        raise WebpackManifestNotFoundError
+    with open(path, encoding="utf-8") as f:
+        manifest = json.load(f)
+    return [f"{settings.WEBPACK_BUILT_ASSETS_FOLDER}/{bundle}" for bundle in manifest.get(entry_name, [])]
+
+
+def write_manifests(build_dir, entries=50):
+    # A manifest about the size of a real project's, not just the one entry we render
+    js = {f"app/entry_{i}": ["runtime.js", f"vendor.{i}.js", f"entry_{i}.js"] for i in range(entries)}
+    js["base/common_entry"] = ["runtime.js", "vendor.js", "common_entry.js"]
+    css = {name: [bundle.replace(".js", ".css") for bundle in bundles[1:]] for name, bundles in js.items()}
+    (build_dir / "manifest.json").write_text(json.dumps(js))
+    (build_dir / "manifest.css.json").write_text(json.dumps(css))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-n", "--iterations", type=int, default=2000)
+    args = parser.parse_args()
+
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "looplink.project.settings")
+    django.setup()
+
+    from django.template import engines
+    from django.test import override_settings
+
+    from looplink.django_ext.js_entry import clear_webpack_manifest_cache
+
+    template = engines["django"].from_string(ENTRY_TEMPLATE)
+
+    with tempfile.TemporaryDirectory() as build_dir:
+        write_manifests(Path(build_dir))
+
+        results = {}
+        for label, debug, uncached in [
+            ("uncached (before)", False, True),
+            ("cached, DEBUG=True", True, False),
+            ("cached, DEBUG=False", False, False),
+        ]:
+            with override_settings(WEBPACK_BUILD_DIR=Path(build_dir), DEBUG=debug):
+                clear_webpack_manifest_cache()
+                loader = nullcontext()
+                if uncached:
+                    loader = patch("looplink.django_ext.js_entry.get_webpack_bundles", uncached_get_webpack_bundles)
+                with loader:
+                    assert "common_entry.js" in template.render({})
+                    results[label] = timeit.timeit(lambda: template.render({}), number=args.iterations)
+
+    baseline = results["uncached (before)"]
+    print(f"Rendering base/layout.html with a js_entry, {args.iterations} iterations")
+    for label, seconds in results.items():
+        per_render = seconds / args.iterations * 1_000_000
+        print(f"  {label:<22} {seconds:8.3f}s  {per_render:8.1f}µs/render  {baseline / seconds:5.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+"""
+Micro-benchmarks of the per-basket pure-Python work: scoring a basket with
+``StickerCalculationService.calculate`` (from item dicts and from a
+``Basket``), validating a transaction payload with ``TransactionSerializer``
+and with its fast path, and serializing a transaction back to JSON.
+
+Each is run for baskets of 1, 10, 100 and 1,000 items, reporting the time
+per item and the memory allocated per call (the peak traced by
+``tracemalloc``). Results are compared against a stored baseline, and the
+run fails if any of them regressed by more than ``--tolerance`` percent:
+
+    python -m benchmarks.micro                  # compare with the baseline
+    python -m benchmarks.micro --save-baseline  # record a new baseline
+
+Timings are only comparable on the same machine, so baselines are recorded
+where the comparison runs. Also available as ``inv microbench``.
+"""
+
+import argparse
+import gc
+import json
+import os
+import platform
+import random
+import sys
+import timeit
+import tracemalloc
+from decimal import Decimal
+from pathlib import Path
+
+import django
+
+BASKET_SIZES = (1, 10, 100, 1000)
+DEFAULT_BASELINE = Path(__file__).parent / "baselines" / "micro.json"
+DEFAULT_TOLERANCE = 10.0
+
+# Timing noise below this is ignored, however large it is in percent
+MIN_REGRESSION_NS = 5
+MIN_REGRESSION_BYTES = 256
+
+CATEGORIES = ["grocery", "grocery", "grocery", "household", "promo"]
+
+
+def make_payload(size, rng):
+    """A transaction as posted to the API, i.e. with prices as strings."""
+    return {
+        "transaction_id": f"bench-tx-{size}",
+        "shopper_id": "bench-shopper-0",
+        "store_id": "store-01",
+        "items": [
+            {
+                "sku": f"SKU-{rng.randrange(5000)}",
+                "name": "Benchmark item",
+                "quantity": rng.randint(1, 4),
+                "unit_price": f"{rng.randint(50, 5000) / 100:.2f}",
+                "category": rng.choice(CATEGORIES),
+            }
+            for _ in range(size)
+        ],
+    }
+
+
+def get_benchmarks(size):
+    """
+    Returns ``{name: callable}`` for a basket of ``size`` items. Inputs are
+    built here, so that only the work under test is timed.
+    """
+    from rest_framework.renderers import JSONRenderer
+
+    from stickers.baskets import Basket
+    from stickers.serializers import TransactionSerializer, fast_validate_transaction
+    from stickers.services import StickerCalculationService
+
+    payload = make_payload(size, random.Random(size))
+    validated = {**payload, "items": [{**item, "unit_price": Decimal(item["unit_price"])} for item in payload["items"]]}
+    basket = Basket.from_items(validated["items"])
+    renderer = JSONRenderer()
+
+    def calculate():
+        StickerCalculationService.calculate(validated["items"], store_id=validated["store_id"])
+
+    def calculate_basket():
+        StickerCalculationService.calculate(basket, store_id=validated["store_id"])
+
+    def validate():
+        serializer = TransactionSerializer(data=payload)
+        if not serializer.is_valid():
+            raise AssertionError(serializer.errors)
+
+    def fast_validate():
+        if fast_validate_transaction(payload) is None:
+            raise AssertionError("Not on the fast path")
+
+    def serialize():
+        renderer.render(TransactionSerializer(validated).data)
+
+    return {
+        "calculate": calculate,
+        "calculate_basket": calculate_basket,
+        "validate": validate,
+        "fast_validate": fast_validate,
+        "serialize": serialize,
+    }
+
+
+def measure(func, repeat):
+    """
+    Returns the best time of ``repeat`` timing runs, in ns per call, and the
+    peak memory allocated by one call, in bytes.
+    """
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    best = min(timer.repeat(repeat=repeat, number=number)) / number
+
+    # Warm up caches (rulesets, serializer fields) before tracing
+    func()
+    gc.collect()
+    tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        baseline, _ = tracemalloc.get_traced_memory()
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return best * 1e9, peak - baseline
+
+
+def run(sizes, repeat):
+    results = {}
+    for size in sizes:
+        for name, func in get_benchmarks(size).items():
+            ns_per_call, bytes_per_call = measure(func, repeat)
+            results[f"{name}[{size}]"] = {
+                "items": size,
+                "ns_per_item": round(ns_per_call / size, 1),
+                "bytes_per_call": bytes_per_call,
+            }
+            print(
+                f"  {name:<16} {size:>5} items  {ns_per_call / size:>10.1f} ns/item  {bytes_per_call:>10} B/call",
+                flush=True,
+            )
+    return results
+
+
+def find_regressions(baseline, results, tolerance):
+    """
+    Lists the benchmarks that got more than ``tolerance`` percent slower, or
+    allocate that much more memory, than in the baseline.
+    """
+    regressions = []
+    for key, result in results.items():
+        before = baseline.get(key)
+        if before is None:
+            continue
+        for metric, min_change in [("ns_per_item", MIN_REGRESSION_NS), ("bytes_per_call", MIN_REGRESSION_BYTES)]:
+            old, new = before[metric], result[metric]
+            change = new - old
+            if old and change > min_change and change / old * 100 > tolerance:
+                regressions.append(f"{key} {metric}: {old} -> {new} ({change / old * 100:+.1f}%)")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="Record the results as the new baseline")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=DEFAULT_TOLERANCE,
+        help=f"Percent slower or larger than the baseline that fails the run (default: {DEFAULT_TOLERANCE})",
+    )
+    parser.add_argument("--sizes", default=",".join(map(str, BASKET_SIZES)), help="Basket sizes, comma separated")
+    parser.add_argument("--repeat", type=int, default=5, help="Timing runs per benchmark, the best is kept")
+    args = parser.parse_args(argv)
+
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "looplink.project.settings")
+    django.setup()
+
+    sizes = [int(size) for size in args.sizes.split(",")]
+    print(f"Micro-benchmarks, best of {args.repeat}")
+    results = run(sizes, args.repeat)
+
+    if args.save_baseline:
+        args.baseline.parent.mkdir(parents=True, exist_ok=True)
+        report = {"host": {"python": platform.python_version(), "platform": platform.platform()}, "results": results}
+        args.baseline.write_text(json.dumps(report, indent=2) + "\n", encoding="utf-8")
+        print(f"\nWrote baseline {args.baseline}")
+        return 0
+
+    if not args.baseline.exists():
+        print(f"\nNo baseline at {args.baseline}, record one with --save-baseline")
+        return 0
+
+    baseline = json.loads(args.baseline.read_text(encoding="utf-8"))
+    regressions = find_regressions(baseline["results"], results, args.tolerance)
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) of more than {args.tolerance}% against {args.baseline}:")
+        for regression in regressions:
+            print(f"  {regression}")
+        return 1
+
+    print(f"\nNo regressions of more than {args.tolerance}% against {args.baseline}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,5 +1,6 @@
 from .action import (
     DjangoHtmxActionMixin,
+    HtmxAction,
     HtmxResponseException,
     HtmxResponseForbidden,
     dj_hx_action,
@@ -8,6 +9,7 @@ from .debug import DjangoHtmxDebugMixin
 
 __all__ = [
     "DjangoHtmxActionMixin",
+    "HtmxAction",
     "HtmxResponseException",
     "HtmxResponseForbidden",
     "dj_hx_action",
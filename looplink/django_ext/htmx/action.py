@@ -1,13 +1,36 @@
+import copy
 import json
 import logging
+from collections.abc import Callable
+from types import MappingProxyType, MethodType
+from typing import NamedTuple
 
-from django.http import HttpResponse, HttpResponseForbidden
+from django.http import HttpResponse, HttpResponseBadRequest, HttpResponseForbidden
+from django.utils.html import format_html
+from django.utils.safestring import mark_safe
+
+from .cache import HtmxFragmentCache
 
 ANY_METHOD = "any_method"
 
+UNKNOWN_ACTION_MESSAGE = "Unknown HTMX action."
+METHOD_NOT_ALLOWED_MESSAGE = "HTTP method not allowed for this HTMX action."
+INVALID_BATCH_MESSAGE = "Invalid DJ-HX-Actions header."
+
+# htmx swap styles that unwrap an out-of-band element, see DjangoHtmxActionMixin._dispatch_batch
+BATCH_SWAP_STYLES = ("innerHTML", "beforebegin", "afterbegin", "beforeend", "afterend", "delete")
+
 logger = logging.getLogger(__name__)
 
 
+class HtmxAction(NamedTuple):
+    name: str
+    func: Callable
+    # Upper case HTTP method, or None for any method
+    method: str | None
+    cache: HtmxFragmentCache | None
+
+
 class DjangoHtmxActionMixin:
     """
     A mixin for TemplateView classes that dispatches requests from HTMX where
@@ -17,7 +40,10 @@ class DjangoHtmxActionMixin:
     The dispatch method will then route the action request to the method in the
     class with the same name as the slug present in ``dj-hx-action``.
 
-    A security requirement is that the receiving method must be decorated with ``@dj_hx_action()``
+    A security requirement is that the receiving method must be decorated with ``@dj_hx_action()``.
+    Decorated methods are collected once per class when it is defined, so
+    dispatching an action is a single dict lookup. Use ``get_htmx_actions()``
+    to list them.
 
     Each method decorated with ``dj_hx_action`` should receive the following arguments:
         ``request``, ``*args``, ``**kwargs``
@@ -63,6 +89,36 @@ class DjangoHtmxActionMixin:
 
     default_htmx_error_template = "base/partials/htmx/htmx_action_error.html"
 
+    # Most actions that may be sent in one DJ-HX-Actions request
+    max_htmx_batch_size = 20
+
+    # Action name -> HtmxAction, built for each subclass by __init_subclass__
+    _htmx_actions = MappingProxyType({})
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        actions = {}
+        for klass in reversed(cls.__mro__):
+            for name, attr in vars(klass).items():
+                method = getattr(attr, "dj_hx_action", None) if callable(attr) else None
+                if method is None:
+                    # Overriding an action without the decorator withdraws it
+                    actions.pop(name, None)
+                    continue
+                allowed_method = None if method == ANY_METHOD else method.upper()
+                actions[name] = HtmxAction(name, attr, allowed_method, getattr(attr, "dj_hx_action_cache", None))
+        cls._htmx_actions = MappingProxyType(actions)
+
+    @classmethod
+    def get_htmx_actions(cls):
+        """
+        The HTMX actions this view accepts, e.g. to check the ``dj-hx-action``
+        names used in templates.
+
+        :return: read-only dict of action name to ``HtmxAction``
+        """
+        return cls._htmx_actions
+
     def get_htmx_error_context(self, action, htmx_error, **kwargs):
         """
         Use this method to return the context for the HTMX error template.
@@ -108,25 +164,27 @@ class DjangoHtmxActionMixin:
         )
 
     def dispatch(self, request, *args, **kwargs):
+        if "HTTP_DJ_HX_ACTIONS" in request.META:
+            return self._dispatch_batch(request, *args, **kwargs)
+
         action = request.META.get("HTTP_DJ_HX_ACTION")
         if not action:
             return super().dispatch(request, *args, **kwargs)
 
-        handler = getattr(self, action, None)
-        if not callable(handler):
-            return HtmxResponseForbidden(f"Method '{type(self).__name__}.{action}' does not exist")
+        # Rejections don't echo the request back, as these are mostly hit by scanners
+        htmx_action = self._htmx_actions.get(action)
+        if htmx_action is None:
+            return HtmxResponseForbidden(UNKNOWN_ACTION_MESSAGE)
 
-        action_method = getattr(handler, "dj_hx_action", None)
-        if not action_method:
-            return HtmxResponseForbidden(f"Method '{type(self).__name__}.{action}' has no @dj_hx_action decorator.")
-
-        if action_method != ANY_METHOD and action_method.lower() != request.method.lower():
-            return HtmxResponseForbidden(
-                f"Method '{type(self).__name__}.{action}' is not allowed to use HTTP {request.method} requests."
-            )
+        if htmx_action.method is not None and htmx_action.method != request.method:
+            return HtmxResponseForbidden(METHOD_NOT_ALLOWED_MESSAGE)
 
+        handler = MethodType(htmx_action.func, self)
         try:
-            response = handler(request, *args, **kwargs)
+            if htmx_action.cache is not None:
+                response = htmx_action.cache.get_response(self, action, handler, request, *args, **kwargs)
+            else:
+                response = handler(request, *args, **kwargs)
         except HtmxResponseException as err:
             return self._return_error_response(err, action=action)
         except Exception as err:
@@ -135,40 +193,175 @@ class DjangoHtmxActionMixin:
             raise
         return response
 
+    def _dispatch_batch(self, request, *args, **kwargs):
+        """
+        Runs several actions in one request. The ``DJ-HX-Actions`` header holds
+        a JSON list of actions, run in order:
+
+            [{"action": "refresh_totals", "target": "#totals", "swap": "innerHTML", "params": {"day": "2"}}, ...]
+
+        ``params`` are added to ``request.GET`` (or ``request.POST``) for that
+        action only, and ``swap`` defaults to ``innerHTML``. Each action's
+        fragment is returned as an out-of-band swap into its ``target``. The
+        ``outerHTML`` swap is not supported, because the fragment is wrapped
+        for the out-of-band swap; target the fragment's container instead.
+
+        Each action must allow the request's HTTP method. Failed actions are
+        left out of the response and listed in the ``DJ-HX-Action-Error``
+        header, as a JSON list in the same format as for single actions, plus
+        the action's ``index`` in the batch. Response headers set by the
+        handlers are not passed on.
+        """
+        try:
+            batch = json.loads(request.META["HTTP_DJ_HX_ACTIONS"])
+            if not isinstance(batch, list) or not 0 < len(batch) <= self.max_htmx_batch_size:
+                raise ValueError
+            for item in batch:
+                if not isinstance(item.get("action"), str) or not isinstance(item.get("target"), str):
+                    raise ValueError
+                if item.get("swap", "innerHTML") not in BATCH_SWAP_STYLES:
+                    raise ValueError
+                if not isinstance(item.get("params", {}), dict):
+                    raise ValueError
+        except (ValueError, AttributeError):
+            return HttpResponseBadRequest(INVALID_BATCH_MESSAGE)
+
+        if request.method not in ("GET", "HEAD"):
+            # Read the body once, before it is shared by the per-action requests
+            request.POST  # noqa: B018
+
+        fragments = []
+        errors = []
+        for index, item in enumerate(batch):
+            htmx_action = self._htmx_actions.get(item["action"])
+            if htmx_action is None:
+                errors.append(self._get_error_details(HtmxResponseException(UNKNOWN_ACTION_MESSAGE, 403), index=index))
+                continue
+            if htmx_action.method is not None and htmx_action.method != request.method:
+                errors.append(
+                    self._get_error_details(
+                        HtmxResponseException(METHOD_NOT_ALLOWED_MESSAGE, 403), action=htmx_action.name, index=index
+                    )
+                )
+                continue
+
+            action_request = _get_batch_action_request(request, item.get("params"))
+            handler = MethodType(htmx_action.func, self)
+            try:
+                if htmx_action.cache is not None:
+                    response = htmx_action.cache.get_response(
+                        self, htmx_action.name, handler, action_request, *args, **kwargs
+                    )
+                else:
+                    response = handler(action_request, *args, **kwargs)
+                if hasattr(response, "render") and not response.is_rendered:
+                    response.render()
+            except HtmxResponseException as err:
+                errors.append(self._get_error_details(err, action=htmx_action.name, index=index))
+                continue
+            except Exception as err:
+                # todo log to sentry here
+                logger.exception(f"Error in HTMX action '{htmx_action.name}': {err}")
+                raise
+
+            if response.status_code >= 400:
+                errors.append(
+                    self._get_error_details(
+                        HtmxResponseException(response.reason_phrase, response.status_code),
+                        action=htmx_action.name,
+                        index=index,
+                    )
+                )
+                continue
+
+            swap = item.get("swap", "innerHTML")
+            fragments.append(
+                format_html(
+                    '<div hx-swap-oob="{}:{}">{}</div>',
+                    swap,
+                    item["target"],
+                    mark_safe(response.content.decode(response.charset)),
+                )
+            )
+
+        response = HttpResponse("".join(fragments))
+        if errors:
+            response["DJ-HX-Action-Error"] = json.dumps(errors)
+        return response
+
+    def _get_error_details(self, htmx_response_error, action=None, **extra):
+        return {
+            "message": htmx_response_error.message,
+            "status_code": htmx_response_error.status_code,
+            "retry_after": htmx_response_error.retry_after,
+            "show_details": htmx_response_error.show_details,
+            "max_retries": htmx_response_error.max_retries,
+            "action": action,
+            **extra,
+        }
+
     def _return_error_response(self, htmx_response_error, action=None):
         """
         Return a response for HTMX errors we want to handle gracefully
         on the client side.
         """
         response = HttpResponse(htmx_response_error.message, status=htmx_response_error.status_code)
-        response["DJ-HX-Action-Error"] = json.dumps(
-            {
-                "message": htmx_response_error.message,
-                "status_code": htmx_response_error.status_code,
-                "retry_after": htmx_response_error.retry_after,
-                "show_details": htmx_response_error.show_details,
-                "max_retries": htmx_response_error.max_retries,
-                "action": action,
-            }
-        )
+        response["DJ-HX-Action-Error"] = json.dumps(self._get_error_details(htmx_response_error, action=action))
         return response
 
 
-def dj_hx_action(method=ANY_METHOD):
+def dj_hx_action(method=ANY_METHOD, cache_timeout=None, vary_on=None):
     """
     All methods that can be referenced from the value of an `dj-hx-action` attribute
     must be decorated with ``@dj_hx_action``.
 
     See ``DjangoHtmxActionMixin`` docstring for usage examples.
+
+    Actions whose markup only depends on their inputs can cache the rendered
+    fragment for ``cache_timeout`` seconds. List the URL kwargs or GET
+    parameters the fragment depends on in ``vary_on``, and include ``"user"``
+    if it differs between users:
+
+        @dj_hx_action("get", cache_timeout=60, vary_on=["page"])
+        def item_list(request, *args, **kwargs):
+            ...
+
+    Only ``GET`` requests are served from the cache. See ``HtmxFragmentCache``.
     """
+    if cache_timeout is not None and method != ANY_METHOD and method.lower() != "get":
+        raise ValueError("Only 'get' actions can be cached")
 
     def decorator(func):
         setattr(func, "dj_hx_action", method)
+        if cache_timeout is not None:
+            setattr(func, "dj_hx_action_cache", HtmxFragmentCache(cache_timeout, vary_on))
         return func
 
     return decorator
 
 
+def _get_batch_action_request(request, params):
+    """
+    A shallow copy of a batch request for running one of its actions, with
+    the action's ``params`` added to the query (or form) parameters.
+    """
+    action_request = copy.copy(request)
+    # Conditional headers apply to the batch response, not to each fragment
+    action_request.META = {
+        key: value for key, value in request.META.items() if key not in ("HTTP_IF_NONE_MATCH", "HTTP_IF_MODIFIED_SINCE")
+    }
+    if params:
+        is_query = request.method in ("GET", "HEAD")
+        data = (request.GET if is_query else request.POST).copy()
+        for name, value in params.items():
+            data.setlist(name, [str(v) for v in value] if isinstance(value, list) else [str(value)])
+        if is_query:
+            action_request.GET = data
+        else:
+            action_request.POST = data
+    return action_request
+
+
 class HtmxResponseForbidden(HttpResponseForbidden):
     def __init__(self, error_message, *args, **kwargs):
         super().__init__(error_message, reason=f"Forbidden: {error_message}", *args, **kwargs)
@@ -181,6 +374,10 @@ class HtmxResponseException(Exception):
 
     status_code = 400
     message = None
+    # Client-side retry hints, passed on in the DJ-HX-Action-Error header
+    retry_after = None
+    show_details = False
+    max_retries = 0
 
     def __init__(self, message=None, status=None, *args, **kwargs):
         self.message = message
@@ -0,0 +1,113 @@
+import hashlib
+import json
+import os
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, quote_etag
+from django.utils.translation import get_language
+
+CACHEABLE_METHODS = ("GET", "HEAD")
+
+
+class HtmxFragmentCache:
+    """
+    Caches the rendered response of a ``dj_hx_action`` in the cache named by
+    ``settings.HTMX_FRAGMENT_CACHE`` (default: ``"default"``).
+
+    Entries are keyed by view, action, request path, language and the values
+    of the ``vary_on`` names, and dropped when the action's template file changes.
+    Responses carry an ETag so that clients revalidating an unchanged
+    fragment receive a ``304 Not Modified`` instead of the markup.
+
+    Only ``GET`` and ``HEAD`` requests that return ``200`` are cached.
+    """
+
+    def __init__(self, timeout, vary_on=None):
+        """
+        :param timeout: Seconds to keep a rendered fragment.
+        :param vary_on: Names of URL kwargs or GET parameters that change the
+            fragment. ``"user"`` varies on the logged-in user. Fragments are
+            shared between all users unless ``"user"`` is listed.
+        """
+        self.timeout = timeout
+        self.vary_on = tuple(vary_on or ())
+
+    def get_response(self, view, action, handler, request, *args, **kwargs):
+        if request.method not in CACHEABLE_METHODS:
+            return handler(request, *args, **kwargs)
+
+        cache = caches[getattr(settings, "HTMX_FRAGMENT_CACHE", "default")]
+        key = self.get_cache_key(view, action, request, kwargs)
+
+        entry = cache.get(key)
+        if entry is None or not _templates_unchanged(entry["templates"]):
+            response = handler(request, *args, **kwargs)
+            if hasattr(response, "render") and not response.is_rendered:
+                response.render()
+            if response.status_code != 200 or response.streaming:
+                return response
+
+            entry = {
+                "content": response.content,
+                "headers": dict(response.items()),
+                "etag": quote_etag(hashlib.md5(response.content, usedforsecurity=False).hexdigest()),
+                "templates": _template_signatures(response),
+            }
+            cache.set(key, entry, self.timeout)
+
+        not_modified = get_conditional_response(request, etag=entry["etag"])
+        if not_modified is not None:
+            return not_modified
+
+        response = HttpResponse(entry["content"], headers=entry["headers"])
+        response["ETag"] = entry["etag"]
+        return response
+
+    def get_cache_key(self, view, action, request, view_kwargs):
+        values = []
+        for name in self.vary_on:
+            if name == "user":
+                user = getattr(request, "user", None)
+                values.append(user.pk if user is not None and user.is_authenticated else None)
+            elif name in view_kwargs:
+                values.append(view_kwargs[name])
+            else:
+                values.append(request.GET.getlist(name))
+
+        view_class = type(view)
+        digest = hashlib.md5(
+            json.dumps([request.path, get_language(), values], default=str).encode(),
+            usedforsecurity=False,
+        ).hexdigest()
+        return f"dj_hx_action:{view_class.__module__}.{view_class.__qualname__}:{action}:{digest}"
+
+
+def _template_signatures(response):
+    """
+    The (path, mtime) of the template a TemplateResponse was rendered from,
+    so that edits to it invalidate the fragment.
+    """
+    template_name = getattr(response, "template_name", None)
+    if not template_name:
+        return []
+
+    template = response.resolve_template(template_name)
+    origin = getattr(getattr(template, "template", template), "origin", None)
+    path = getattr(origin, "name", None)
+    try:
+        return [(path, os.stat(path).st_mtime_ns)]
+    except (OSError, TypeError):
+        # Not loaded from a file
+        return []
+
+
+def _templates_unchanged(signatures):
+    for path, mtime in signatures:
+        try:
+            if os.stat(path).st_mtime_ns != mtime:
+                return False
+        except OSError:
+            return False
+    return True
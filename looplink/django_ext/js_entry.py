@@ -1,22 +1,110 @@
 import json
+import os
+import stat
+import threading
+from dataclasses import dataclass
 
 from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
 
 
 class WebpackManifestNotFoundError(Exception):
     pass
 
 
+@dataclass(frozen=True)
+class _CachedManifest:
+    # (mtime_ns, inode, size) of the file the manifest was read from
+    signature: tuple
+    manifest: dict
+    # Static paths of each entry's bundles, ready for the template filters
+    bundles: dict
+
+
+_manifest_cache = {}
+_manifest_cache_lock = threading.Lock()
+
+
 def get_webpack_manifest(filename=None, is_css=False):
+    """
+    Returns the parsed webpack manifest, mapping entry names to bundle files.
+
+    Manifests are cached per process and path. With ``DEBUG`` on, the file
+    is checked for changes on every call so ``npm run watch`` rebuilds are
+    picked up; otherwise it is read once and never again. The returned dict
+    is shared and must not be modified.
+
+    :param filename: The manifest file in ``WEBPACK_BUILD_DIR``. Defaults to
+        ``manifest.json`` or ``manifest.css.json``.
+    :param is_css: Whether to default to the css manifest.
+
+    :raises WebpackManifestNotFoundError: If the manifest file does not exist.
+    """
+    return _get_cached_manifest(_manifest_path(filename, is_css)).manifest
+
+
+def get_webpack_bundles(entry_name, filename=None, is_css=False):
+    """
+    Returns the static paths of the bundles for an entry point, i.e. each
+    bundle in the manifest prefixed with ``WEBPACK_BUILT_ASSETS_FOLDER``.
+
+    :param entry_name: The name of the entry point in the webpack manifest.
+    :param filename: As for ``get_webpack_manifest``.
+    :param is_css: As for ``get_webpack_manifest``.
+    :return: A tuple of paths, empty if the entry is not in the manifest.
+
+    :raises WebpackManifestNotFoundError: If the manifest file does not exist.
+    """
+    return _get_cached_manifest(_manifest_path(filename, is_css)).bundles.get(entry_name, ())
+
+
+def clear_webpack_manifest_cache():
+    with _manifest_cache_lock:
+        _manifest_cache.clear()
+
+
+@receiver(setting_changed)
+def _clear_cache_on_setting_change(*, setting, **kwargs):
+    if setting in ("DEBUG", "WEBPACK_BUILD_DIR", "WEBPACK_BUILT_ASSETS_FOLDER"):
+        clear_webpack_manifest_cache()
+
+
+def _manifest_path(filename, is_css):
     if not filename:
-        default_filename = "manifest.css.json" if is_css else "manifest.json"
-        path = settings.WEBPACK_BUILD_DIR / default_filename
-    else:
-        path = settings.WEBPACK_BUILD_DIR / filename
-    if not path.is_file():
-        raise WebpackManifestNotFoundError
+        filename = "manifest.css.json" if is_css else "manifest.json"
+    return settings.WEBPACK_BUILD_DIR / filename
 
-    with open(path, encoding="utf-8") as f:
-        manifest = json.load(f)
 
-    return manifest
+def _get_cached_manifest(path):
+    cached = _manifest_cache.get(path)
+    if cached is not None and not settings.DEBUG:
+        return cached
+
+    signature = _file_signature(path)
+    if cached is not None and cached.signature == signature:
+        return cached
+
+    with _manifest_cache_lock:
+        cached = _manifest_cache.get(path)
+        if cached is None or cached.signature != signature:
+            with open(path, encoding="utf-8") as f:
+                manifest = json.load(f)
+            webpack_folder = settings.WEBPACK_BUILT_ASSETS_FOLDER
+            bundles = {
+                entry_name: tuple(f"{webpack_folder}/{bundle}" for bundle in entry_bundles)
+                for entry_name, entry_bundles in manifest.items()
+            }
+            cached = _manifest_cache[path] = _CachedManifest(signature, manifest, bundles)
+
+    return cached
+
+
+def _file_signature(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        raise WebpackManifestNotFoundError from None
+    if not stat.S_ISREG(st.st_mode):
+        raise WebpackManifestNotFoundError
+    return st.st_mtime_ns, st.st_ino, st.st_size
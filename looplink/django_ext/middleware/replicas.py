@@ -0,0 +1,51 @@
+from django.conf import settings
+
+from looplink.django_ext.replicas import _routing_state, _RoutingState, replica_pool
+
+PIN_COOKIE = "db_primary"
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Routes the reads of views marked with ``replica_reads`` to a healthy
+    replica from ``settings.DB_REPLICAS`` (see ``ReplicaRouter``).
+
+    A request that writes sets a cookie that keeps the client's reads on
+    the primary for ``settings.DB_REPLICA_PIN_SECONDS``, so that it sees its
+    own writes however far behind the replicas are. Clients that don't keep
+    cookies can read data up to ``settings.DB_REPLICA_MAX_LAG`` seconds old.
+
+    Place it before any middleware that queries the database.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        state = _RoutingState()
+        token = _routing_state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _routing_state.reset(token)
+
+        if state.wrote and settings.DB_REPLICAS:
+            response.set_cookie(
+                PIN_COOKIE,
+                "1",
+                max_age=settings.DB_REPLICA_PIN_SECONDS,
+                httponly=True,
+                samesite="Lax",
+            )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if not settings.DB_REPLICAS or PIN_COOKIE in request.COOKIES:
+            return None
+
+        view_class = getattr(view_func, "view_class", None)
+        if getattr(view_func, "replica_reads", False) or getattr(view_class, "replica_reads", False):
+            state = _routing_state.get()
+            if state is not None and not state.wrote:
+                state.replica = replica_pool.choose()
+        return None
@@ -0,0 +1,245 @@
+"""
+Per-request timing of DB queries, cache lookups and template rendering, see
+``RequestTimingMiddleware``.
+
+Template rendering and cache lookups have no hooks of their own, so the
+first middleware instance with a non-zero sample rate wraps
+``Template.render`` and the ``get``/``get_many`` of every configured cache
+backend class, for the lifetime of the process. Outside of a measured
+request the wrappers only check a context variable and call through.
+"""
+
+import random
+import time
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+import structlog
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connections
+from django.template.base import Template
+
+logger = structlog.get_logger()
+
+# Metrics of the sampled request being handled in this thread, if any
+_current_timings = ContextVar("request_timings", default=None)
+
+_MISSING = object()
+
+
+class RequestTimings:
+    __slots__ = (
+        "db_queries",
+        "db_time",
+        "cache_hits",
+        "cache_misses",
+        "template_time",
+        "template_depth",
+    )
+
+    def __init__(self):
+        self.db_queries = 0
+        self.db_time = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.template_time = 0.0
+        # Nested renders (includes) are already part of the outer render's time
+        self.template_depth = 0
+
+
+class RequestTimingMiddleware:
+    """
+    Records where each request's time goes: total wall time, DB queries and
+    their time, cache hits and misses, and template rendering time.
+
+    The numbers are sent back in a ``Server-Timing`` header, which browser
+    dev tools display alongside the network timings, and logged as one
+    structured "Request timing" event. HTMX action requests are labelled
+    with their ``dj-hx-action`` name.
+
+    ``settings.REQUEST_TIMING_SAMPLE_RATE`` (0 to 1, default 1) sets the
+    share of requests that are measured; the rest pass straight through.
+    At 0 nothing is patched (see the module docstring).
+
+    Streaming responses send their headers before the body, and with it
+    most of their queries, so they get no ``Server-Timing`` header. They are
+    measured until the body is sent and logged then, with ``streamed=True``.
+
+    Place it first in ``MIDDLEWARE`` so the other middleware is included in
+    the total.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.sample_rate = getattr(settings, "REQUEST_TIMING_SAMPLE_RATE", 1.0)
+        if self.sample_rate > 0:
+            _install_hooks()
+
+    def __call__(self, request):
+        if self.sample_rate <= 0 or (self.sample_rate < 1 and random.random() >= self.sample_rate):
+            return self.get_response(request)
+
+        timings = RequestTimings()
+        start = time.perf_counter()
+        with _measuring(timings):
+            response = self.get_response(request)
+
+        if response.streaming and not getattr(response, "is_async", False):
+            response.streaming_content = self._measure_stream(
+                response.streaming_content, response, timings, request, start
+            )
+            return response
+
+        duration = time.perf_counter() - start
+        if not response.streaming:
+            response["Server-Timing"] = ", ".join(
+                [
+                    f"app;dur={duration * 1000:.1f}",
+                    f'db;dur={timings.db_time * 1000:.1f};desc="{timings.db_queries} queries"',
+                    f'cache;desc="{timings.cache_hits} hits {timings.cache_misses} misses"',
+                    f"tpl;dur={timings.template_time * 1000:.1f}",
+                ]
+            )
+        self._log(request, response, timings, duration)
+        return response
+
+    def _measure_stream(self, content, response, timings, request, start):
+        iterator = iter(content)
+        try:
+            while True:
+                with _measuring(timings):
+                    chunk = next(iterator, _MISSING)
+                if chunk is _MISSING:
+                    break
+                yield chunk
+        finally:
+            # Closes e.g. the server-side cursor of a client that went away
+            if hasattr(iterator, "close"):
+                iterator.close()
+            self._log(request, response, timings, time.perf_counter() - start)
+
+    def _log(self, request, response, timings, duration):
+        logger.info(
+            "Request timing",
+            method=request.method,
+            path=request.path,
+            status=response.status_code,
+            htmx_action=_htmx_action(request),
+            streamed=response.streaming,
+            duration_ms=round(duration * 1000, 1),
+            db_queries=timings.db_queries,
+            db_ms=round(timings.db_time * 1000, 1),
+            cache_hits=timings.cache_hits,
+            cache_misses=timings.cache_misses,
+            template_ms=round(timings.template_time * 1000, 1),
+        )
+
+
+@contextmanager
+def _measuring(timings):
+    token = _current_timings.set(timings)
+    try:
+        with ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(connections[alias].execute_wrapper(_QueryTimer(timings)))
+            yield
+    finally:
+        _current_timings.reset(token)
+
+
+class _QueryTimer:
+    def __init__(self, timings):
+        self.timings = timings
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.timings.db_time += time.perf_counter() - start
+            self.timings.db_queries += 1
+
+
+def _htmx_action(request):
+    if "HTTP_DJ_HX_ACTIONS" in request.META:
+        return "batch"
+    return request.META.get("HTTP_DJ_HX_ACTION")
+
+
+_hooks_installed = False
+
+
+def _install_hooks():
+    """
+    Wraps template rendering and the cache backends in use so they report
+    to the current request's timings. Outside of a sampled request the
+    wrappers only cost a context variable lookup.
+    """
+    global _hooks_installed
+    if _hooks_installed:
+        return
+    _hooks_installed = True
+
+    Template.render = _timed_render(Template.render)
+
+    for backend_class in {type(caches[alias]) for alias in settings.CACHES}:
+        backend_class.get = _counted_get(backend_class.get)
+        backend_class.get_many = _counted_get_many(backend_class.get_many)
+
+
+def _timed_render(render):
+    @wraps(render)
+    def wrapper(self, context):
+        timings = _current_timings.get()
+        if timings is None or timings.template_depth:
+            return render(self, context)
+
+        timings.template_depth += 1
+        start = time.perf_counter()
+        try:
+            return render(self, context)
+        finally:
+            timings.template_time += time.perf_counter() - start
+            timings.template_depth -= 1
+
+    return wrapper
+
+
+def _counted_get(get):
+    @wraps(get)
+    def wrapper(self, key, default=None, *args, **kwargs):
+        timings = _current_timings.get()
+        if timings is None:
+            return get(self, key, default, *args, **kwargs)
+
+        value = get(self, key, _MISSING, *args, **kwargs)
+        if value is _MISSING:
+            timings.cache_misses += 1
+            return default
+        timings.cache_hits += 1
+        return value
+
+    return wrapper
+
+
+def _counted_get_many(get_many):
+    @wraps(get_many)
+    def wrapper(self, keys, *args, **kwargs):
+        timings = _current_timings.get()
+        if timings is None:
+            return get_many(self, keys, *args, **kwargs)
+
+        keys = list(keys)
+        # Backends without their own get_many call get() for each key
+        token = _current_timings.set(None)
+        try:
+            values = get_many(self, keys, *args, **kwargs)
+        finally:
+            _current_timings.reset(token)
+        timings.cache_hits += len(values)
+        timings.cache_misses += len(keys) - len(values)
+        return values
+
+    return wrapper
@@ -0,0 +1,175 @@
+import itertools
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+
+import structlog
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+logger = structlog.get_logger()
+
+# Replication lag in seconds, 0 when the server is not a replica or has
+# replayed everything it received
+_LAG_SQL = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+"""
+
+
+@dataclass
+class _RoutingState:
+    # The replica this request reads from, None for the primary
+    replica: str = None
+    wrote: bool = False
+
+
+_routing_state = ContextVar("db_routing_state", default=None)
+
+
+class ReplicaRouter:
+    """
+    Sends reads to the replica chosen for the current request by
+    ``ReplicaRoutingMiddleware``, and everything else to the primary.
+
+    Once a request writes, its remaining reads go to the primary too, and
+    the middleware pins the client to the primary for a while so that it
+    reads its own writes.
+    """
+
+    def db_for_read(self, model, **hints):
+        state = _routing_state.get()
+        if state is not None and state.replica is not None:
+            return state.replica
+        return None
+
+    def db_for_write(self, model, **hints):
+        state = _routing_state.get()
+        if state is not None:
+            state.replica = None
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in settings.DB_REPLICAS:
+            return False
+        return None
+
+
+def replica_reads(view):
+    """
+    Marks a function view as read-only, so its queries may be served by a
+    replica. For class-based views set ``replica_reads = True`` instead.
+    """
+    view.replica_reads = True
+    return view
+
+
+@contextmanager
+def primary_reads():
+    """
+    Sends the reads inside the block to the primary, without pinning the
+    client to it, e.g. to fill a cache that must not take in replica lag.
+    """
+    state = _routing_state.get()
+    if state is None or state.replica is None:
+        yield
+        return
+
+    replica, state.replica = state.replica, None
+    try:
+        yield
+    finally:
+        if not state.wrote:
+            state.replica = replica
+
+
+class ReplicaPool:
+    """
+    Picks replicas from ``settings.DB_REPLICAS`` round-robin, skipping those
+    that are unreachable or lag more than ``settings.DB_REPLICA_MAX_LAG``
+    seconds behind the primary. Each replica is checked at most once every
+    ``settings.DB_REPLICA_HEALTH_CHECK_INTERVAL`` seconds per process.
+    """
+
+    def __init__(self):
+        # alias -> (checked_at, healthy)
+        self._health = {}
+        self._checking = set()
+        self._lock = threading.Lock()
+        self._counter = itertools.count()
+
+    def choose(self):
+        """
+        Returns the alias of a healthy replica, or None to use the primary.
+        """
+        replicas = settings.DB_REPLICAS
+        if not replicas:
+            return None
+
+        start = next(self._counter)
+        for offset in range(len(replicas)):
+            alias = replicas[(start + offset) % len(replicas)]
+            if self.is_healthy(alias):
+                return alias
+        return None
+
+    def is_healthy(self, alias):
+        checked_at, healthy = self._health.get(alias, (None, False))
+        now = time.monotonic()
+        if checked_at is not None and now - checked_at < settings.DB_REPLICA_HEALTH_CHECK_INTERVAL:
+            return healthy
+
+        with self._lock:
+            if alias in self._checking:
+                # Another thread is checking it; go by the last result
+                return healthy
+            self._checking.add(alias)
+        try:
+            healthy = self._check(alias)
+        finally:
+            with self._lock:
+                self._health[alias] = (time.monotonic(), healthy)
+                self._checking.discard(alias)
+        return healthy
+
+    def reset(self):
+        with self._lock:
+            self._health.clear()
+            self._counter = itertools.count()
+
+    def _check(self, alias):
+        try:
+            lag = replica_lag(alias)
+        except Exception as e:
+            logger.warning("Database replica unavailable", alias=alias, error=str(e))
+            connections[alias].close()
+            return False
+
+        if lag > settings.DB_REPLICA_MAX_LAG:
+            logger.warning("Database replica lagging", alias=alias, lag_seconds=round(lag, 1))
+            return False
+        return True
+
+
+def replica_lag(alias):
+    """
+    Returns how many seconds the replica ``alias`` is behind the primary.
+    """
+    connection = connections[alias]
+    if connection.vendor != "postgresql":
+        return 0.0
+    with connection.cursor() as cursor:
+        cursor.execute(_LAG_SQL)
+        return float(cursor.fetchone()[0])
+
+
+replica_pool = ReplicaPool()
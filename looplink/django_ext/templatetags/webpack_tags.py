@@ -1,5 +1,4 @@
 from django import template
-from django.conf import settings
 from django.template import TemplateSyntaxError
 
 register = template.Library()
@@ -22,17 +21,16 @@ def _get_webpack_bundles(entry_name, is_css=False):
 
     :param entry_name: The name of the entry point in the webpack manifest.
     :param is_css: Whether to get the css bundles or not.
-    :return: A list of the bundles for the given entry name.
+    :return: A tuple of the bundles for the given entry name.
 
     :raises TemplateSyntaxError: If the webpack manifest is not found or
         if the entry name is not found in the manifest.
     :raises WebpackManifestNotFoundError: If the webpack manifest is not found.
     """
-    from looplink.django_ext.js_entry import WebpackManifestNotFoundError, get_webpack_manifest
+    from looplink.django_ext.js_entry import WebpackManifestNotFoundError, get_webpack_bundles
 
     try:
-        manifest = get_webpack_manifest(is_css=is_css)
-        webpack_folder = settings.WEBPACK_BUILT_ASSETS_FOLDER
+        bundles = get_webpack_bundles(entry_name, is_css=is_css)
     except WebpackManifestNotFoundError:
         raise TemplateSyntaxError(
             f"No webpack manifest found!\n"
@@ -40,7 +38,6 @@ def _get_webpack_bundles(entry_name, is_css=False):
             f"Did you run `inv npm` / `npm run build` / `npm run watch`?\n\n\n"
         )
 
-    bundles = manifest.get(entry_name, [])
     if not bundles:
         webpack_error = (
             f"No webpack manifest entry found for '{entry_name}'.\n\n"
@@ -48,4 +45,4 @@ def _get_webpack_bundles(entry_name, is_css=False):
             f"Did you try restarting `inv npm` / `npm run build` / `npm run watch`?\n\n\n"
         )
         raise TemplateSyntaxError(webpack_error)
-    return [f"{webpack_folder}/{bundle}" for bundle in bundles]
+    return bundles
@@ -0,0 +1,75 @@
+import re
+from collections import Counter
+from contextlib import contextmanager
+
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test.utils import CaptureQueriesContext
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"(?<![\w\"])-?\d+(?:\.\d+)?\b")
+_SAVEPOINT_NAME = re.compile(r'"s\d+_x\d+"')
+_VALUE_LIST = re.compile(r"\((?:\s*(?:\?|NULL|true|false|DEFAULT)\s*(?:::\w+(?:\[\])?)?\s*,?)+\)", re.IGNORECASE)
+_REPEATED_GROUPS = re.compile(r"\(\.\.\.\)(?:\s*,\s*\(\.\.\.\))+")
+
+
+def sql_shape(sql):
+    """
+    Reduces a SQL statement to its shape by replacing literals and lists of
+    values, so that the same query run for different rows compares equal.
+    """
+    shape = _STRING_LITERAL.sub("?", sql)
+    shape = _SAVEPOINT_NAME.sub("?", shape)
+    shape = _NUMBER_LITERAL.sub("?", shape)
+    shape = _VALUE_LIST.sub("(...)", shape)
+    return _REPEATED_GROUPS.sub("(...)", shape)
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+@contextmanager
+def query_budget(max_queries, max_repeats=1, using=DEFAULT_DB_ALIAS):
+    """
+    Fails if the block runs more than ``max_queries`` queries, or runs any one
+    query shape (see ``sql_shape``) more than ``max_repeats`` times, which is
+    how an N+1 query pattern usually shows up.
+
+        with query_budget(3):
+            client.get("/api/shoppers/shopper-1/")
+
+    :param max_queries: The most queries the block may run.
+    :param max_repeats: How often the same query shape may run. ``None``
+        disables the check.
+    :param using: The database alias to watch.
+
+    :raises QueryBudgetExceeded: with the offending queries listed.
+    """
+    with CaptureQueriesContext(connections[using]) as captured:
+        yield captured
+
+    queries = [query["sql"] for query in captured.captured_queries]
+    if len(queries) > max_queries:
+        listing = "\n".join(f"{number}. {sql}" for number, sql in enumerate(queries, start=1))
+        raise QueryBudgetExceeded(f"{len(queries)} queries executed, budget is {max_queries}:\n{listing}")
+
+    if max_repeats is not None:
+        shape, count = Counter(sql_shape(sql) for sql in queries).most_common(1)[0] if queries else (None, 0)
+        if count > max_repeats:
+            raise QueryBudgetExceeded(
+                f"The same query ran {count} times, at most {max_repeats} allowed (N+1 query?):\n{shape}"
+            )
+
+
+class QueryBudgetMixin:
+    """
+    Adds ``assertQueryBudget`` to a test case:
+
+        class ShopperTests(QueryBudgetMixin, TestCase):
+            def test_detail(self):
+                with self.assertQueryBudget(2):
+                    self.client.get(...)
+    """
+
+    def assertQueryBudget(self, max_queries, max_repeats=1, using=DEFAULT_DB_ALIAS):
+        return query_budget(max_queries, max_repeats=max_repeats, using=using)
@@ -0,0 +1,461 @@
+import json
+import os
+import time
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest.mock import patch
+
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.db import connection, router
+from django.http import HttpResponse, StreamingHttpResponse
+from django.template import TemplateSyntaxError, engines
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.views.generic import TemplateView
+from structlog.testing import capture_logs
+
+from looplink.django_ext import js_entry
+from looplink.django_ext.htmx import DjangoHtmxActionMixin, HtmxResponseException, dj_hx_action
+from looplink.django_ext.middleware.replicas import PIN_COOKIE, ReplicaRoutingMiddleware
+from looplink.django_ext.middleware.timing import RequestTimingMiddleware
+from looplink.django_ext.replicas import primary_reads, replica_pool, replica_reads
+from looplink.django_ext.templatetags.webpack_tags import webpack_css_bundles, webpack_js_bundles
+
+
+class WebpackManifestCacheTests(SimpleTestCase):
+    def setUp(self):
+        tmp = TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.build_dir = Path(tmp.name)
+        self._write("manifest.json", {"base/common_entry": ["common.js", "vendor.js"]})
+        self._write("manifest.css.json", {"base/common_entry": ["common.css"]})
+
+        settings_override = override_settings(WEBPACK_BUILD_DIR=self.build_dir, WEBPACK_BUILT_ASSETS_FOLDER="webpack")
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def _write(self, filename, manifest):
+        path = self.build_dir / filename
+        path.write_text(json.dumps(manifest))
+        # Make sure the change is visible even on filesystems with coarse mtimes
+        bump = time.time_ns() + 1_000_000_000
+        os.utime(path, ns=(bump, bump))
+
+    def test_filters_return_prefixed_bundles(self):
+        self.assertEqual(webpack_js_bundles("base/common_entry"), ("webpack/common.js", "webpack/vendor.js"))
+        self.assertEqual(webpack_css_bundles("base/common_entry"), ("webpack/common.css",))
+
+    @override_settings(DEBUG=True)
+    def test_unknown_entry_or_missing_manifest(self):
+        with self.assertRaises(TemplateSyntaxError):
+            webpack_js_bundles("base/unknown_entry")
+
+        (self.build_dir / "manifest.json").unlink()
+        with self.assertRaises(TemplateSyntaxError):
+            webpack_js_bundles("base/common_entry")
+
+    @override_settings(DEBUG=False)
+    def test_read_once_in_production(self):
+        with patch("looplink.django_ext.js_entry.os.stat", wraps=os.stat) as stat:
+            for _ in range(3):
+                js_entry.get_webpack_bundles("base/common_entry")
+        self.assertEqual(stat.call_count, 1)
+
+        self._write("manifest.json", {"base/common_entry": ["changed.js"]})
+        self.assertEqual(js_entry.get_webpack_bundles("base/common_entry"), ("webpack/common.js", "webpack/vendor.js"))
+
+    @override_settings(DEBUG=True)
+    def test_reloaded_on_change_in_debug(self):
+        with patch("looplink.django_ext.js_entry.json.load", wraps=json.load) as load:
+            js_entry.get_webpack_manifest()
+            js_entry.get_webpack_manifest()
+        self.assertEqual(load.call_count, 1)
+
+        self._write("manifest.json", {"base/common_entry": ["changed.js"]})
+        self.assertEqual(js_entry.get_webpack_bundles("base/common_entry"), ("webpack/changed.js",))
+
+
+class FragmentView(DjangoHtmxActionMixin, TemplateView):
+    template_name = "fragment.html"
+    renders = 0
+
+    @dj_hx_action("get", cache_timeout=60, vary_on=["page"])
+    def fragment(self, request, *args, **kwargs):
+        FragmentView.renders += 1
+        return self.render_htmx_partial_response(request, "fragment.html", {"page": request.GET.get("page")})
+
+
+@override_settings(HTMX_FRAGMENT_CACHE="locmem")
+class HtmxFragmentCacheTests(SimpleTestCase):
+    def setUp(self):
+        tmp = TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.template = Path(tmp.name) / "fragment.html"
+        self.template.write_text("<p>Page {{ page }}</p>")
+
+        templates_override = override_settings(
+            TEMPLATES=[
+                {
+                    "BACKEND": "django.template.backends.django.DjangoTemplates",
+                    "DIRS": [tmp.name],
+                    # Without the cached loader, so template edits show up as they do under runserver
+                    "OPTIONS": {"loaders": ["django.template.loaders.filesystem.Loader"]},
+                }
+            ]
+        )
+        templates_override.enable()
+        self.addCleanup(templates_override.disable)
+
+        caches["locmem"].clear()
+        FragmentView.renders = 0
+        self.view = FragmentView.as_view()
+        self.factory = RequestFactory()
+
+    def _get(self, **params):
+        headers = {"HTTP_DJ_HX_ACTION": "fragment"}
+        if "etag" in params:
+            headers["HTTP_IF_NONE_MATCH"] = params.pop("etag")
+        return self.view(self.factory.get("/fragment/", params, **headers))
+
+    def test_fragment_served_from_cache(self):
+        first = self._get(page="1")
+        second = self._get(page="1")
+
+        self.assertEqual(first.content, b"<p>Page 1</p>")
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(second["ETag"], first["ETag"])
+        self.assertEqual(FragmentView.renders, 1)
+
+        self.assertEqual(self._get(page="2").content, b"<p>Page 2</p>")
+        self.assertEqual(FragmentView.renders, 2)
+
+    def test_not_modified(self):
+        etag = self._get(page="1")["ETag"]
+
+        response = self._get(page="1", etag=etag)
+
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b"")
+        self.assertEqual(self._get(page="2", etag=etag).status_code, 200)
+
+    def test_template_change_invalidates(self):
+        self._get(page="1")
+
+        self.template.write_text("<p>Changed {{ page }}</p>")
+        bump = time.time_ns() + 1_000_000_000
+        os.utime(self.template, ns=(bump, bump))
+
+        self.assertEqual(self._get(page="1").content, b"<p>Changed 1</p>")
+        self.assertEqual(FragmentView.renders, 2)
+
+    def test_only_get_actions_can_be_cached(self):
+        for method in ["post", "POST"]:
+            with self.subTest(method=method), self.assertRaises(ValueError):
+                dj_hx_action(method, cache_timeout=60)
+        # Methods match in any case, as when dispatching
+        dj_hx_action("GET", cache_timeout=60)
+
+
+class ActionView(DjangoHtmxActionMixin, TemplateView):
+    @dj_hx_action("post")
+    def save(self, request, *args, **kwargs):
+        return HttpResponse(f"saved by {type(self).__name__}")
+
+    @dj_hx_action()
+    def refresh(self, request, *args, **kwargs):
+        return HttpResponse("refreshed")
+
+    @dj_hx_action("get")
+    def greet(self, request, *args, **kwargs):
+        return HttpResponse(f"<p>Hello {request.GET.get('name', 'you')}</p>")
+
+    @dj_hx_action()
+    def fail(self, request, *args, **kwargs):
+        raise HtmxResponseException("Try again later", status=503)
+
+    def helper(self, request, *args, **kwargs):
+        return HttpResponse("not an action")
+
+
+class ChildActionView(ActionView):
+    # Overridden without the decorator, so no longer an action
+    def refresh(self, request, *args, **kwargs):
+        return HttpResponse("not an action")
+
+
+class HtmxActionDispatchTests(SimpleTestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+
+    def _dispatch(self, view_class, method, action):
+        request = getattr(self.factory, method)("/actions/", HTTP_DJ_HX_ACTION=action)
+        return view_class.as_view()(request)
+
+    def test_registry(self):
+        self.assertEqual(
+            {name: action.method for name, action in ActionView.get_htmx_actions().items()},
+            {"save": "POST", "refresh": None, "greet": "GET", "fail": None},
+        )
+        self.assertEqual(list(ChildActionView.get_htmx_actions()), ["save", "greet", "fail"])
+        self.assertEqual(dict(DjangoHtmxActionMixin.get_htmx_actions()), {})
+
+    def test_dispatch(self):
+        self.assertEqual(self._dispatch(ActionView, "post", "save").content, b"saved by ActionView")
+        self.assertEqual(self._dispatch(ChildActionView, "post", "save").content, b"saved by ChildActionView")
+        self.assertEqual(self._dispatch(ActionView, "get", "refresh").content, b"refreshed")
+
+    def test_rejections_do_not_echo_the_request(self):
+        for view_class, method, action in [
+            (ActionView, "post", "helper"),
+            (ActionView, "post", "<script>alert(1)</script>"),
+            (ActionView, "get", "save"),
+            (ChildActionView, "get", "refresh"),
+        ]:
+            with self.subTest(view=view_class.__name__, method=method, action=action):
+                response = self._dispatch(view_class, method, action)
+                self.assertEqual(response.status_code, 403)
+                self.assertNotIn(action.encode(), response.content)
+                self.assertNotIn(view_class.__name__.encode(), response.content)
+
+
+class HtmxActionBatchTests(SimpleTestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+
+    def _dispatch(self, batch, method="get", **params):
+        header = batch if isinstance(batch, str) else json.dumps(batch)
+        request = getattr(self.factory, method)("/actions/", params, HTTP_DJ_HX_ACTIONS=header)
+        return ActionView.as_view()(request)
+
+    def test_fragments_are_swapped_out_of_band(self):
+        response = self._dispatch(
+            [
+                {"action": "greet", "target": "#one", "params": {"name": "Ada"}},
+                {"action": "greet", "target": "#two", "swap": "beforeend"},
+                {"action": "refresh", "target": "#three"},
+            ],
+            name="Grace",
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.content.decode(),
+            '<div hx-swap-oob="innerHTML:#one"><p>Hello Ada</p></div>'
+            '<div hx-swap-oob="beforeend:#two"><p>Hello Grace</p></div>'
+            '<div hx-swap-oob="innerHTML:#three">refreshed</div>',
+        )
+        self.assertNotIn("DJ-HX-Action-Error", response)
+
+    def test_per_action_errors(self):
+        response = self._dispatch(
+            [
+                {"action": "save", "target": "#one"},
+                {"action": "fail", "target": "#two"},
+                {"action": "missing", "target": "#three"},
+                {"action": "refresh", "target": "#four"},
+            ]
+        )
+
+        self.assertEqual(response.content.decode(), '<div hx-swap-oob="innerHTML:#four">refreshed</div>')
+        errors = json.loads(response["DJ-HX-Action-Error"])
+        self.assertEqual(
+            [(error["index"], error["action"], error["status_code"]) for error in errors],
+            [(0, "save", 403), (1, "fail", 503), (2, None, 403)],
+        )
+        self.assertEqual(errors[1]["message"], "Try again later")
+        self.assertEqual(
+            set(errors[0]),
+            {"message", "status_code", "retry_after", "show_details", "max_retries", "action", "index"},
+        )
+
+    def test_post_params(self):
+        response = self._dispatch([{"action": "save", "target": "#one"}], method="post")
+
+        self.assertEqual(response.content.decode(), '<div hx-swap-oob="innerHTML:#one">saved by ActionView</div>')
+
+    def test_invalid_batches(self):
+        for batch in [
+            "not json",
+            [],
+            {"action": "greet", "target": "#one"},
+            ["greet"],
+            [{"action": "greet"}],
+            [{"action": "greet", "target": "#one", "swap": "outerHTML"}],
+            [{"action": "greet", "target": "#one", "params": ["name"]}],
+            [{"action": "greet", "target": "#one"}] * (ActionView.max_htmx_batch_size + 1),
+        ]:
+            with self.subTest(batch=batch):
+                self.assertEqual(self._dispatch(batch).status_code, 400)
+
+
+def timed_view(request):
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1")
+        cursor.execute("SELECT 2")
+    cache = caches["locmem"]
+    cache.set("timing-hit", 1)
+    cache.get("timing-hit")
+    cache.get("timing-miss")
+    cache.get_many(["timing-hit", "timing-miss", "timing-miss-2"])
+    template = engines["django"].from_string("{% for i in items %}{{ i }}{% endfor %}")
+    return HttpResponse(template.render({"items": [1, 2]}))
+
+
+def streamed_view(request):
+    def content():
+        for number in range(3):
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT %s", [number])
+            yield str(number)
+
+    return StreamingHttpResponse(content())
+
+
+class RequestTimingMiddlewareTests(TestCase):
+    def setUp(self):
+        caches["locmem"].clear()
+        self.factory = RequestFactory()
+
+    def test_server_timing_and_log(self):
+        middleware = RequestTimingMiddleware(timed_view)
+        request = self.factory.get("/timed/", HTTP_DJ_HX_ACTION="refresh")
+
+        with capture_logs() as logs:
+            response = middleware(request)
+
+        self.assertEqual(response.content, b"12")
+        metrics = dict(metric.split(";", 1) for metric in response["Server-Timing"].split(", "))
+        self.assertEqual(set(metrics), {"app", "db", "cache", "tpl"})
+        self.assertIn('desc="2 queries"', metrics["db"])
+        self.assertEqual(metrics["cache"], 'desc="2 hits 3 misses"')
+
+        log = next(log for log in logs if log["event"] == "Request timing")
+        self.assertEqual(log["htmx_action"], "refresh")
+        self.assertEqual((log["db_queries"], log["cache_hits"], log["cache_misses"]), (2, 2, 3))
+        self.assertEqual(log["status"], 200)
+
+    def test_streaming_measured_until_sent(self):
+        middleware = RequestTimingMiddleware(streamed_view)
+
+        with capture_logs() as logs:
+            response = middleware(self.factory.get("/streamed/"))
+            # The queries run as the body is sent, after the headers
+            self.assertNotIn("Server-Timing", response)
+            self.assertEqual(logs, [])
+
+            self.assertEqual(b"".join(response.streaming_content), b"012")
+
+        log = next(log for log in logs if log["event"] == "Request timing")
+        self.assertTrue(log["streamed"])
+        self.assertEqual(log["db_queries"], 3)
+
+    @override_settings(REQUEST_TIMING_SAMPLE_RATE=0)
+    def test_unsampled_requests_pass_through(self):
+        middleware = RequestTimingMiddleware(timed_view)
+
+        with capture_logs() as logs:
+            response = middleware(self.factory.get("/timed/"))
+
+        self.assertNotIn("Server-Timing", response)
+        self.assertEqual(logs, [])
+        # The hooks are inert outside of a measured request
+        self.assertIsNone(caches["locmem"].get("timing-miss"))
+
+
+def read_view(request):
+    return HttpResponse(router.db_for_read(User))
+
+
+def write_view(request):
+    router.db_for_write(User)
+    return HttpResponse(router.db_for_read(User))
+
+
+@override_settings(
+    DB_REPLICAS=["replica_0", "replica_1"],
+    DB_REPLICA_MAX_LAG=5,
+    DB_REPLICA_HEALTH_CHECK_INTERVAL=60,
+    DB_REPLICA_PIN_SECONDS=10,
+)
+class ReplicaRoutingTests(SimpleTestCase):
+    def setUp(self):
+        replica_pool.reset()
+        self.factory = RequestFactory()
+        self.lag = {"replica_0": 0.0, "replica_1": 0.0}
+        patcher = patch("looplink.django_ext.replicas.replica_lag", side_effect=self.replica_lag)
+        self.replica_lag_mock = patcher.start()
+        self.addCleanup(patcher.stop)
+        # The replica aliases are not configured, there is nothing to close
+        patcher = patch("looplink.django_ext.replicas.connections")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def replica_lag(self, alias):
+        lag = self.lag[alias]
+        if isinstance(lag, Exception):
+            raise lag
+        return lag
+
+    def get(self, view, opt_in=True, **cookies):
+        view = replica_reads(view) if opt_in else view
+        def handler(request):
+            return middleware.process_view(request, view, (), {}) or view(request)
+
+        middleware = ReplicaRoutingMiddleware(handler)
+        request = self.factory.get("/")
+        request.COOKIES.update(cookies)
+        return middleware(request)
+
+    def test_reads_round_robin(self):
+        served = [self.get(read_view).content for _ in range(4)]
+        self.assertEqual(served, [b"replica_0", b"replica_1", b"replica_0", b"replica_1"])
+        # Health is checked once per interval
+        self.assertEqual(self.replica_lag_mock.call_count, 2)
+
+    def test_lagging_replica_is_skipped(self):
+        self.lag["replica_0"] = 30.0
+        with capture_logs() as logs:
+            served = {self.get(read_view).content for _ in range(4)}
+        self.assertEqual(served, {b"replica_1"})
+        self.assertEqual(logs[0]["event"], "Database replica lagging")
+
+    def test_falls_back_to_primary(self):
+        self.lag["replica_0"] = OSError("connection refused")
+        self.lag["replica_1"] = 30.0
+        self.assertEqual(self.get(read_view).content, b"default")
+
+        # And back once the replicas recover
+        self.lag = {"replica_0": 0.0, "replica_1": 0.0}
+        replica_pool.reset()
+        self.assertNotEqual(self.get(read_view).content, b"default")
+
+    def test_views_must_opt_in(self):
+        def other_view(request):
+            return read_view(request)
+
+        self.assertEqual(self.get(other_view, opt_in=False).content, b"default")
+
+    def test_write_pins_client_to_primary(self):
+        response = self.get(write_view)
+        self.assertEqual(response.content, b"default")
+        self.assertEqual(response.cookies[PIN_COOKIE]["max-age"], 10)
+        self.assertTrue(response.cookies[PIN_COOKIE]["httponly"])
+
+        self.assertEqual(self.get(read_view, **{PIN_COOKIE: "1"}).content, b"default")
+        self.assertNotIn(PIN_COOKIE, self.get(read_view).cookies)
+
+    def test_primary_reads_block(self):
+        def view(request):
+            with primary_reads():
+                inside = router.db_for_read(User)
+            return HttpResponse(f"{inside} {router.db_for_read(User)}")
+
+        response = self.get(view)
+        self.assertEqual(response.content, b"default replica_0")
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+
+    @override_settings(DB_REPLICAS=[])
+    def test_no_replicas(self):
+        response = self.get(write_view)
+        self.assertEqual(self.get(read_view).content, b"default")
+        self.assertNotIn(PIN_COOKIE, response.cookies)
@@ -46,6 +46,8 @@ INSTALLED_APPS = DJANGO_APPS + THIRD_PARTY_APPS + PROJECT_APPS + UI_APPS
 
 # ─── MIDDLEWARE ─────────────────────────────────────────────────────────────────
 MIDDLEWARE = [
+    "looplink.django_ext.middleware.timing.RequestTimingMiddleware",
+    "looplink.django_ext.middleware.replicas.ReplicaRoutingMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -57,6 +59,9 @@ MIDDLEWARE = [
     "looplink.django_ext.middleware.htmx.HtmxActionMiddleware",
 ]
 
+# Share of requests measured by RequestTimingMiddleware (0 to 1)
+REQUEST_TIMING_SAMPLE_RATE = env.float("REQUEST_TIMING_SAMPLE_RATE", default=1.0)
+
 # ─── URLS / WSGI ─────────────────────────────────────────────────────────────────
 ROOT_URLCONF = "looplink.project.urls"
 WSGI_APPLICATION = "looplink.project.wsgi.application"
@@ -93,9 +98,27 @@ DATABASES = {
         "PASSWORD": env("DJANGO_DATABASE_PASSWORD", default="secret123"),
         "HOST": env("DJANGO_DATABASE_HOST", default="localhost"),
         "PORT": env("DJANGO_DATABASE_PORT", default="5432"),
+        # Seconds a worker keeps its connection open between requests, 0 for a new one per request
+        "CONN_MAX_AGE": env.int("DJANGO_DATABASE_CONN_MAX_AGE", default=60),
+        # Ping a reused connection at the start of each request, so a dropped one is replaced
+        "CONN_HEALTH_CHECKS": True,
     }
 }
 
+# Per-process connection pool (psycopg_pool), e.g. for threaded gunicorn workers.
+# Connections go back to the pool at the end of each request instead of staying
+# with one thread, so CONN_MAX_AGE does not apply.
+if env.bool("DJANGO_DATABASE_POOL", default=False):
+    DATABASES["default"]["CONN_MAX_AGE"] = 0
+    DATABASES["default"]["OPTIONS"] = {
+        "pool": {
+            "min_size": env.int("DJANGO_DATABASE_POOL_MIN_SIZE", default=2),
+            "max_size": env.int("DJANGO_DATABASE_POOL_MAX_SIZE", default=10),
+            # Seconds a request waits for a free connection before failing
+            "timeout": env.float("DJANGO_DATABASE_POOL_TIMEOUT", default=10),
+        },
+    }
+
 # DATABASES = {
 #     'default': {
 #         'ENGINE': 'django.db.backends.postgresql',
@@ -107,7 +130,25 @@ DATABASES = {
 #     }
 # }
 
+# Read replicas of the default database, as comma separated host[:port]. Views
+# marked with replica_reads read from them (see looplink.django_ext.replicas).
 DB_REPLICAS = []
+for _index, _replica in enumerate(env.list("DJANGO_DATABASE_REPLICAS", default=[])):
+    _host, _, _port = _replica.partition(":")
+    DATABASES[f"replica_{_index}"] = {
+        **DATABASES["default"],
+        "HOST": _host,
+        "PORT": _port or DATABASES["default"]["PORT"],
+        "TEST": {"MIRROR": "default"},
+    }
+    DB_REPLICAS.append(f"replica_{_index}")
+
+DATABASE_ROUTERS = ["looplink.django_ext.replicas.ReplicaRouter"]
+# Replicas further behind the primary than this, in seconds, are skipped
+DB_REPLICA_MAX_LAG = env.float("DJANGO_DATABASE_REPLICA_MAX_LAG", default=5)
+DB_REPLICA_HEALTH_CHECK_INTERVAL = env.float("DJANGO_DATABASE_REPLICA_HEALTH_CHECK_INTERVAL", default=5)
+# How long a client that wrote keeps reading from the primary
+DB_REPLICA_PIN_SECONDS = env.int("DJANGO_DATABASE_REPLICA_PIN_SECONDS", default=10)
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
@@ -201,6 +242,27 @@ LOGGING = {
     },
 }
 
+# ─── STICKERS ──────────────────────────────────────────────────────────────────
+# JSON file of promotion rules (see stickers.rules); the built-in rules apply when unset.
+STICKER_RULES_FILE = env.str("STICKER_RULES_FILE", default=None)
+# How often, in seconds, to check the rules file for changes
+STICKER_RULES_RELOAD_INTERVAL = env.float("STICKER_RULES_RELOAD_INTERVAL", default=5)
+# Cache alias and lifetime, in seconds, for recent transaction results used to answer replays
+STICKER_TRANSACTION_CACHE = env.str("STICKER_TRANSACTION_CACHE", default="default")
+STICKER_TRANSACTION_CACHE_TIMEOUT = env.int("STICKER_TRANSACTION_CACHE_TIMEOUT", default=24 * 60 * 60)
+# Cache alias and lifetime, in seconds, of shopper summaries (see ShopperSummaryService)
+STICKER_SUMMARY_CACHE = env.str("STICKER_SUMMARY_CACHE", default="default")
+STICKER_SUMMARY_CACHE_TIMEOUT = env.int("STICKER_SUMMARY_CACHE_TIMEOUT", default=5 * 60)
+# Per-process cache in front of it; other processes see invalidations up to this many seconds late, 0 disables it
+STICKER_SUMMARY_LOCAL_CACHE = env.str("STICKER_SUMMARY_LOCAL_CACHE", default="locmem")
+STICKER_SUMMARY_LOCAL_TIMEOUT = env.float("STICKER_SUMMARY_LOCAL_TIMEOUT", default=2)
+# Queue transactions for `manage.py process_ingest_queue` instead of processing them in the request
+STICKER_INGEST_ASYNC = env.bool("STICKER_INGEST_ASYNC", default=False)
+
+# Validate well-formed transaction payloads without DRF's nested serializer,
+# which only handles the rest (see stickers.serializers.fast_validate_transaction)
+STICKER_FAST_VALIDATION = env.bool("STICKER_FAST_VALIDATION", default=True)
+
 # ─── DRF ────────────────────────────────────────────────────────────────────────
 REST_FRAMEWORK = {
     "DEFAULT_PERMISSION_CLASSES": [
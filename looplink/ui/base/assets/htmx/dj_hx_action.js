@@ -12,6 +12,15 @@
  *
  * 4) Reference the decorated method in the `dj-hx-action` attribute alongside
  *    `hx-get`, `hx-post`, or any equivalent HTMX attribute.
+ *
+ * To run several actions in one request, list them in a `dj-hx-actions`
+ * attribute instead. Each fragment is swapped into its own target out of band
+ * (see `DjangoHtmxActionMixin._dispatch_batch`):
+ *
+ *    <div hx-get="{{ url_to_view }}" hx-trigger="load" hx-swap="none"
+ *         dj-hx-actions='[{"action": "totals", "target": "#totals"},
+ *                         {"action": "recent", "target": "#recent", "params": {"limit": 10}}]'>
+ *    </div>
  */
 document.body.addEventListener('htmx:configRequest', (evt) => {
     // Require that the dj-hx-action attribute is present
@@ -25,5 +34,12 @@ document.body.addEventListener('htmx:configRequest', (evt) => {
         const url = new URL(evt.detail.path, window.location.origin);
         url.searchParams.set('_dj-hx-action', action);
         evt.detail.path = url.pathname + url.search;
+    } else if (evt.detail.elt.hasAttribute('dj-hx-actions')) {
+        // a JSON list of actions, validated by the `DjangoHtmxActionMixin`
+        evt.detail.headers['DJ-HX-Actions'] = evt.detail.elt.getAttribute('dj-hx-actions');
+
+        const url = new URL(evt.detail.path, window.location.origin);
+        url.searchParams.set('_dj-hx-action', 'batch');
+        evt.detail.path = url.pathname + url.search;
     }
 });
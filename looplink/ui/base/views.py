@@ -20,7 +20,7 @@ class HtmxExampleView(DjangoHtmxActionMixin, TemplateView):
     urlname = "base_htmx_example"
     container_id = "main-htmx-content"
 
-    @dj_hx_action("get")
+    @dj_hx_action("get", cache_timeout=5 * 60)
     def initial_state(self, request, *args, **kwargs):
         return self.render_htmx_partial_response(
             request,
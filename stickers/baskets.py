@@ -0,0 +1,118 @@
+"""
+Compact value types for validated basket items.
+
+Transaction validation (``TransactionSerializer`` and its fast path) turns
+the ``items`` of a payload into a ``Basket`` of ``BasketItem``s once, and
+scoring and persistence read them from there. A ``BasketItem`` has slots
+instead of a ``__dict__`` and keeps its price as integer cents, so it costs
+a fraction of the memory of an item dict holding a ``Decimal``, and the
+scoring loop reads plain attributes and does integer arithmetic.
+
+Both support enough of the mapping protocol (``item["sku"]``,
+``item.get("sku")``) for code written against item dicts.
+"""
+
+from decimal import Decimal
+
+
+class BasketItem:
+    __slots__ = ("sku", "name", "quantity", "unit_price_cents", "category")
+
+    def __init__(self, sku, name, quantity, unit_price_cents, category):
+        self.sku = sku
+        self.name = name
+        self.quantity = quantity
+        self.unit_price_cents = unit_price_cents
+        self.category = category
+
+    @classmethod
+    def from_dict(cls, item):
+        """
+        :param item: an item dict as validated by ``TransactionItemSerializer``.
+            ``sku``, ``name`` and ``category`` may be missing.
+
+        :raises ValueError: if the unit price is not a whole number of cents.
+        """
+        unit_price_cents = to_cents(item["unit_price"])
+        if unit_price_cents is None:
+            raise ValueError("Unit price must be a whole number of cents")
+        return cls(item.get("sku"), item.get("name"), item["quantity"], unit_price_cents, item.get("category"))
+
+    @property
+    def unit_price(self):
+        return Decimal(self.unit_price_cents).scaleb(-2)
+
+    def as_dict(self):
+        return {
+            "sku": self.sku,
+            "name": self.name,
+            "quantity": self.quantity,
+            "unit_price": self.unit_price,
+            "category": self.category,
+        }
+
+    def __getitem__(self, key):
+        if key not in _ITEM_KEYS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def get(self, key, default=None):
+        if key not in _ITEM_KEYS:
+            return default
+        return getattr(self, key)
+
+    def __eq__(self, other):
+        if not isinstance(other, BasketItem):
+            return NotImplemented
+        return all(getattr(self, name) == getattr(other, name) for name in self.__slots__)
+
+    __hash__ = None
+
+    def __repr__(self):
+        fields = ", ".join(f"{name}={getattr(self, name)!r}" for name in self.__slots__)
+        return f"BasketItem({fields})"
+
+
+_ITEM_KEYS = frozenset(("sku", "name", "quantity", "unit_price", "category"))
+
+
+class Basket(tuple):
+    """An immutable sequence of ``BasketItem``."""
+
+    __slots__ = ()
+
+    @classmethod
+    def from_items(cls, items):
+        """
+        Returns ``items`` as a Basket, converting item dicts with
+        ``BasketItem.from_dict``. A Basket is returned as is.
+        """
+        if type(items) is cls:
+            return items
+        return cls(item if type(item) is BasketItem else BasketItem.from_dict(item) for item in items)
+
+    def as_dicts(self):
+        return [item.as_dict() for item in self]
+
+    def __repr__(self):
+        return f"Basket({list(self)!r})"
+
+
+def to_cents(value):
+    """
+    Converts a price to integer cents, or returns None if it is not a whole
+    number of cents.
+    """
+    if type(value) is int:
+        return value * 100
+
+    if not isinstance(value, Decimal):
+        value = Decimal(str(value))
+
+    if not value.is_finite():
+        return None
+
+    cents = value.scaleb(2)
+    if cents != cents.to_integral_value():
+        return None
+    return int(cents)
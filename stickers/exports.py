@@ -0,0 +1,195 @@
+"""
+Streaming exports of sticker data for analytics, as CSV or NDJSON.
+
+Rows are read with a server-side cursor as ``values_list`` tuples and
+written out a chunk at a time, so an export runs in constant memory however
+many rows it covers. Served by ``ExportView`` and ``manage.py export_stickers``.
+"""
+
+import csv
+import io
+import zlib
+from dataclasses import dataclass
+from datetime import UTC, datetime
+from decimal import Decimal
+
+from rest_framework.utils.encoders import JSONEncoder
+
+from .models import StickerLedger, Transaction, TransactionItem
+
+EXPORT_CHUNK_SIZE = 2000
+FORMATS = ("csv", "ndjson")
+CONTENT_TYPES = {"csv": "text/csv; charset=utf-8", "ndjson": "application/x-ndjson"}
+
+
+@dataclass(frozen=True)
+class Export:
+    model: type
+    # Output column -> field path for values_list
+    fields: dict
+    # Field paths of the date range and store filters
+    date_field: str
+    store_field: str
+    datetime_columns: tuple = ("created_at",)
+
+
+EXPORTS = {
+    "transactions": Export(
+        model=Transaction,
+        fields={
+            "transaction_id": "id",
+            "shopper_id": "shopper_id",
+            "store_id": "store_id",
+            "timestamp": "timestamp",
+            "total_amount": "total_amount",
+            "stickers_awarded": "stickers_awarded",
+            "created_at": "created_at",
+        },
+        date_field="timestamp",
+        store_field="store_id",
+        datetime_columns=("timestamp", "created_at"),
+    ),
+    "items": Export(
+        model=TransactionItem,
+        fields={
+            "transaction_id": "transaction_id",
+            "shopper_id": "transaction__shopper_id",
+            "store_id": "transaction__store_id",
+            "timestamp": "transaction__timestamp",
+            "sku": "sku",
+            "name": "name",
+            "quantity": "quantity",
+            "unit_price": "unit_price",
+            "category": "category",
+        },
+        date_field="transaction__timestamp",
+        store_field="transaction__store_id",
+        datetime_columns=("timestamp",),
+    ),
+    # Redemptions have no transaction, so filtering by store leaves them out
+    "ledger": Export(
+        model=StickerLedger,
+        fields={
+            "entry_id": "id",
+            "shopper_id": "shopper_id",
+            "transaction_id": "transaction_id",
+            "store_id": "transaction__store_id",
+            "type": "type",
+            "delta": "delta",
+            "created_at": "created_at",
+        },
+        date_field="created_at",
+        store_field="transaction__store_id",
+    ),
+}
+
+
+class _ExportEncoder(JSONEncoder):
+    # Amounts stay exact rather than becoming floats
+    def default(self, obj):
+        if isinstance(obj, Decimal):
+            return str(obj)
+        return super().default(obj)
+
+
+def parse_date(value):
+    """
+    Parses a YYYY-MM-DD date into midnight UTC.
+
+    :raises ValueError: if ``value`` is not a date in that format
+    """
+    return datetime.strptime(value, "%Y-%m-%d").replace(tzinfo=UTC)
+
+
+def export_queryset(name, start=None, end=None, store_id=None):
+    """
+    Returns the ``values_list`` queryset of the ``name`` export, covering
+    ``start`` (inclusive) to ``end`` (exclusive), and one store if given.
+
+    :raises KeyError: if there is no export called ``name``
+    """
+    export = EXPORTS[name]
+    queryset = export.model.objects.values_list(*export.fields.values()).order_by()
+    if start is not None:
+        queryset = queryset.filter(**{f"{export.date_field}__gte": start})
+    if end is not None:
+        queryset = queryset.filter(**{f"{export.date_field}__lt": end})
+    if store_id:
+        queryset = queryset.filter(**{export.store_field: store_id})
+    return queryset
+
+
+def stream_export(name, output_format="csv", start=None, end=None, store_id=None, using=None, compress=False):
+    """
+    Returns an iterator of the ``name`` export in ``output_format``, as
+    bytes. Rows are unordered. ``compress`` gzips the output.
+
+    The database is chosen here, with ``using`` or else the router, rather
+    than when the iterator is consumed, e.g. while a response streams.
+
+    :raises KeyError: if there is no export called ``name``
+    :raises ValueError: if ``output_format`` is not one of ``FORMATS``
+    """
+    if output_format not in FORMATS:
+        raise ValueError(f"format must be one of {', '.join(FORMATS)}")
+
+    queryset = export_queryset(name, start=start, end=end, store_id=store_id)
+    queryset = queryset.using(using or queryset.db)
+    export = EXPORTS[name]
+    chunks = _csv_chunks(queryset, export) if output_format == "csv" else _ndjson_chunks(queryset, export)
+    return _gzip(chunks) if compress else chunks
+
+
+def _rows(queryset):
+    chunk = []
+    for row in queryset.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        chunk.append(row)
+        if len(chunk) == EXPORT_CHUNK_SIZE:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _csv_chunks(queryset, export):
+    columns = list(export.fields)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    yield buffer.getvalue().encode()
+
+    # Same timestamp format as the NDJSON output and the API
+    datetime_indexes = [columns.index(column) for column in export.datetime_columns]
+    for rows in _rows(queryset):
+        buffer.seek(0)
+        buffer.truncate()
+        for row in rows:
+            row = list(row)
+            for index in datetime_indexes:
+                if row[index] is not None:
+                    row[index] = _isoformat(row[index])
+            writer.writerow(row)
+        yield buffer.getvalue().encode()
+
+
+def _ndjson_chunks(queryset, export):
+    columns = list(export.fields)
+    encode = _ExportEncoder(ensure_ascii=False, separators=(",", ":")).encode
+    for rows in _rows(queryset):
+        yield "".join(encode(dict(zip(columns, row))) + "\n" for row in rows).encode()
+
+
+def _gzip(chunks):
+    compressor = zlib.compressobj(wbits=zlib.MAX_WBITS | 16)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def _isoformat(value):
+    representation = value.isoformat()
+    if representation.endswith("+00:00"):
+        representation = representation[:-6] + "Z"
+    return representation
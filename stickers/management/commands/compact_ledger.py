@@ -0,0 +1,37 @@
+from datetime import UTC, datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from stickers.partitions import add_months, month_start
+from stickers.services import LedgerService
+
+
+class Command(BaseCommand):
+    help = (
+        "Fold old sticker ledger entries into per-shopper snapshots, so that "
+        "balances no longer need them and their partitions can be detached."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--before",
+            type=date_argument,
+            help="Fold entries created before this date, YYYY-MM-DD (default: start of last month).",
+        )
+
+    def handle(self, *args, before=None, **options):
+        if before is None:
+            before = add_months(month_start(datetime.now(UTC)), -1)
+
+        try:
+            folded = LedgerService.compact(before)
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Folded entries before {before:%Y-%m-%d} into {folded} shopper snapshot(s)"
+        ))
+
+
+def date_argument(value):
+    return datetime.strptime(value, "%Y-%m-%d").replace(tzinfo=UTC)
@@ -0,0 +1,57 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+
+from looplink.django_ext.replicas import replica_pool
+from stickers.exports import EXPORTS, FORMATS, stream_export
+
+from .compact_ledger import date_argument
+
+
+class Command(BaseCommand):
+    help = (
+        "Export transactions, transaction items or ledger entries as CSV or "
+        "NDJSON, in constant memory. Reads from a replica when one is healthy."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("dataset", choices=list(EXPORTS))
+        parser.add_argument("--start", type=date_argument, help="Export rows from this date, YYYY-MM-DD.")
+        parser.add_argument("--end", type=date_argument, help="Export rows before this date, YYYY-MM-DD.")
+        parser.add_argument("--store", dest="store_id", help="Only export this store.")
+        parser.add_argument("--format", dest="output_format", choices=FORMATS, default="csv")
+        parser.add_argument("--gzip", action="store_true", help="Compress the output with gzip.")
+        parser.add_argument("--output", help="Write to this file instead of stdout.")
+        parser.add_argument(
+            "--database",
+            help="Database alias to read from (default: a healthy replica, else the primary).",
+        )
+
+    def handle(self, *args, dataset, start=None, end=None, store_id=None, output_format="csv", **options):
+        if start and end and start >= end:
+            raise CommandError("--start must be before --end")
+
+        chunks = stream_export(
+            dataset,
+            output_format,
+            start=start,
+            end=end,
+            store_id=store_id,
+            using=options["database"] or replica_pool.choose() or DEFAULT_DB_ALIAS,
+            compress=options["gzip"],
+        )
+
+        output = options["output"]
+        if output is None:
+            for chunk in chunks:
+                sys.stdout.buffer.write(chunk)
+            sys.stdout.buffer.flush()
+            return
+
+        size = 0
+        with open(output, "wb") as f:
+            for chunk in chunks:
+                f.write(chunk)
+                size += len(chunk)
+        self.stderr.write(self.style.SUCCESS(f"Wrote {size} bytes to {output}"))
@@ -0,0 +1,70 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from stickers.partitions import PartitionError, create_partitions, detach_partitions, get_partitions, is_partitioned
+
+from .compact_ledger import date_argument
+
+
+class Command(BaseCommand):
+    help = (
+        "Create the sticker ledger's upcoming monthly partitions. Run it at "
+        "least monthly, e.g. from cron. Optionally detach old partitions "
+        "whose entries are folded into snapshots (see compact_ledger)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--months-ahead",
+            type=int,
+            default=3,
+            help="Create partitions up to this many months ahead (default: 3).",
+        )
+        parser.add_argument(
+            "--detach-before",
+            type=date_argument,
+            help="Detach the partitions ending on or before this date, YYYY-MM-DD.",
+        )
+        parser.add_argument(
+            "--list",
+            action="store_true",
+            help="List the partitions and their approximate row counts, and change nothing.",
+        )
+
+    def handle(self, *args, months_ahead=3, detach_before=None, list=False, **options):
+        if connection.vendor != "postgresql" or not is_partitioned():
+            raise CommandError("The sticker ledger is not a partitioned Postgres table")
+
+        if list:
+            self._list()
+            return
+
+        for name in create_partitions(months_ahead):
+            self.stdout.write(f"Created {name}")
+
+        if detach_before is not None:
+            try:
+                detached = detach_partitions(detach_before)
+            except PartitionError as e:
+                raise CommandError(str(e))
+            for name in detached:
+                self.stdout.write(f"Detached {name}, archive it (e.g. pg_dump -t {name}) and drop it")
+
+        self.stdout.write(self.style.SUCCESS("Ledger partitions are up to date"))
+
+    def _list(self):
+        partitions = get_partitions()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT relname, reltuples::bigint FROM pg_class WHERE relname = ANY(%s)",
+                [[partition.name for partition in partitions]],
+            )
+            rows = dict(cursor.fetchall())
+
+        for partition in partitions:
+            if partition.is_default:
+                bounds = "DEFAULT"
+            else:
+                start = f"{partition.start:%Y-%m-%d}" if partition.start else "MINVALUE"
+                bounds = f"{start} to {partition.end:%Y-%m-%d}"
+            self.stdout.write(f"{partition.name:<28} {bounds:<26} ~{max(rows.get(partition.name, 0), 0)} rows")
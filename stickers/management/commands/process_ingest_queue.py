@@ -0,0 +1,51 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from stickers.services import IngestQueueService
+
+
+class Command(BaseCommand):
+    help = (
+        "Process transactions queued by the async ingest mode "
+        "(STICKER_INGEST_ASYNC). Run as many workers as needed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="Transactions to claim per batch (default: 500).",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=1.0,
+            help="Seconds to wait when the queue is empty (default: 1).",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Exit once the queue is drained instead of waiting for more.",
+        )
+
+    def handle(self, *args, batch_size=500, interval=1.0, once=False, **options):
+        totals = {"created": 0, "duplicate": 0, "error": 0}
+
+        while True:
+            summary = IngestQueueService.process_batch(batch_size)
+            for key, count in summary.items():
+                totals[key] += count
+
+            if not any(summary.values()):
+                if once:
+                    break
+                time.sleep(interval)
+                # Long-running workers must not hold on to a dead connection
+                close_old_connections()
+
+        self.stdout.write(self.style.SUCCESS(
+            "Processed queued transactions: {created} created, {duplicate} duplicate, {error} failed".format(**totals)
+        ))
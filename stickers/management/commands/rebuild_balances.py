@@ -0,0 +1,70 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction as db_transaction
+from django.db.models import F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+from stickers.models import Shopper
+from stickers.services import LedgerService, ShopperSummaryService
+
+
+class Command(BaseCommand):
+    help = (
+        "Verify Shopper.balance against the sticker ledger and rebuild any "
+        "balances that have drifted."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--verify",
+            action="store_true",
+            help="Only report mismatched balances; exit with an error if any are found.",
+        )
+        parser.add_argument(
+            "--shopper",
+            action="append",
+            dest="shopper_ids",
+            help="Limit to this shopper id (may be repeated).",
+        )
+
+    def handle(self, *args, verify=False, shopper_ids=None, **options):
+        # Entries folded into a snapshot count through the snapshot balance
+        ledger_total = (
+            LedgerService.unfolded_entries()
+            .filter(shopper_id=OuterRef("id"))
+            .order_by()
+            .values("shopper_id")
+            .annotate(total=Sum("delta"))
+            .values("total")
+        )
+        shoppers = Shopper.objects.annotate(
+            ledger_total=Coalesce("ledger_snapshot__balance", 0) + Coalesce(Subquery(ledger_total), 0)
+        )
+        if shopper_ids:
+            shoppers = shoppers.filter(id__in=shopper_ids)
+
+        mismatched = list(
+            shoppers
+            .exclude(balance=F("ledger_total"))
+            .values_list("id", "balance", "ledger_total")
+        )
+
+        for shopper_id, balance, total in mismatched:
+            self.stdout.write(f"{shopper_id}: balance {balance}, ledger {total}")
+
+        if verify:
+            if mismatched:
+                raise CommandError(f"{len(mismatched)} shopper balance(s) do not match the ledger")
+            self.stdout.write(self.style.SUCCESS("All shopper balances match the ledger"))
+            return
+
+        for shopper_id, _, _ in mismatched:
+            with db_transaction.atomic():
+                # Every ledger write updates the shopper row in the same
+                # transaction, so once we hold the row lock no ledger write
+                # for this shopper is in flight and the sum is exact.
+                shopper = Shopper.objects.select_for_update().get(id=shopper_id)
+                shopper.balance = LedgerService.ledger_balance(shopper_id)
+                shopper.save(update_fields=["balance"])
+                ShopperSummaryService.invalidate([shopper_id])
+
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {len(mismatched)} shopper balance(s)"))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from stickers.services import StatsRollupService
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the StatsView rollups (store_stats, daily_store_stats) "
+        "from the transactions table."
+    )
+
+    def handle(self, *args, **options):
+        StatsRollupService.rebuild()
+        self.stdout.write(self.style.SUCCESS("Rebuilt stats rollups"))
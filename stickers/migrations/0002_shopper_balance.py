@@ -0,0 +1,33 @@
+# Generated by Django 5.2.8 on 2026-10-17 20:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stickers', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='shopper',
+            name='balance',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='transaction',
+            name='timestamp',
+            field=models.DateTimeField(auto_now_add=True),
+        ),
+        migrations.RunSQL(
+            sql="""
+                UPDATE shoppers
+                SET balance = COALESCE(
+                    (SELECT SUM(delta) FROM sticker_ledger WHERE sticker_ledger.shopper_id = shoppers.id),
+                    0
+                )
+            """,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
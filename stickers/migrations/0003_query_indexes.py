@@ -0,0 +1,62 @@
+# Generated by Django 5.2.8 on 2026-10-17 20:37
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stickers', '0002_shopper_balance'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='stickerledger',
+            index=models.Index(fields=['shopper', 'created_at'], include=('delta',), name='ledger_shopper_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='stickerledger',
+            index=models.Index(fields=['type'], include=('delta',), name='ledger_type_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['shopper', '-timestamp'], name='transactions_shopper_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['store_id'], include=('stickers_awarded',), name='transactions_store_idx'),
+        ),
+        # Drop the plain foreign key indexes only once the composite indexes
+        # that replace them exist.
+        migrations.AlterField(
+            model_name='stickerledger',
+            name='shopper',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='ledger_entries', to='stickers.shopper'),
+        ),
+        migrations.AlterField(
+            model_name='transaction',
+            name='shopper',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='transactions', to='stickers.shopper'),
+        ),
+        migrations.AddConstraint(
+            model_name='stickerledger',
+            constraint=models.CheckConstraint(condition=models.Q(models.Q(('delta__gte', 0), ('type', 'EARN')), models.Q(('delta__lte', 0), ('type', 'REDEEM')), _connector='OR'), name='ledger_delta_sign_matches_type'),
+        ),
+        migrations.AddConstraint(
+            model_name='transaction',
+            constraint=models.CheckConstraint(condition=models.Q(('stickers_awarded__gte', 0)), name='transactions_stickers_awarded_gte_0'),
+        ),
+        migrations.AddConstraint(
+            model_name='transaction',
+            constraint=models.CheckConstraint(condition=models.Q(('total_amount__gte', 0)), name='transactions_total_amount_gte_0'),
+        ),
+        migrations.AddConstraint(
+            model_name='transactionitem',
+            constraint=models.CheckConstraint(condition=models.Q(('quantity__gte', 0)), name='transaction_items_quantity_gte_0'),
+        ),
+        migrations.AddConstraint(
+            model_name='transactionitem',
+            constraint=models.CheckConstraint(condition=models.Q(('unit_price__gte', 0)), name='transaction_items_unit_price_gte_0'),
+        ),
+    ]
@@ -0,0 +1,65 @@
+# Generated by Django 5.2.8 on 2026-10-17 20:39
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+
+
+def backfill_rollups(apps, schema_editor):
+    Transaction = apps.get_model("stickers", "Transaction")
+    StoreStats = apps.get_model("stickers", "StoreStats")
+    DailyStoreStats = apps.get_model("stickers", "DailyStoreStats")
+
+    counters = {"transaction_count": Count("id"), "stickers_awarded": Sum("stickers_awarded")}
+
+    StoreStats.objects.bulk_create(
+        [StoreStats(**row) for row in Transaction.objects.order_by().values("store_id").annotate(**counters)],
+        batch_size=1000,
+    )
+    DailyStoreStats.objects.bulk_create(
+        [
+            DailyStoreStats(**row)
+            for row in Transaction.objects.annotate(day=TruncDate("timestamp"))
+            .order_by()
+            .values("store_id", "day")
+            .annotate(**counters)
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stickers', '0003_query_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StoreStats',
+            fields=[
+                ('store_id', models.TextField(primary_key=True, serialize=False)),
+                ('transaction_count', models.BigIntegerField(default=0)),
+                ('stickers_awarded', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'db_table': 'store_stats',
+            },
+        ),
+        migrations.CreateModel(
+            name='DailyStoreStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('store_id', models.TextField()),
+                ('day', models.DateField()),
+                ('transaction_count', models.BigIntegerField(default=0)),
+                ('stickers_awarded', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'db_table': 'daily_store_stats',
+                'indexes': [models.Index(fields=['day'], name='daily_store_stats_day_idx')],
+                'constraints': [models.UniqueConstraint(fields=('store_id', 'day'), name='daily_store_stats_store_day_uniq')],
+            },
+        ),
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.8 on 2026-10-17 20:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stickers', '0004_stats_rollups'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['shopper', '-timestamp', '-id'], name='transactions_shopper_hist_idx'),
+        ),
+        migrations.RemoveIndex(
+            model_name='transaction',
+            name='transactions_shopper_ts_idx',
+        ),
+    ]
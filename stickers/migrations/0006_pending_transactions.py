@@ -0,0 +1,27 @@
+# Generated by Django 5.2.8 on 2026-10-17 20:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stickers', '0005_shopper_history_keyset_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PendingTransaction',
+            fields=[
+                ('id', models.TextField(primary_key=True, serialize=False)),
+                ('payload', models.JSONField()),
+                ('status', models.CharField(choices=[('PENDING', 'Pending'), ('FAILED', 'Failed')], default='PENDING', max_length=10)),
+                ('errors', models.JSONField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'db_table': 'pending_transactions',
+                'indexes': [models.Index(condition=models.Q(('status', 'PENDING')), fields=['created_at'], name='pending_tx_queue_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,184 @@
+# Generated by Django 5.2.8 on 2026-10-17 21:12
+
+from datetime import datetime, timezone
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+TABLE = "sticker_ledger"
+INITIAL = "sticker_ledger_initial"
+DEFAULT = "sticker_ledger_default"
+SEQUENCE = "sticker_ledger_id_seq"
+MONTHS_AHEAD = 3
+
+
+def _add_months(value, months):
+    month = value.month - 1 + months
+    return value.replace(year=value.year + month // 12, month=month % 12 + 1)
+
+
+def _name_partition_indexes(cursor, partition):
+    # As stickers.partitions.name_partition_indexes
+    suffix = partition.removeprefix(f"{TABLE}_")
+    cursor.execute(
+        """
+        SELECT child.relname, parent.relname
+        FROM pg_index
+        JOIN pg_inherits ON pg_inherits.inhrelid = pg_index.indexrelid
+        JOIN pg_class child ON child.oid = pg_index.indexrelid
+        JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+        WHERE pg_index.indrelid = %s::regclass
+        """,
+        [partition],
+    )
+    for index, parent in cursor.fetchall():
+        name = f"{parent[:62 - len(suffix)]}_{suffix}"
+        if index != name:
+            cursor.execute(f'ALTER INDEX "{index}" RENAME TO "{name}"')
+
+
+def partition_ledger(apps, schema_editor):
+    """
+    Turns sticker_ledger into a table range partitioned by month on
+    created_at. The existing table becomes the partition for everything
+    before the first monthly partition, so no rows are copied.
+    """
+    if schema_editor.connection.vendor != "postgresql":
+        return
+
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT pg_get_serial_sequence(%s, 'id')", [TABLE])
+        (sequence,) = cursor.fetchone()
+        cursor.execute(f"SELECT COALESCE(MAX(id), 0) FROM {TABLE}")
+        (max_id,) = cursor.fetchone()
+        next_id = max_id + 1
+        if sequence:
+            cursor.execute(f"SELECT last_value, is_called FROM {sequence}")
+            last_value, is_called = cursor.fetchone()
+            next_id = max(next_id, last_value + 1 if is_called else last_value)
+
+        # Index and constraint definitions move to the partitioned table
+        cursor.execute(
+            """
+            SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint
+            WHERE conrelid = %s::regclass AND contype IN ('c', 'f') ORDER BY conname
+            """,
+            [TABLE],
+        )
+        constraints = cursor.fetchall()
+        cursor.execute(
+            """
+            SELECT indexrelid::regclass::text, pg_get_indexdef(indexrelid) FROM pg_index
+            WHERE indrelid = %s::regclass AND NOT indisprimary ORDER BY 1
+            """,
+            [TABLE],
+        )
+        indexes = cursor.fetchall()
+
+        cursor.execute(f"ALTER TABLE {TABLE} RENAME TO {INITIAL}")
+        cursor.execute(f"ALTER TABLE {INITIAL} DROP CONSTRAINT {TABLE}_pkey")
+        cursor.execute(
+            "SELECT attidentity FROM pg_attribute WHERE attrelid = %s::regclass AND attname = 'id'", [INITIAL]
+        )
+        if cursor.fetchone()[0]:
+            cursor.execute(f"ALTER TABLE {INITIAL} ALTER COLUMN id DROP IDENTITY")
+        else:
+            cursor.execute(f"ALTER TABLE {INITIAL} ALTER COLUMN id DROP DEFAULT")
+            if sequence:
+                cursor.execute(f"DROP SEQUENCE {sequence}")
+        for name, _ in indexes:
+            cursor.execute(f"ALTER INDEX {name} RENAME TO {name[:50]}_tmp")
+
+        cursor.execute(f"CREATE SEQUENCE {SEQUENCE} START WITH {next_id}")
+        cursor.execute(f"CREATE TABLE {TABLE} (LIKE {INITIAL}) PARTITION BY RANGE (created_at)")
+        cursor.execute(f"ALTER TABLE {TABLE} ALTER COLUMN id SET DEFAULT nextval('{SEQUENCE}')")
+        cursor.execute(f"ALTER SEQUENCE {SEQUENCE} OWNED BY {TABLE}.id")
+        cursor.execute(f"ALTER TABLE {TABLE} ADD CONSTRAINT {TABLE}_pkey PRIMARY KEY (id, created_at)")
+        for name, definition in constraints:
+            cursor.execute(f"ALTER TABLE {TABLE} ADD CONSTRAINT {name} {definition}")
+        for name, definition in indexes:
+            cursor.execute(definition)
+
+        # The existing rows must all fall before the first monthly partition
+        first_month = datetime.now(timezone.utc).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+        cursor.execute(f"SELECT MAX(created_at) FROM {INITIAL}")
+        (latest,) = cursor.fetchone()
+        if latest is not None and latest >= first_month:
+            first_month = _add_months(latest.replace(day=1, hour=0, minute=0, second=0, microsecond=0), 1)
+
+        cursor.execute(
+            f"ALTER TABLE {TABLE} ATTACH PARTITION {INITIAL} FOR VALUES FROM (MINVALUE) TO (%s)", [first_month]
+        )
+        partitions = [INITIAL]
+        for month in range(MONTHS_AHEAD + 1):
+            start = _add_months(first_month, month)
+            partitions.append(f"{TABLE}_p{start:%Y_%m}")
+            cursor.execute(
+                f"CREATE TABLE {partitions[-1]} PARTITION OF {TABLE} FOR VALUES FROM (%s) TO (%s)",
+                [start, _add_months(start, 1)],
+            )
+        cursor.execute(f"CREATE TABLE {DEFAULT} PARTITION OF {TABLE} DEFAULT")
+        partitions.append(DEFAULT)
+
+        for partition in partitions:
+            _name_partition_indexes(cursor, partition)
+
+
+def unpartition_ledger(apps, schema_editor):
+    """Copies the ledger back into a plain table."""
+    if schema_editor.connection.vendor != "postgresql":
+        return
+
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint
+            WHERE conrelid = %s::regclass AND contype IN ('c', 'f') ORDER BY conname
+            """,
+            [TABLE],
+        )
+        constraints = cursor.fetchall()
+        cursor.execute(
+            """
+            SELECT indexrelid::regclass::text, pg_get_indexdef(indexrelid) FROM pg_index
+            WHERE indrelid = %s::regclass AND NOT indisprimary ORDER BY 1
+            """,
+            [TABLE],
+        )
+        indexes = cursor.fetchall()
+        cursor.execute(f"SELECT COALESCE(MAX(id), 0) + 1 FROM {TABLE}")
+        (next_id,) = cursor.fetchone()
+
+        cursor.execute(f"CREATE TABLE {TABLE}_plain (LIKE {TABLE})")
+        cursor.execute(f"INSERT INTO {TABLE}_plain SELECT * FROM {TABLE}")
+        cursor.execute(f"DROP TABLE {TABLE}")
+        cursor.execute(f"ALTER TABLE {TABLE}_plain RENAME TO {TABLE}")
+        cursor.execute(f"ALTER TABLE {TABLE} ADD CONSTRAINT {TABLE}_pkey PRIMARY KEY (id)")
+        cursor.execute(f"ALTER TABLE {TABLE} ALTER COLUMN id ADD GENERATED BY DEFAULT AS IDENTITY (START WITH {next_id})")
+        for name, definition in constraints:
+            cursor.execute(f"ALTER TABLE {TABLE} ADD CONSTRAINT {name} {definition}")
+        for name, definition in indexes:
+            cursor.execute(definition.replace(" ON ONLY ", " ON "))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stickers', '0006_pending_transactions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LedgerSnapshot',
+            fields=[
+                ('shopper', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='ledger_snapshot', serialize=False, to='stickers.shopper')),
+                ('as_of', models.DateTimeField()),
+                ('balance', models.IntegerField()),
+                ('earned', models.BigIntegerField()),
+            ],
+            options={
+                'db_table': 'sticker_ledger_snapshots',
+            },
+        ),
+        migrations.RunPython(partition_ledger, unpartition_ledger),
+    ]
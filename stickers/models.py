@@ -5,6 +5,9 @@ from django.db import models
 
 class Shopper(models.Model):
     id = models.TextField(primary_key=True)
+    # Running sum of this shopper's ledger deltas, maintained by LedgerService.
+    # Rebuild or verify it with `manage.py rebuild_balances`.
+    balance = models.IntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
@@ -17,7 +20,8 @@ class Transaction(models.Model):
     shopper = models.ForeignKey(
         Shopper,
         on_delete=models.CASCADE,
-        related_name="transactions"
+        related_name="transactions",
+        db_index=False,
     )
     store_id = models.TextField()
     timestamp = models.DateTimeField(auto_now_add=True)
@@ -27,6 +31,24 @@ class Transaction(models.Model):
 
     class Meta:
         db_table = "transactions"
+        indexes = [
+            # Shopper history pages, newest first, keyed on (timestamp, id)
+            # (ShopperDetailView, portal_view). Also serves the shopper
+            # foreign key, so it gets no index of its own.
+            models.Index(fields=["shopper", "-timestamp", "-id"], name="transactions_shopper_hist_idx"),
+            # Per-store totals (StatsView) as an index-only scan.
+            models.Index(fields=["store_id"], include=["stickers_awarded"], name="transactions_store_idx"),
+        ]
+        constraints = [
+            models.CheckConstraint(
+                condition=models.Q(stickers_awarded__gte=0),
+                name="transactions_stickers_awarded_gte_0",
+            ),
+            models.CheckConstraint(
+                condition=models.Q(total_amount__gte=0),
+                name="transactions_total_amount_gte_0",
+            ),
+        ]
 
 
 class TransactionItem(models.Model):
@@ -43,9 +65,29 @@ class TransactionItem(models.Model):
 
     class Meta:
         db_table = "transaction_items"
+        constraints = [
+            models.CheckConstraint(
+                condition=models.Q(quantity__gte=0),
+                name="transaction_items_quantity_gte_0",
+            ),
+            models.CheckConstraint(
+                condition=models.Q(unit_price__gte=0),
+                name="transaction_items_unit_price_gte_0",
+            ),
+        ]
 
 
 class StickerLedger(models.Model):
+    """
+    Append-only record of sticker earnings and redemptions.
+
+    On Postgres the table is range partitioned by month on ``created_at``
+    (see ``stickers.partitions``), so its real primary key is
+    ``(id, created_at)``; ids still come from a single sequence and are
+    unique. Entries older than a shopper's ``LedgerSnapshot`` are folded into
+    it, and their partitions can be detached.
+    """
+
     TYPE_CHOICES = [
         ("EARN", "Earn"),
         ("REDEEM", "Redeem"),
@@ -54,7 +96,8 @@ class StickerLedger(models.Model):
     shopper = models.ForeignKey(
         Shopper,
         on_delete=models.CASCADE,
-        related_name="ledger_entries"
+        related_name="ledger_entries",
+        db_index=False,
     )
     transaction = models.ForeignKey(
         Transaction,
@@ -67,4 +110,119 @@ class StickerLedger(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
-        db_table = "sticker_ledger"
\ No newline at end of file
+        db_table = "sticker_ledger"
+        indexes = [
+            # Ledger history per shopper. Including delta lets a balance sum
+            # run as an index-only scan. Also serves the shopper foreign key.
+            models.Index(
+                fields=["shopper", "created_at"],
+                include=["delta"],
+                name="ledger_shopper_created_idx",
+            ),
+            # Total stickers awarded (StatsView) without touching the heap.
+            models.Index(fields=["type"], include=["delta"], name="ledger_type_idx"),
+        ]
+        constraints = [
+            models.CheckConstraint(
+                condition=(
+                    models.Q(type="EARN", delta__gte=0)
+                    | models.Q(type="REDEEM", delta__lte=0)
+                ),
+                name="ledger_delta_sign_matches_type",
+            ),
+        ]
+
+
+class LedgerSnapshot(models.Model):
+    """
+    A shopper's ledger totals up to ``as_of``, written by
+    ``LedgerService.compact``. The ledger balance is the snapshot balance
+    plus the deltas of entries created at or after ``as_of``.
+    """
+
+    shopper = models.OneToOneField(
+        Shopper,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="ledger_snapshot",
+    )
+    as_of = models.DateTimeField()
+    balance = models.IntegerField()
+    # Sum of the EARN deltas folded in, for the exact stats
+    earned = models.BigIntegerField()
+
+    class Meta:
+        db_table = "sticker_ledger_snapshots"
+
+    def __str__(self):
+        return f"{self.shopper_id} as of {self.as_of}"
+
+
+class StoreStats(models.Model):
+    """
+    Running per-store totals behind StatsView, maintained by
+    StatsRollupService. Rebuild with `manage.py rebuild_stats`.
+    """
+
+    store_id = models.TextField(primary_key=True)
+    transaction_count = models.BigIntegerField(default=0)
+    stickers_awarded = models.BigIntegerField(default=0)
+
+    class Meta:
+        db_table = "store_stats"
+
+    def __str__(self):
+        return self.store_id
+
+
+class DailyStoreStats(models.Model):
+    store_id = models.TextField()
+    day = models.DateField()
+    transaction_count = models.BigIntegerField(default=0)
+    stickers_awarded = models.BigIntegerField(default=0)
+
+    class Meta:
+        db_table = "daily_store_stats"
+        constraints = [
+            models.UniqueConstraint(fields=["store_id", "day"], name="daily_store_stats_store_day_uniq"),
+        ]
+        indexes = [
+            models.Index(fields=["day"], name="daily_store_stats_day_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.store_id} {self.day}"
+
+
+class PendingTransaction(models.Model):
+    """
+    Outbox of transactions accepted by TransactionIngestView in async mode
+    (STICKER_INGEST_ASYNC) and not yet processed. Drained by
+    `manage.py process_ingest_queue`; a row is deleted once its
+    transaction is stored, or kept as FAILED with the error.
+    """
+
+    STATUS_CHOICES = [
+        ("PENDING", "Pending"),
+        ("FAILED", "Failed"),
+    ]
+
+    id = models.TextField(primary_key=True)  # transaction_id
+    payload = models.JSONField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default="PENDING")
+    errors = models.JSONField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = "pending_transactions"
+        indexes = [
+            # The workers' queue scan, oldest first, skipping failed rows
+            models.Index(
+                fields=["created_at"],
+                condition=models.Q(status="PENDING"),
+                name="pending_tx_queue_idx",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.id} ({self.status})"
@@ -0,0 +1,120 @@
+import base64
+from datetime import datetime
+
+from django.db.models import Q
+from rest_framework.utils.encoders import JSONEncoder
+
+from .models import Transaction
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+STREAM_CHUNK_SIZE = 2000
+
+# Fields returned for each transaction in shopper history responses
+TRANSACTION_FIELDS = ("transaction_id", "stickers_awarded", "total_amount", "timestamp")
+
+
+class InvalidCursorError(ValueError):
+    pass
+
+
+def encode_cursor(timestamp, transaction_id):
+    raw = f"{timestamp.isoformat()}|{transaction_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+        timestamp, transaction_id = raw.split("|", 1)
+        return datetime.fromisoformat(timestamp), transaction_id
+    except ValueError as e:
+        raise InvalidCursorError("Invalid cursor") from e
+
+
+def parse_limit(value):
+    if value in (None, ""):
+        return DEFAULT_PAGE_SIZE
+    limit = int(value)
+    if limit < 1:
+        raise ValueError("limit must be positive")
+    return min(limit, MAX_PAGE_SIZE)
+
+
+def _history_queryset(shopper_id):
+    return (
+        Transaction.objects
+        .filter(shopper_id=shopper_id)
+        .order_by("-timestamp", "-id")
+        .values_list("id", "stickers_awarded", "total_amount", "created_at", "timestamp")
+    )
+
+
+def transaction_page(shopper_id, limit=DEFAULT_PAGE_SIZE, cursor=None):
+    """
+    Returns one page of a shopper's transactions, newest first, and the
+    cursor for the next page (None on the last page).
+
+    Pages are keyed on (timestamp, id) rather than an offset, so every page
+    is a bounded index range scan however deep into the history it is.
+
+    :raises InvalidCursorError: if ``cursor`` was not produced by ``encode_cursor``
+    """
+    queryset = _history_queryset(shopper_id)
+    if cursor:
+        timestamp, transaction_id = decode_cursor(cursor)
+        queryset = queryset.filter(
+            Q(timestamp__lt=timestamp) | Q(timestamp=timestamp, id__lt=transaction_id)
+        )
+
+    # Fetch one extra row to learn whether there is a next page
+    rows = list(queryset[:limit + 1])
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(last[4], last[0])
+
+    return [_transaction_dict(row) for row in rows], next_cursor
+
+
+def _transaction_dict(row):
+    transaction_id, stickers_awarded, total_amount, created_at, _ = row
+    return dict(zip(TRANSACTION_FIELDS, (transaction_id, stickers_awarded, total_amount, created_at)))
+
+
+def stream_shopper_history(shopper_id, balance, using=None):
+    """
+    Returns an iterator of a shopper's full history as one JSON document,
+    in chunks.
+
+    Rows come from a server-side cursor as tuples rather than model
+    instances, so memory stays flat however long the history is. The
+    document has the same shape as a ShopperDetailView page, without
+    ``next_cursor``.
+
+    The database is chosen here, with ``using`` or else the router, rather
+    than when the iterator is consumed, e.g. while a response streams.
+    """
+    queryset = _history_queryset(shopper_id)
+    return _history_chunks(queryset.using(using or queryset.db), shopper_id, balance)
+
+
+def _history_chunks(queryset, shopper_id, balance):
+    # Same output format as DRF's JSONRenderer
+    encoder = JSONEncoder(ensure_ascii=False, separators=(",", ":"))
+
+    yield f'{{"shopper_id":{encoder.encode(shopper_id)},"balance":{encoder.encode(balance)},"transactions":['
+
+    chunk = []
+    separator = ""
+    for row in queryset.iterator(chunk_size=STREAM_CHUNK_SIZE):
+        chunk.append(encoder.encode(_transaction_dict(row)))
+        if len(chunk) == STREAM_CHUNK_SIZE:
+            yield separator + ",".join(chunk)
+            separator = ","
+            chunk = []
+    if chunk:
+        yield separator + ",".join(chunk)
+
+    yield "]}"
@@ -0,0 +1,206 @@
+"""
+Monthly range partitions of the sticker ledger (Postgres only).
+
+``sticker_ledger`` is partitioned by ``created_at``:
+
+    - ``sticker_ledger_initial`` holds everything before the month the
+      table was partitioned in (the rows of the unpartitioned table)
+    - ``sticker_ledger_pYYYY_MM`` holds one calendar month (UTC)
+    - ``sticker_ledger_default`` catches rows no other partition covers,
+      and is normally empty
+
+``manage.py ledger_partitions`` creates next months' partitions ahead of
+time, and detaches old partitions once ``LedgerService.compact`` has
+folded all of their entries into snapshots, so that they can be archived
+and dropped without touching the live table.
+"""
+
+from dataclasses import dataclass
+from datetime import UTC, datetime
+
+from django.db import connection
+from django.db import transaction as db_transaction
+
+from .models import LedgerSnapshot, StickerLedger
+
+LEDGER_TABLE = StickerLedger._meta.db_table
+INITIAL_PARTITION = f"{LEDGER_TABLE}_initial"
+DEFAULT_PARTITION = f"{LEDGER_TABLE}_default"
+
+
+class PartitionError(Exception):
+    pass
+
+
+@dataclass(frozen=True)
+class Partition:
+    name: str
+    # Range bounds, None for MINVALUE/MAXVALUE and for the default partition
+    start: datetime = None
+    end: datetime = None
+    is_default: bool = False
+
+
+def month_start(value):
+    return datetime(value.year, value.month, 1, tzinfo=UTC)
+
+
+def add_months(value, months):
+    month = value.month - 1 + months
+    return value.replace(year=value.year + month // 12, month=month % 12 + 1)
+
+
+def partition_name(start):
+    return f"{LEDGER_TABLE}_p{start:%Y_%m}"
+
+
+def is_partitioned():
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)", [LEDGER_TABLE])
+        row = cursor.fetchone()
+    return row is not None and row[0] == "p"
+
+
+def get_partitions():
+    """
+    Returns the ledger's partitions, oldest first, with the default
+    partition last.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT child.relname,
+                   pg_get_expr(child.relpartbound, child.oid) = 'DEFAULT',
+                   (regexp_match(pg_get_expr(child.relpartbound, child.oid),
+                                 'FROM \\(''([^'']+)''\\)'))[1]::timestamptz,
+                   (regexp_match(pg_get_expr(child.relpartbound, child.oid),
+                                 'TO \\(''([^'']+)''\\)'))[1]::timestamptz
+            FROM pg_inherits
+            JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+            WHERE pg_inherits.inhparent = %s::regclass
+            """,
+            [LEDGER_TABLE],
+        )
+        partitions = [Partition(name, start, end, is_default) for name, is_default, start, end in cursor.fetchall()]
+
+    return sorted(partitions, key=lambda p: (p.is_default, p.start or datetime.min.replace(tzinfo=UTC)))
+
+
+def create_partitions(months_ahead=3, now=None):
+    """
+    Creates the monthly partitions from the current month up to
+    ``months_ahead`` months ahead, skipping any that exist. Rows that landed
+    in the default partition for a new month are moved into it.
+
+    Returns the names of the partitions created.
+    """
+    if now is None:
+        now = datetime.now(UTC)
+
+    partitions = get_partitions()
+    existing = {partition.name for partition in partitions}
+    # Months before the end of the initial partition are part of it
+    initial_end = next((p.end for p in partitions if p.name == INITIAL_PARTITION), None)
+
+    created = []
+    start = month_start(now)
+    for _ in range(months_ahead + 1):
+        end = add_months(start, 1)
+        name = partition_name(start)
+        if name not in existing and (initial_end is None or start >= initial_end):
+            _create_partition(name, start, end)
+            created.append(name)
+        start = end
+    return created
+
+
+def _create_partition(name, start, end):
+    quote = connection.ops.quote_name
+    with db_transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT EXISTS (SELECT 1 FROM {quote(DEFAULT_PARTITION)} WHERE created_at >= %s AND created_at < %s)",
+            [start, end],
+        )
+        if not cursor.fetchone()[0]:
+            cursor.execute(
+                f"CREATE TABLE {quote(name)} PARTITION OF {quote(LEDGER_TABLE)} FOR VALUES FROM (%s) TO (%s)",
+                [start, end],
+            )
+            name_partition_indexes(cursor, name)
+            return
+
+        # Postgres refuses a new partition for rows the default partition
+        # already holds, so those are moved across with it detached
+        cursor.execute(f"ALTER TABLE {quote(LEDGER_TABLE)} DETACH PARTITION {quote(DEFAULT_PARTITION)}")
+        cursor.execute(
+            f"CREATE TABLE {quote(name)} PARTITION OF {quote(LEDGER_TABLE)} FOR VALUES FROM (%s) TO (%s)",
+            [start, end],
+        )
+        name_partition_indexes(cursor, name)
+        cursor.execute(
+            f"WITH moved AS (DELETE FROM {quote(DEFAULT_PARTITION)} WHERE created_at >= %s AND created_at < %s "
+            f"RETURNING *) INSERT INTO {quote(name)} SELECT * FROM moved",
+            [start, end],
+        )
+        cursor.execute(f"ALTER TABLE {quote(LEDGER_TABLE)} ATTACH PARTITION {quote(DEFAULT_PARTITION)} DEFAULT")
+
+
+def name_partition_indexes(cursor, partition):
+    """
+    Renames a partition's indexes after the ledger's indexes they belong
+    to, e.g. ``ledger_shopper_created_idx_p2026_01``, so query plans name
+    the index they use.
+    """
+    suffix = partition.removeprefix(f"{LEDGER_TABLE}_")
+    cursor.execute(
+        """
+        SELECT child.relname, parent.relname
+        FROM pg_index
+        JOIN pg_inherits ON pg_inherits.inhrelid = pg_index.indexrelid
+        JOIN pg_class child ON child.oid = pg_index.indexrelid
+        JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+        WHERE pg_index.indrelid = %s::regclass
+        """,
+        [partition],
+    )
+    quote = connection.ops.quote_name
+    for index, parent in cursor.fetchall():
+        name = f"{parent[:62 - len(suffix)]}_{suffix}"
+        if index != name:
+            cursor.execute(f"ALTER INDEX {quote(index)} RENAME TO {quote(name)}")
+
+
+def detach_partitions(before):
+    """
+    Detaches the partitions that end on or before ``before`` and whose
+    entries are all folded into ledger snapshots. Detached partitions are
+    plain tables, ready to be archived (e.g. with ``pg_dump``) and dropped.
+
+    Returns the names of the partitions detached.
+
+    :raises PartitionError: if a partition still has entries that no
+        snapshot covers; run ``LedgerService.compact`` first.
+    """
+    quote = connection.ops.quote_name
+    detached = []
+    for partition in get_partitions():
+        if partition.is_default or partition.end is None or partition.end > before:
+            continue
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT count(*) FROM {quote(partition.name)} entry "
+                f"LEFT JOIN {quote(LedgerSnapshot._meta.db_table)} snapshot USING (shopper_id) "
+                f"WHERE snapshot.as_of IS NULL OR snapshot.as_of < %s",
+                [partition.end],
+            )
+            uncovered = cursor.fetchone()[0]
+        if uncovered:
+            raise PartitionError(
+                f"{partition.name} has {uncovered} entries not folded into a snapshot, compact the ledger first"
+            )
+
+        with connection.cursor() as cursor:
+            cursor.execute(f"ALTER TABLE {quote(LEDGER_TABLE)} DETACH PARTITION {quote(partition.name)}")
+        detached.append(partition.name)
+    return detached
@@ -0,0 +1,314 @@
+"""
+Declarative promotion rules for sticker calculation.
+
+Campaigns are plain data (see ``DEFAULT_RULES`` for the built-in ruleset)
+and can be loaded from the JSON file named by ``settings.STICKER_RULES_FILE``,
+which is reloaded whenever it changes. Each ruleset is compiled once into
+lookup tables keyed by SKU and category, so scoring an item costs two dict
+lookups however many campaigns are active.
+
+Rule kinds:
+    - ``base_rate``: ``cents_per_sticker`` spent to earn one base sticker
+    - ``unit_bonus``: ``stickers_per_unit`` extra stickers per matching unit
+    - ``spend_multiplier``: matching spend counts ``multiplier`` times
+      towards base stickers
+    - ``base_bonus``: adds ``ratio`` x base stickers (rounded down)
+    - ``cap``: ``max_stickers`` awarded per transaction
+
+``unit_bonus`` and ``spend_multiplier`` rules match items by exactly one of
+``sku`` or ``category``. Matching bonuses and the extra spend from multipliers
+add up, as do ``base_bonus`` ratios. For ``base_rate`` and ``cap`` a
+store-specific rule overrides a global one, and otherwise the rule declared
+last wins.
+
+Any rule can be limited with:
+    - ``stores``: list of store ids
+    - ``weekdays``: list of weekdays (Monday=0, ..., Sunday=6)
+    - ``hours``: ``[start, end)`` hours of the day
+    - ``start_date`` / ``end_date``: inclusive ISO dates
+"""
+
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import date
+from decimal import Decimal, InvalidOperation
+
+import structlog
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+logger = structlog.get_logger()
+
+ITEM_RULE_KINDS = ("unit_bonus", "spend_multiplier")
+BASKET_RULE_KINDS = ("base_rate", "base_bonus", "cap")
+
+# The field holding each kind's value, and how to parse it
+RULE_VALUES = {
+    "base_rate": ("cents_per_sticker", int),
+    "unit_bonus": ("stickers_per_unit", int),
+    "spend_multiplier": ("multiplier", Decimal),
+    "base_bonus": ("ratio", Decimal),
+    "cap": ("max_stickers", int),
+}
+
+DEFAULT_RULES = {
+    "rules": [
+        # 1 sticker per $10 spent
+        {"id": "base-rate", "kind": "base_rate", "cents_per_sticker": 1000},
+        # +1 sticker per unit for promo items
+        {"id": "promo-category", "kind": "unit_bonus", "category": "promo", "stickers_per_unit": 1},
+        # Wednesdays and Fridays earn 50% extra base stickers
+        {"id": "wed-fri-bonus", "kind": "base_bonus", "weekdays": [2, 4], "ratio": "0.5"},
+        # Maximum 5 stickers per transaction
+        {"id": "transaction-cap", "kind": "cap", "max_stickers": 5},
+    ]
+}
+
+
+class RulesError(ImproperlyConfigured):
+    pass
+
+
+@dataclass(frozen=True, eq=False)
+class Rule:
+    id: str
+    kind: str
+    value: object
+    sku: str | None = None
+    category: str | None = None
+    stores: frozenset | None = None
+    weekdays: frozenset | None = None
+    hours: tuple | None = None
+    start_date: date | None = None
+    end_date: date | None = None
+
+    @property
+    def is_unrestricted(self):
+        return (self.stores, self.weekdays, self.hours, self.start_date, self.end_date) == (None,) * 5
+
+    def is_active(self, store_id, day, hour):
+        if self.stores is not None and store_id not in self.stores:
+            return False
+        if self.weekdays is not None and day.weekday() not in self.weekdays:
+            return False
+        if self.hours is not None and (hour is None or not self.hours[0] <= hour < self.hours[1]):
+            return False
+        if self.start_date is not None and day < self.start_date:
+            return False
+        if self.end_date is not None and day > self.end_date:
+            return False
+        return True
+
+
+class RulesetView:
+    """
+    The rules of a ruleset that are active for one store during one hour,
+    pre-combined for scoring.
+
+    ``by_sku`` and ``by_category`` map to ``(stickers_per_unit, extra_multiplier)``
+    tuples, where ``extra_multiplier`` is the multiplier minus one.
+    """
+
+    __slots__ = ("by_sku", "by_category", "cents_per_sticker", "base_bonus_ratio", "max_stickers")
+
+    def __init__(self, item_rules, basket_rules):
+        self.by_sku = {}
+        self.by_category = {}
+        for rule in item_rules:
+            index = self.by_sku if rule.sku is not None else self.by_category
+            key = rule.sku if rule.sku is not None else rule.category
+            unit_bonus, extra_multiplier = index.get(key, (0, 0))
+            if rule.kind == "unit_bonus":
+                unit_bonus += rule.value
+            else:
+                extra_multiplier += rule.value - 1
+            index[key] = (unit_bonus, extra_multiplier)
+
+        # Store-specific rules override global ones, then last declared wins
+        overrides = sorted(basket_rules, key=lambda rule: rule.stores is not None)
+        self.cents_per_sticker = None
+        self.max_stickers = None
+        self.base_bonus_ratio = 0
+        for rule in overrides:
+            if rule.kind == "base_rate":
+                self.cents_per_sticker = rule.value
+            elif rule.kind == "cap":
+                self.max_stickers = rule.value
+            else:
+                self.base_bonus_ratio += rule.value
+
+    def stickers(self, spend_cents, promo_bonus):
+        """
+        spend_cents: int or Decimal cents, including any multiplier bonus spend
+        promo_bonus: stickers from unit bonuses
+        """
+        base_stickers = int(spend_cents // self.cents_per_sticker)
+
+        total_stickers = base_stickers + promo_bonus
+        if self.base_bonus_ratio:
+            total_stickers += int(base_stickers * self.base_bonus_ratio)
+
+        # Apply per-transaction cap
+        if self.max_stickers is not None:
+            total_stickers = min(total_stickers, self.max_stickers)
+
+        return total_stickers
+
+
+class Ruleset:
+    """
+    A compiled set of rules. Use ``view`` to get the lookup tables for a
+    given store and time; views are built once and cached.
+    """
+
+    max_cached_views = 10_000
+
+    def __init__(self, rules):
+        self.rules = tuple(rules)
+        self._global_rules = [rule for rule in self.rules if rule.stores is None]
+        self._store_rules = defaultdict(list)
+        for rule in self.rules:
+            for store_id in rule.stores or ():
+                self._store_rules[store_id].append(rule)
+        self._position = {rule: index for index, rule in enumerate(self.rules)}
+        self._views = {}
+
+    def view(self, store_id, day, hour):
+        key = (store_id, day, hour)
+        try:
+            return self._views[key]
+        except KeyError:
+            pass
+
+        # Only this store's own rules are considered, in declaration order
+        candidates = self._global_rules
+        if store_id in self._store_rules:
+            candidates = sorted(candidates + self._store_rules[store_id], key=self._position.__getitem__)
+
+        active = [rule for rule in candidates if rule.is_active(store_id, day, hour)]
+        view = RulesetView(
+            [rule for rule in active if rule.kind in ITEM_RULE_KINDS],
+            [rule for rule in active if rule.kind in BASKET_RULE_KINDS],
+        )
+
+        if len(self._views) >= self.max_cached_views:
+            self._views.clear()
+        self._views[key] = view
+        return view
+
+
+def compile_rules(data):
+    """
+    Parses and validates rules data (as in ``DEFAULT_RULES``) into a ``Ruleset``.
+
+    :raises RulesError: if the data is malformed
+    """
+    if not isinstance(data, dict) or not isinstance(data.get("rules"), list):
+        raise RulesError('Rules must be an object with a "rules" list')
+
+    rules = []
+    for position, spec in enumerate(data["rules"]):
+        try:
+            rules.append(_parse_rule(spec))
+        except (KeyError, TypeError, ValueError, InvalidOperation) as e:
+            rule_id = spec.get("id", position) if isinstance(spec, dict) else position
+            raise RulesError(f"Invalid rule {rule_id!r}: {e}") from e
+
+    # Guarantees every store has a base rate at all times
+    if not any(rule.kind == "base_rate" and rule.is_unrestricted for rule in rules):
+        raise RulesError("Rules need a base_rate rule that applies to all stores at all times")
+
+    return Ruleset(rules)
+
+
+def _parse_rule(spec):
+    kind = spec["kind"]
+    if kind not in RULE_VALUES:
+        raise ValueError(f"unknown kind {kind!r}")
+
+    field, parse = RULE_VALUES[kind]
+    value = parse(str(spec[field]))
+    if value < 0 or (kind == "base_rate" and value == 0):
+        raise ValueError(f"{field} out of range")
+
+    sku = spec.get("sku")
+    category = spec.get("category")
+    if kind in ITEM_RULE_KINDS and (sku is None) == (category is None):
+        raise ValueError("item rules need exactly one of sku or category")
+    if kind in BASKET_RULE_KINDS and (sku is not None or category is not None):
+        raise ValueError(f"{kind} rules apply to whole transactions, not a sku or category")
+
+    hours = spec.get("hours")
+    if hours is not None:
+        start, end = (int(hour) for hour in hours)
+        if not 0 <= start < end <= 24:
+            raise ValueError("hours must be [start, end) within 0-24")
+        hours = (start, end)
+
+    return Rule(
+        id=str(spec.get("id", "")),
+        kind=kind,
+        value=value,
+        sku=sku,
+        category=category,
+        stores=frozenset(spec["stores"]) if "stores" in spec else None,
+        weekdays=frozenset(int(day) for day in spec["weekdays"]) if "weekdays" in spec else None,
+        hours=hours,
+        start_date=date.fromisoformat(spec["start_date"]) if "start_date" in spec else None,
+        end_date=date.fromisoformat(spec["end_date"]) if "end_date" in spec else None,
+    )
+
+
+DEFAULT_RULESET = compile_rules(DEFAULT_RULES)
+
+
+class _RulesFileLoader:
+    """
+    Loads the ruleset from ``settings.STICKER_RULES_FILE`` and recompiles it
+    when the file changes, checking the file at most once every
+    ``settings.STICKER_RULES_RELOAD_INTERVAL`` seconds.
+
+    A file that fails to load keeps the previous ruleset in service.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._path = None
+        self._signature = None
+        self._ruleset = None
+        self._checked_at = 0.0
+
+    def get(self, path):
+        if path == self._path and time.monotonic() - self._checked_at < settings.STICKER_RULES_RELOAD_INTERVAL:
+            return self._ruleset
+
+        with self._lock:
+            self._checked_at = time.monotonic()
+            try:
+                stat = os.stat(path)
+                signature = (stat.st_mtime_ns, stat.st_ino, stat.st_size)
+                if path != self._path or signature != self._signature:
+                    with open(path, encoding="utf-8") as f:
+                        ruleset = compile_rules(json.load(f))
+                    self._path, self._signature, self._ruleset = path, signature, ruleset
+                    logger.info("Sticker rules loaded", path=str(path), rules=len(ruleset.rules))
+            except (OSError, ValueError, RulesError) as e:
+                if self._ruleset is None or path != self._path:
+                    raise RulesError(f"Could not load sticker rules from {path}: {e}") from e
+                logger.error("Sticker rules reload failed, keeping previous rules", path=str(path), error=str(e))
+
+            return self._ruleset
+
+
+_rules_file_loader = _RulesFileLoader()
+
+
+def get_active_ruleset():
+    path = settings.STICKER_RULES_FILE
+    if not path:
+        return DEFAULT_RULESET
+    return _rules_file_loader.get(path)
@@ -1,13 +1,38 @@
+import re
+
+from django.conf import settings
 from rest_framework import serializers
 
+from .baskets import Basket, BasketItem
+
+# The largest values the integer quantity and the total_amount
+# (max_digits=10, decimal_places=2) columns can store
+MAX_QUANTITY = 2**31 - 1
+MAX_TOTAL_CENTS = 10**10 - 1
+
+
+class BasketSerializer(serializers.ListSerializer):
+
+    def to_internal_value(self, data):
+        return Basket(super().to_internal_value(data))
+
 
 class TransactionItemSerializer(serializers.Serializer):
+    """
+    Validates an item into a ``BasketItem``; a list of them into a ``Basket``.
+    """
     sku = serializers.CharField()
     name = serializers.CharField()
-    quantity = serializers.IntegerField()
+    quantity = serializers.IntegerField(max_value=MAX_QUANTITY)
     unit_price = serializers.DecimalField(max_digits=10, decimal_places=2)
     category = serializers.CharField()
 
+    class Meta:
+        list_serializer_class = BasketSerializer
+
+    def to_internal_value(self, data):
+        return BasketItem.from_dict(super().to_internal_value(data))
+
 
 class TransactionSerializer(serializers.Serializer):
     
@@ -15,4 +40,119 @@ class TransactionSerializer(serializers.Serializer):
     shopper_id = serializers.CharField()
     store_id = serializers.CharField()
     #timestamp = serializers.DateTimeField()
-    items = TransactionItemSerializer(many=True)
\ No newline at end of file
+    items = TransactionItemSerializer(many=True)
+
+    def validate(self, attrs):
+        if basket_total_cents(attrs["items"]) > MAX_TOTAL_CENTS:
+            raise serializers.ValidationError(
+                {"items": f"Ensure the total amount is less than or equal to {MAX_TOTAL_CENTS / 100:.2f}."}
+            )
+        return attrs
+
+
+def basket_total_cents(basket):
+    return sum(item.quantity * item.unit_price_cents for item in basket)
+
+
+# ─── Fast path ────────────────────────────────────────────────────────────────
+#
+# Building the nested serializer costs a deep copy of its fields and a
+# field.run_validation call per item value, which dominates ingest time for
+# large baskets. Payloads are nearly always well formed, so they are first
+# checked by plain code that only accepts values the serializer is certain
+# to accept unchanged: strings already stripped, int quantities and prices
+# written as plain decimals. Anything else, including every invalid payload,
+# goes through TransactionSerializer, so decisions and error messages are
+# exactly DRF's.
+
+TRANSACTION_FIELDS = ("transaction_id", "shopper_id", "store_id")
+ITEM_STRING_FIELDS = ("sku", "name", "category")
+
+# Prices within max_digits=10, decimal_places=2
+_PRICE = re.compile(r"-?[0-9]{1,8}(?:\.[0-9]{1,2})?")
+
+# Characters that CharField's validators reject
+_PROHIBITED_CHARACTERS = re.compile("[\x00\ud800-\udfff]")
+
+
+def fast_validate_transaction(data):
+    """
+    Returns the validated data for a payload in the common, canonical form,
+    identical to ``TransactionSerializer(data=data).validated_data``, or
+    None if the payload has to be validated by the serializer.
+    """
+    if type(data) is not dict:
+        return None
+
+    validated = {}
+    for name in TRANSACTION_FIELDS:
+        value = data.get(name)
+        if not _is_plain_string(value):
+            return None
+        validated[name] = value
+
+    items = data.get("items")
+    if type(items) is not list:
+        return None
+
+    validated_items = []
+    for item in items:
+        if type(item) is not dict:
+            return None
+
+        sku = item.get("sku")
+        name = item.get("name")
+        quantity = item.get("quantity")
+        unit_price = item.get("unit_price")
+        category = item.get("category")
+
+        if not (_is_plain_string(sku) and _is_plain_string(name) and _is_plain_string(category)):
+            return None
+        if type(quantity) is not int or not -MAX_QUANTITY <= quantity <= MAX_QUANTITY:
+            return None
+        if type(unit_price) is not str or _PRICE.fullmatch(unit_price) is None:
+            return None
+
+        validated_items.append(BasketItem(sku, name, quantity, _price_to_cents(unit_price), category))
+
+    basket = Basket(validated_items)
+    if basket_total_cents(basket) > MAX_TOTAL_CENTS:
+        return None
+    validated["items"] = basket
+    return validated
+
+
+def _price_to_cents(price):
+    # Only for prices matching _PRICE: drop the point, pad to two decimals
+    point = price.find(".")
+    if point < 0:
+        return int(price + "00")
+    return int(price[:point] + price[point + 1:] + "0" * (3 - len(price) + point))
+
+
+def _is_plain_string(value):
+    return (
+        type(value) is str
+        and value != ""
+        and value.strip() == value
+        and _PROHIBITED_CHARACTERS.search(value) is None
+    )
+
+
+def validate_transaction(data):
+    """
+    Validates one transaction payload. Returns ``(validated_data, None)``,
+    or ``(None, errors)`` with the serializer's errors.
+
+    With ``settings.STICKER_FAST_VALIDATION`` the payload is tried on
+    ``fast_validate_transaction`` first.
+    """
+    if settings.STICKER_FAST_VALIDATION:
+        validated = fast_validate_transaction(data)
+        if validated is not None:
+            return validated, None
+
+    serializer = TransactionSerializer(data=data)
+    if serializer.is_valid():
+        return serializer.validated_data, None
+    return None, serializer.errors
@@ -1,28 +1,199 @@
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime, timedelta
 from decimal import Decimal
-from math import floor
-from datetime import date
+from itertools import repeat
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DatabaseError, connection
+from django.db import transaction as db_transaction
+from django.db.models import Case, Count, F, IntegerField, Min, Q, Sum, Value, When
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+
+import structlog
+
+from looplink.django_ext.replicas import primary_reads
+
+from .baskets import Basket, to_cents
+from .models import (
+    DailyStoreStats,
+    LedgerSnapshot,
+    PendingTransaction,
+    Shopper,
+    StickerLedger,
+    StoreStats,
+    Transaction,
+    TransactionItem,
+)
+from .pagination import transaction_page
+from .rules import get_active_ruleset
+from .serializers import TransactionSerializer, validate_transaction
+
+logger = structlog.get_logger()
+
 
 class StickerCalculationService:
-    MAX_STICKERS_PER_TRANSACTION = 5
+    """
+    Scores baskets against the active promotion ruleset (see ``stickers.rules``).
+    """
 
     @staticmethod
-    def calculate(items):
+    def calculate(items, at=None, store_id=None):
         """
-        items: list of dicts with keys:
+        items: a Basket, or list of dicts with keys:
             - quantity
             - unit_price
             - category
+            - sku (optional, for SKU rules)
+        """
+        return StickerCalculationService.calculate_many([items], at=at, store_ids=[store_id])[0]
+
+    @staticmethod
+    def calculate_many(baskets, at=None, store_ids=None, return_exceptions=False):
+        """
+        Scores many baskets in one pass. Returns one result per basket, in
+        order, identical to what ``calculate`` returns for that basket.
+
+        Prices are summed as integer cents rather than Decimals, and the
+        active rules are resolved once per store for the whole batch.
+        Baskets with prices that are not a whole number of cents fall back
+        to exact Decimal arithmetic, so results never differ from the
+        single-basket path.
+
+        Baskets of ``BasketItem``s (see ``stickers.baskets``) are already
+        in cents and skip the conversion.
+
+        :param baskets: iterable of item lists, as accepted by ``calculate``
+        :param at: datetime (or date, which skips hour-limited rules) whose
+            rules apply; defaults to now
+        :param store_ids: store id per basket, for store-specific rules
+        :param return_exceptions: when True, a basket that fails validation
+            yields its ValueError in the results instead of raising it
+        """
+        if at is None:
+            at = datetime.now()
+        if isinstance(at, datetime):
+            day, hour = at.date(), at.hour
+        else:
+            day, hour = at, None
+
+        ruleset = get_active_ruleset()
+        if store_ids is None:
+            store_ids = repeat(None)
+
+        # Catalog prices repeat across baskets, so each distinct price is
+        # converted to cents once per batch
+        cents_cache = {}
+
+        results = []
+        for items, store_id in zip(baskets, store_ids):
+            view = ruleset.view(store_id, day, hour)
+            try:
+                if type(items) is Basket:
+                    result = StickerCalculationService._calculate_basket(items, view)
+                else:
+                    result = StickerCalculationService._calculate_cents(items, view, cents_cache)
+                if result is None:
+                    result = StickerCalculationService._calculate_decimal(items, view)
+            except ValueError as e:
+                if not return_exceptions:
+                    raise
+                result = e
+            results.append(result)
+        return results
+
+    @staticmethod
+    def _calculate_basket(basket, view):
+        """
+        Integer-cents scoring of a Basket, whose prices are cents already.
         """
-       
-        today = date.today()
+        by_sku = view.by_sku
+        by_category = view.by_category
 
-        # Get the weekday as an integer (Monday=0, ..., Wednesday=2, ..., Sunday=6)
-        today_weekday_int = today.weekday()
+        total_cents = 0
+        bonus_cents = 0
+        promo_bonus = 0
 
-        print(today_weekday_int)
-        
+        for item in basket:
+            quantity = item.quantity
+            unit_price_cents = item.unit_price_cents
 
+            if quantity < 0:
+                raise ValueError("Quantity cannot be negative")
+
+            if unit_price_cents < 0:
+                raise ValueError("Unit price cannot be negative")
+
+            line_cents = quantity * unit_price_cents
+            total_cents += line_cents
+
+            for effects in (by_sku.get(item.sku), by_category.get(item.category)):
+                if effects is not None:
+                    promo_bonus += quantity * effects[0]
+                    if effects[1]:
+                        bonus_cents += line_cents * effects[1]
+
+        return {
+            "total_amount": Decimal(total_cents).scaleb(-2),
+            "stickers_awarded": view.stickers(total_cents + bonus_cents, promo_bonus)
+        }
+
+    @staticmethod
+    def _calculate_cents(items, view, cents_cache):
+        """
+        Integer-cents scoring. Returns None if the basket needs the exact
+        Decimal path instead.
+        """
+        by_sku = view.by_sku
+        by_category = view.by_category
+
+        total_cents = 0
+        bonus_cents = 0
+        promo_bonus = 0
+
+        for item in items:
+            quantity = item["quantity"]
+            unit_price = item["unit_price"]
+
+            # True == 1 as a dict key, but bools are not valid prices
+            if type(quantity) is not int or unit_price is True or unit_price is False:
+                return None
+
+            try:
+                unit_price_cents = cents_cache[unit_price]
+            except KeyError:
+                unit_price_cents = cents_cache[unit_price] = to_cents(unit_price)
+
+            if unit_price_cents is None:
+                return None
+
+            if quantity < 0:
+                raise ValueError("Quantity cannot be negative")
+
+            if unit_price_cents < 0:
+                raise ValueError("Unit price cannot be negative")
+
+            line_cents = quantity * unit_price_cents
+            total_cents += line_cents
+
+            for effects in (by_sku.get(item.get("sku")), by_category.get(item.get("category"))):
+                if effects is not None:
+                    promo_bonus += quantity * effects[0]
+                    if effects[1]:
+                        bonus_cents += line_cents * effects[1]
+
+        return {
+            "total_amount": Decimal(total_cents).scaleb(-2),
+            "stickers_awarded": view.stickers(total_cents + bonus_cents, promo_bonus)
+        }
+
+    @staticmethod
+    def _calculate_decimal(items, view):
         total_amount = Decimal("0.00")
+        bonus_amount = 0
         promo_bonus = 0
 
         for item in items:
@@ -35,27 +206,825 @@ class StickerCalculationService:
             if unit_price < 0:
                 raise ValueError("Unit price cannot be negative")
 
-            total_amount += quantity * unit_price
+            line_amount = quantity * unit_price
+            total_amount += line_amount
 
-            if item.get("category") == "promo":
-                promo_bonus += quantity
+            for effects in (view.by_sku.get(item.get("sku")), view.by_category.get(item.get("category"))):
+                if effects is not None:
+                    promo_bonus += quantity * effects[0]
+                    if effects[1]:
+                        bonus_amount += line_amount * effects[1]
+
+        return {
+            "total_amount": total_amount,
+            "stickers_awarded": view.stickers((total_amount + bonus_amount) * 100, promo_bonus)
+        }
+
+
+class InsufficientStickersError(Exception):
+    pass
 
-        # Base earn rate: 1 sticker per $10
-        base_stickers = floor(total_amount / Decimal("10"))
-        if today_weekday_int in [2, 4]:
-            wed_or_fri_special = floor(base_stickers * 0.5)
-        else:
-            wed_or_fri_special = 0
 
-        total_stickers = base_stickers + promo_bonus+wed_or_fri_special
+class TransactionIngestService:
+    """
+    Persists validated transactions in bulk.
 
-        # Apply per-transaction cap
-        total_stickers = min(
-            total_stickers,
-            StickerCalculationService.MAX_STICKERS_PER_TRANSACTION
+    A batch costs a fixed number of queries however many transactions it
+    holds: one lookup for already-processed ids, one upsert for shoppers,
+    and one bulk insert each for transactions, items and ledger entries.
+
+    Replays are answered from a cache of recent transaction results
+    (STICKER_TRANSACTION_CACHE) before touching the database. New
+    transactions are inserted with ``ON CONFLICT DO NOTHING``, so concurrent
+    submissions of one id produce a single write and the rest are reported
+    as duplicates.
+    """
+
+    BULK_BATCH_SIZE = 1000
+    CACHE_KEY = "stickers:transaction:{}"
+
+    @staticmethod
+    def ingest_many(transactions, at=None):
+        """
+        transactions: list of validated TransactionSerializer data
+        at: when the transactions took place, for time-scoped rules (defaults to now)
+
+        Returns one result dict per transaction, in input order, with a
+        ``status`` of "created", "duplicate" or "error".
+        """
+        results = [None] * len(transactions)
+
+        # Validated data holds Baskets already; item dicts are accepted too
+        transactions = [
+            data if type(data["items"]) is Basket else {**data, "items": Basket.from_items(data["items"])}
+            for data in transactions
+        ]
+
+        # Idempotency check, at most one query for the whole batch
+        processed = TransactionIngestService.processed_stickers(
+            {data["transaction_id"] for data in transactions}
         )
 
+        # Score every basket that has not been processed before in one pass
+        to_score = [
+            index for index, data in enumerate(transactions)
+            if data["transaction_id"] not in processed
+        ]
+        calculations = dict(zip(
+            to_score,
+            StickerCalculationService.calculate_many(
+                [transactions[index]["items"] for index in to_score],
+                at=at,
+                store_ids=[transactions[index]["store_id"] for index in to_score],
+                return_exceptions=True,
+            ),
+        ))
+
+        new_transactions = {}
+        for index, data in enumerate(transactions):
+            transaction_id = data["transaction_id"]
+
+            # Also catches the same id repeated within this batch
+            if transaction_id in processed:
+                results[index] = {
+                    "transaction_id": transaction_id,
+                    "status": "duplicate",
+                    "stickers_awarded": processed[transaction_id],
+                }
+                continue
+
+            calculation = calculations[index]
+            if isinstance(calculation, ValueError):
+                results[index] = {
+                    "transaction_id": transaction_id,
+                    "status": "error",
+                    "errors": {"error": str(calculation)},
+                }
+                continue
+
+            processed[transaction_id] = calculation["stickers_awarded"]
+            new_transactions[transaction_id] = (data, calculation)
+            results[index] = {
+                "transaction_id": transaction_id,
+                "status": "created",
+                "stickers_awarded": calculation["stickers_awarded"],
+            }
+
+        if not new_transactions:
+            return results
+
+        lost = TransactionIngestService._persist(new_transactions)
+
+        # Another request stored some of these ids since our lookup; report
+        # what it awarded rather than what we would have
+        if lost:
+            for result in results:
+                if result["transaction_id"] in lost and result["status"] != "error":
+                    result["status"] = "duplicate"
+                    result["stickers_awarded"] = lost[result["transaction_id"]]
+
+        return results
+
+    @staticmethod
+    def processed_stickers(transaction_ids):
+        """
+        Returns ``{transaction_id: stickers_awarded}`` for the ids that have
+        already been processed, checking the cache first and the database
+        for the rest.
+        """
+        transaction_ids = list(transaction_ids)
+        processed = {}
+        key = TransactionIngestService.CACHE_KEY.format
+
+        cache = caches[settings.STICKER_TRANSACTION_CACHE]
+        try:
+            cached = cache.get_many([key(transaction_id) for transaction_id in transaction_ids])
+        except Exception as e:
+            # The cache only saves queries; never fail ingest because of it
+            logger.warning("Transaction cache unavailable", error=str(e))
+            cached = {}
+
+        misses = []
+        for transaction_id in transaction_ids:
+            if key(transaction_id) in cached:
+                processed[transaction_id] = cached[key(transaction_id)]
+            else:
+                misses.append(transaction_id)
+
+        if misses:
+            found = dict(
+                Transaction.objects
+                .filter(id__in=misses)
+                .values_list("id", "stickers_awarded")
+            )
+            # Deferred in case the rows were written by our own open transaction
+            db_transaction.on_commit(lambda: TransactionIngestService._cache_results(found))
+            processed.update(found)
+
+        return processed
+
+    @staticmethod
+    def _cache_results(stickers_awarded):
+        if not stickers_awarded:
+            return
+
+        key = TransactionIngestService.CACHE_KEY.format
+        try:
+            caches[settings.STICKER_TRANSACTION_CACHE].set_many(
+                {key(transaction_id): stickers for transaction_id, stickers in stickers_awarded.items()},
+                timeout=settings.STICKER_TRANSACTION_CACHE_TIMEOUT,
+            )
+        except Exception as e:
+            logger.warning("Transaction cache unavailable", error=str(e))
+
+    @staticmethod
+    def _persist(new_transactions):
+        """
+        new_transactions: {transaction_id: (data, calculation)}
+
+        Writes the transactions, their items and ledger entries. Returns
+        ``{transaction_id: stickers_awarded}`` for ids that turned out to be
+        stored already by a concurrent request; nothing is written for those.
+        """
+        txs = {
+            transaction_id: Transaction(
+                id=transaction_id,
+                shopper_id=data["shopper_id"],
+                store_id=data["store_id"],
+                total_amount=calculation["total_amount"],
+                stickers_awarded=calculation["stickers_awarded"],
+            )
+            for transaction_id, (data, calculation) in new_transactions.items()
+        }
+
+        batch_size = TransactionIngestService.BULK_BATCH_SIZE
+        with db_transaction.atomic():
+            Shopper.objects.bulk_create(
+                [Shopper(id=shopper_id) for shopper_id in {tx.shopper_id for tx in txs.values()}],
+                ignore_conflicts=True,
+                batch_size=batch_size,
+            )
+
+            inserted = TransactionIngestService._insert_transactions(list(txs.values()))
+            lost = {}
+            if len(inserted) < len(txs):
+                # Only reachable when racing another request for the same ids;
+                # the conflicting rows are committed once our insert returns
+                lost = dict(
+                    Transaction.objects
+                    .filter(id__in=txs.keys() - inserted)
+                    .values_list("id", "stickers_awarded")
+                )
+                txs = {transaction_id: tx for transaction_id, tx in txs.items() if transaction_id in inserted}
+
+            items = []
+            ledger_entries = []
+            for transaction_id, tx in txs.items():
+                data, calculation = new_transactions[transaction_id]
+                items.extend(
+                    TransactionItem(
+                        transaction=tx,
+                        sku=item.sku,
+                        name=item.name,
+                        quantity=item.quantity,
+                        unit_price=item.unit_price,
+                        category=item.category,
+                    )
+                    for item in data["items"]
+                )
+                ledger_entries.append(
+                    StickerLedger(
+                        shopper_id=data["shopper_id"],
+                        transaction=tx,
+                        type="EARN",
+                        delta=calculation["stickers_awarded"],
+                    )
+                )
+
+            TransactionItem.objects.bulk_create(items, batch_size=batch_size)
+            LedgerService.record_many(ledger_entries)
+            StatsRollupService.record_transactions(list(txs.values()))
+
+            stored = {transaction_id: tx.stickers_awarded for transaction_id, tx in txs.items()}
+            db_transaction.on_commit(lambda: TransactionIngestService._cache_results({**stored, **lost}))
+
+        return lost
+
+    @staticmethod
+    def _insert_transactions(txs):
+        """
+        Inserts ``txs`` with ``ON CONFLICT (id) DO NOTHING`` and returns the
+        set of ids that were actually inserted.
+        """
+        fields = Transaction._meta.concrete_fields
+        columns = ", ".join(connection.ops.quote_name(field.column) for field in fields)
+        row_placeholder = "(" + ", ".join(["%s"] * len(fields)) + ")"
+
+        inserted = set()
+        batch_size = TransactionIngestService.BULK_BATCH_SIZE
+        for start in range(0, len(txs), batch_size):
+            batch = txs[start:start + batch_size]
+            # pre_save fills in the auto_now_add timestamps, as a regular save would
+            params = [
+                field.get_db_prep_save(field.pre_save(tx, add=True), connection)
+                for tx in batch
+                for field in fields
+            ]
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"INSERT INTO {Transaction._meta.db_table} ({columns}) "
+                    f"VALUES {', '.join([row_placeholder] * len(batch))} "
+                    f"ON CONFLICT (id) DO NOTHING RETURNING id",
+                    params,
+                )
+                inserted.update(row[0] for row in cursor.fetchall())
+
+        return inserted
+
+
+class IngestQueueService:
+    """
+    Accept-then-process ingest. ``enqueue`` durably records a validated
+    transaction in the ``pending_transactions`` outbox, and workers
+    (`manage.py process_ingest_queue`) call ``process_batch`` to store
+    queued transactions with ``TransactionIngestService``.
+
+    Transactions are scored for the hour they were accepted, not the hour
+    a worker gets to them, so a backlog does not change time-scoped rules.
+    """
+
+    @staticmethod
+    def enqueue(data):
+        """
+        data: validated TransactionSerializer data
+
+        Returns a result dict like ``TransactionIngestService.ingest_many``,
+        with a ``status`` of "pending", "duplicate" or "error". Enqueueing
+        an id that is already queued is a no-op, so clients can re-post a
+        transaction to poll for its outcome.
+        """
+        transaction_id = data["transaction_id"]
+
+        processed = TransactionIngestService.processed_stickers([transaction_id])
+        if transaction_id in processed:
+            return {
+                "transaction_id": transaction_id,
+                "status": "duplicate",
+                "stickers_awarded": processed[transaction_id],
+            }
+
+        queued = PendingTransaction.objects.filter(id=transaction_id).values_list("status", "errors").first()
+        if queued is None:
+            PendingTransaction.objects.bulk_create(
+                [PendingTransaction(id=transaction_id, payload=TransactionSerializer(data).data)],
+                ignore_conflicts=True,
+            )
+        elif queued[0] == "FAILED":
+            return {"transaction_id": transaction_id, "status": "error", "errors": queued[1]}
+
+        return {"transaction_id": transaction_id, "status": "pending"}
+
+    @staticmethod
+    def process_batch(batch_size=500):
+        """
+        Claims up to ``batch_size`` of the oldest pending transactions and
+        ingests them. Rows are locked with SKIP LOCKED, so any number of
+        workers can drain the queue side by side, and they stay queued if
+        the worker fails before committing.
+
+        Returns how many transactions were "created", "duplicate" or "error".
+        A transaction the database refuses to store is marked FAILED with
+        the database error, without holding up the rest of the batch.
+        """
+        summary = {"created": 0, "duplicate": 0, "error": 0}
+
+        with db_transaction.atomic():
+            batch = list(
+                PendingTransaction.objects
+                .filter(status="PENDING")
+                .order_by("created_at")
+                .select_for_update(skip_locked=True)[:batch_size]
+            )
+            if not batch:
+                return summary
+
+            failed = []
+            by_hour = defaultdict(list)
+            for pending in batch:
+                data, errors = validate_transaction(pending.payload)
+                if errors is not None:
+                    pending.errors = errors
+                    failed.append(pending)
+                    continue
+                accepted_at = timezone.localtime(pending.created_at).replace(minute=0, second=0, microsecond=0)
+                by_hour[accepted_at].append((pending, data))
+
+            for accepted_at, entries in by_hour.items():
+                try:
+                    with db_transaction.atomic():
+                        results = TransactionIngestService.ingest_many([data for _, data in entries], at=accepted_at)
+                except DatabaseError:
+                    # A value the database rejects fails the whole group;
+                    # store the group one transaction at a time to find it
+                    results = [IngestQueueService._ingest_one(data, accepted_at) for _, data in entries]
+                for (pending, _), result in zip(entries, results):
+                    if result["status"] == "error":
+                        pending.errors = result["errors"]
+                        failed.append(pending)
+                    else:
+                        summary[result["status"]] += 1
+            summary["error"] = len(failed)
+
+            for pending in failed:
+                pending.status = "FAILED"
+            PendingTransaction.objects.bulk_update(failed, ["status", "errors"])
+            PendingTransaction.objects.filter(
+                id__in=[pending.id for pending in batch if pending.status == "PENDING"]
+            ).delete()
+
+        logger.info("Ingest queue batch processed", **summary)
+        return summary
+
+    @staticmethod
+    def _ingest_one(data, at):
+        # Each under its own savepoint, so a failure only rolls back itself
+        try:
+            with db_transaction.atomic():
+                return TransactionIngestService.ingest_many([data], at=at)[0]
+        except DatabaseError as e:
+            logger.warning("Queued transaction not stored", transaction_id=data["transaction_id"], error=str(e))
+            return {"transaction_id": data["transaction_id"], "status": "error", "errors": {"error": str(e)}}
+
+
+class ShopperSummaryService:
+    """
+    Caches shopper summaries: the balance and first page of transactions
+    served by ShopperDetailView and the portal.
+
+    Summaries are kept in STICKER_SUMMARY_CACHE (Redis), with a short-lived
+    copy in each process's STICKER_SUMMARY_LOCAL_CACHE in front. Ledger
+    writes (see LedgerService) invalidate a shopper on commit by giving it a
+    new version, and cached summaries of any other version are ignored, so
+    a summary computed while a write was in flight is never served after
+    it. Other processes' local copies can lag for up to
+    STICKER_SUMMARY_LOCAL_TIMEOUT seconds.
+
+    On a miss one request per shopper recomputes the summary, from the
+    primary database, while concurrent requests wait up to LOCK_TIMEOUT
+    seconds for its result rather than running the same queries.
+    """
+
+    CACHE_KEY = "stickers:summary:{}"
+    VERSION_KEY = "stickers:summary-version:{}"
+    LOCK_KEY = "stickers:summary-lock:{}"
+    LOCK_TIMEOUT = 5
+    WAIT_INTERVAL = 0.05
+
+    @staticmethod
+    def get(shopper_id):
+        """
+        Returns the summary of ``shopper_id``, or None if there is no such
+        shopper.
+        """
+        local_timeout = settings.STICKER_SUMMARY_LOCAL_TIMEOUT
+        local = caches[settings.STICKER_SUMMARY_LOCAL_CACHE]
+        key = ShopperSummaryService.CACHE_KEY.format(shopper_id)
+        if local_timeout:
+            entry = local.get(key)
+            if entry is not None:
+                return entry[0]
+
+        found, summary, version = ShopperSummaryService._get_shared(shopper_id)
+        if not found:
+            summary = ShopperSummaryService._fill(shopper_id, version)
+
+        if local_timeout:
+            # Wrapped, so that a missing shopper is cached too
+            local.set(key, (summary,), timeout=local_timeout)
+        return summary
+
+    @staticmethod
+    def invalidate(shopper_ids):
+        """
+        Drops the cached summaries of ``shopper_ids`` once the current
+        transaction commits.
+        """
+        shopper_ids = set(shopper_ids)
+        db_transaction.on_commit(lambda: ShopperSummaryService._new_versions(shopper_ids))
+
+    @staticmethod
+    def compute(shopper_id):
+        shopper = Shopper.objects.filter(id=shopper_id).values_list("id", "balance").first()
+        if shopper is None:
+            return None
+
+        transactions, next_cursor = transaction_page(shopper[0])
         return {
-            "total_amount": total_amount,
-            "stickers_awarded": total_stickers
-        }
\ No newline at end of file
+            "shopper_id": shopper[0],
+            "balance": shopper[1],
+            "transactions": transactions,
+            "next_cursor": next_cursor,
+        }
+
+    @staticmethod
+    def _get_shared(shopper_id):
+        """
+        Returns ``(found, summary, version)``: whether the shared cache holds
+        a current summary, the summary, and the shopper's current version.
+        """
+        key = ShopperSummaryService.CACHE_KEY.format(shopper_id)
+        version_key = ShopperSummaryService.VERSION_KEY.format(shopper_id)
+        try:
+            cached = caches[settings.STICKER_SUMMARY_CACHE].get_many([key, version_key])
+        except Exception as e:
+            logger.warning("Shopper summary cache unavailable", error=str(e))
+            return False, None, None
+
+        version = cached.get(version_key)
+        entry = cached.get(key)
+        if entry is not None and entry[0] == version:
+            return True, entry[1], version
+        return False, None, version
+
+    @staticmethod
+    def _fill(shopper_id, version):
+        cache = caches[settings.STICKER_SUMMARY_CACHE]
+        lock_key = ShopperSummaryService.LOCK_KEY.format(shopper_id)
+        try:
+            locked = cache.add(lock_key, 1, timeout=ShopperSummaryService.LOCK_TIMEOUT)
+        except Exception as e:
+            logger.warning("Shopper summary cache unavailable", error=str(e))
+            return ShopperSummaryService._compute_from_primary(shopper_id)
+
+        if not locked:
+            # Another request is computing it; recompute only if it takes too long
+            deadline = time.monotonic() + ShopperSummaryService.LOCK_TIMEOUT
+            while time.monotonic() < deadline:
+                time.sleep(ShopperSummaryService.WAIT_INTERVAL)
+                found, summary, version = ShopperSummaryService._get_shared(shopper_id)
+                if found:
+                    return summary
+
+        try:
+            summary = ShopperSummaryService._compute_from_primary(shopper_id)
+        except Exception:
+            if locked:
+                ShopperSummaryService._cache_write(cache.delete, lock_key)
+            raise
+
+        # Stored under the version read before computing, so an invalidation
+        # since then makes it stale straight away
+        ShopperSummaryService._cache_write(
+            cache.set,
+            ShopperSummaryService.CACHE_KEY.format(shopper_id),
+            (version, summary),
+            timeout=settings.STICKER_SUMMARY_CACHE_TIMEOUT,
+        )
+        if locked:
+            ShopperSummaryService._cache_write(cache.delete, lock_key)
+        return summary
+
+    @staticmethod
+    def _compute_from_primary(shopper_id):
+        # A lagging replica would cache a summary without the latest writes
+        # for the whole cache timeout
+        with primary_reads():
+            return ShopperSummaryService.compute(shopper_id)
+
+    @staticmethod
+    def _new_versions(shopper_ids):
+        keys = [ShopperSummaryService.CACHE_KEY.format(shopper_id) for shopper_id in shopper_ids]
+        caches[settings.STICKER_SUMMARY_LOCAL_CACHE].delete_many(keys)
+        ShopperSummaryService._cache_write(
+            caches[settings.STICKER_SUMMARY_CACHE].set_many,
+            {ShopperSummaryService.VERSION_KEY.format(shopper_id): uuid.uuid4().hex for shopper_id in shopper_ids},
+            timeout=settings.STICKER_SUMMARY_CACHE_TIMEOUT,
+        )
+
+    @staticmethod
+    def _cache_write(method, *args, **kwargs):
+        try:
+            method(*args, **kwargs)
+        except Exception as e:
+            # The cache only saves queries; never fail a request because of it
+            logger.warning("Shopper summary cache unavailable", error=str(e))
+
+
+class LedgerService:
+    """
+    All sticker ledger writes go through here so that ``Shopper.balance``
+    always equals the sum of the shopper's ledger deltas.
+
+    Callers must already be inside ``db_transaction.atomic()`` so the ledger
+    rows and the balance update commit or roll back together.
+    """
+
+    BULK_BATCH_SIZE = 1000
+    # Entries can be written with a created_at slightly in the past (clock
+    # skew, long transactions), so only settled history is compacted
+    COMPACTION_MIN_AGE = timedelta(days=1)
+
+    @staticmethod
+    def record(shopper_id, entry_type, delta, transaction=None):
+        entry = StickerLedger.objects.create(
+            shopper_id=shopper_id,
+            transaction=transaction,
+            type=entry_type,
+            delta=delta,
+        )
+        Shopper.objects.filter(id=shopper_id).update(balance=F("balance") + delta)
+        ShopperSummaryService.invalidate([shopper_id])
+        return entry
+
+    @staticmethod
+    def record_many(entries):
+        """
+        entries: unsaved StickerLedger instances
+
+        Inserts the entries and applies the per-shopper deltas in a single
+        UPDATE, however many shoppers the entries touch.
+        """
+        StickerLedger.objects.bulk_create(entries, batch_size=LedgerService.BULK_BATCH_SIZE)
+
+        deltas = defaultdict(int)
+        for entry in entries:
+            deltas[entry.shopper_id] += entry.delta
+
+        if not deltas:
+            return
+
+        Shopper.objects.filter(id__in=deltas).update(
+            balance=F("balance") + Case(
+                *[When(id=shopper_id, then=Value(delta)) for shopper_id, delta in deltas.items()],
+                default=Value(0),
+                output_field=IntegerField(),
+            )
+        )
+        ShopperSummaryService.invalidate(deltas)
+
+    @staticmethod
+    def redeem(shopper_id, cost):
+        """
+        Debits ``cost`` stickers and records the REDEEM entry. Returns the
+        remaining balance.
+
+        The balance check and the debit are one conditional UPDATE, so
+        concurrent redemptions for the same shopper serialize on its row
+        and can never overdraw it, while different shoppers redeem in
+        parallel.
+
+        :raises Shopper.DoesNotExist: if the shopper does not exist
+        :raises InsufficientStickersError: if the balance is below ``cost``
+        """
+        with db_transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"UPDATE {Shopper._meta.db_table} SET balance = balance - %s "
+                    "WHERE id = %s AND balance >= %s RETURNING balance",
+                    [cost, shopper_id, cost],
+                )
+                row = cursor.fetchone()
+
+            if row is None:
+                if not Shopper.objects.filter(id=shopper_id).exists():
+                    raise Shopper.DoesNotExist
+                raise InsufficientStickersError
+
+            StickerLedger.objects.create(shopper_id=shopper_id, type="REDEEM", delta=-cost)
+            ShopperSummaryService.invalidate([shopper_id])
+
+        return row[0]
+
+    @staticmethod
+    def ledger_balance(shopper_id):
+        """
+        Recomputes a balance from the shopper's ledger snapshot and the
+        entries after it. Only used to rebuild or verify ``Shopper.balance``,
+        never on request paths.
+        """
+        snapshot = LedgerSnapshot.objects.filter(shopper_id=shopper_id).values_list("as_of", "balance").first()
+        entries = StickerLedger.objects.filter(shopper_id=shopper_id)
+        balance = 0
+        if snapshot is not None:
+            # A constant bound, so only the partitions after it are scanned
+            entries = entries.filter(created_at__gte=snapshot[0])
+            balance = snapshot[1]
+
+        return balance + entries.aggregate(total=Coalesce(Sum("delta"), 0))["total"]
+
+    @staticmethod
+    def unfolded_entries():
+        """
+        Ledger entries not yet folded into their shopper's ``LedgerSnapshot``.
+        """
+        return StickerLedger.objects.filter(
+            Q(shopper__ledger_snapshot__isnull=True)
+            | Q(created_at__gte=F("shopper__ledger_snapshot__as_of"))
+        )
+
+    @staticmethod
+    def total_earned():
+        """
+        Total stickers ever earned, from the snapshots and the entries after them.
+        """
+        folded = LedgerSnapshot.objects.aggregate(total=Coalesce(Sum("earned"), 0))["total"]
+        return folded + LedgerService.unfolded_entries().filter(type="EARN").aggregate(
+            total=Coalesce(Sum("delta"), 0)
+        )["total"]
+
+    @staticmethod
+    def compact(before):
+        """
+        Folds the ledger entries created before ``before`` into one
+        ``LedgerSnapshot`` per shopper, so balances no longer need them and
+        their partitions can be detached (``manage.py ledger_partitions``).
+        Entries themselves are never modified.
+
+        Every compaction moves all snapshots to ``before``, so entries older
+        than the oldest snapshot are already folded and are not read again.
+
+        Returns how many shoppers' snapshots took in new entries.
+
+        :raises ValueError: if ``before`` is less than ``COMPACTION_MIN_AGE`` ago
+        """
+        if before > timezone.now() - LedgerService.COMPACTION_MIN_AGE:
+            raise ValueError(
+                f"Only entries older than {LedgerService.COMPACTION_MIN_AGE.total_seconds() / 3600:g} hours "
+                "can be compacted"
+            )
+
+        ledger = StickerLedger._meta.db_table
+        snapshots = LedgerSnapshot._meta.db_table
+
+        with db_transaction.atomic():
+            folded_until = LedgerSnapshot.objects.aggregate(as_of=Min("as_of"))["as_of"]
+            if folded_until is not None and folded_until >= before:
+                return 0
+
+            since = ""
+            params = {"before": before}
+            if folded_until is not None:
+                since = "AND entry.created_at >= %(since)s"
+                params["since"] = folded_until
+
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"""
+                    INSERT INTO {snapshots} (shopper_id, as_of, balance, earned)
+                    SELECT entry.shopper_id,
+                           %(before)s,
+                           COALESCE(MAX(snapshot.balance), 0) + SUM(entry.delta),
+                           COALESCE(MAX(snapshot.earned), 0)
+                               + SUM(CASE WHEN entry.type = 'EARN' THEN entry.delta ELSE 0 END)
+                    FROM {ledger} entry
+                    LEFT JOIN {snapshots} snapshot ON snapshot.shopper_id = entry.shopper_id
+                    WHERE entry.created_at < %(before)s {since}
+                      AND (snapshot.as_of IS NULL OR entry.created_at >= snapshot.as_of)
+                    GROUP BY entry.shopper_id
+                    ON CONFLICT (shopper_id) DO UPDATE
+                    SET as_of = EXCLUDED.as_of, balance = EXCLUDED.balance, earned = EXCLUDED.earned
+                    """,
+                    params,
+                )
+                folded = cursor.rowcount
+
+            LedgerSnapshot.objects.filter(as_of__lt=before).update(as_of=before)
+
+        logger.info("Ledger compacted", before=before.isoformat(), shoppers=folded)
+        return folded
+
+
+class StatsRollupService:
+    """
+    Maintains the per-store and per-store-per-day counters that StatsView
+    serves, so the dashboard never scans the transactions or ledger tables.
+
+    ``record_transactions`` must run in the same atomic block that inserts
+    the transactions, so the counters never include uncommitted or
+    rolled-back rows.
+    """
+
+    BULK_BATCH_SIZE = 1000
+
+    @staticmethod
+    def record_transactions(transactions):
+        per_store = defaultdict(lambda: [0, 0])
+        per_day = defaultdict(lambda: [0, 0])
+        for tx in transactions:
+            day = timezone.localdate(tx.timestamp)
+            for counters in (per_store[tx.store_id], per_day[(tx.store_id, day)]):
+                counters[0] += 1
+                counters[1] += tx.stickers_awarded
+
+        # Rows are upserted in key order so concurrent batches lock the
+        # counter rows in the same order and cannot deadlock.
+        StatsRollupService._increment(
+            StoreStats._meta.db_table,
+            ["store_id"],
+            [(store_id, *counters) for store_id, counters in sorted(per_store.items())],
+        )
+        StatsRollupService._increment(
+            DailyStoreStats._meta.db_table,
+            ["store_id", "day"],
+            [(*key, *counters) for key, counters in sorted(per_day.items())],
+        )
+
+    @staticmethod
+    def _increment(table, key_columns, rows):
+        if not rows:
+            return
+
+        columns = [*key_columns, "transaction_count", "stickers_awarded"]
+        placeholders = ", ".join(["(" + ", ".join(["%s"] * len(columns)) + ")"] * len(rows))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {table} ({', '.join(columns)}) VALUES {placeholders} "
+                f"ON CONFLICT ({', '.join(key_columns)}) DO UPDATE SET "
+                f"transaction_count = {table}.transaction_count + EXCLUDED.transaction_count, "
+                f"stickers_awarded = {table}.stickers_awarded + EXCLUDED.stickers_awarded",
+                [value for row in rows for value in row],
+            )
+
+    @staticmethod
+    def rebuild():
+        """
+        Recomputes every counter from the transactions table, e.g. after a
+        manual data fix or to catch up a freshly migrated database.
+        """
+        with db_transaction.atomic():
+            if connection.vendor == "postgresql":
+                # Waits for in-flight ingests to commit their counter updates
+                # and holds new ones back until the rebuild commits, so every
+                # transaction is counted exactly once.
+                with connection.cursor() as cursor:
+                    cursor.execute(
+                        f"LOCK TABLE {StoreStats._meta.db_table}, {DailyStoreStats._meta.db_table} "
+                        "IN SHARE ROW EXCLUSIVE MODE"
+                    )
+
+            StoreStats.objects.all().delete()
+            DailyStoreStats.objects.all().delete()
+
+            StoreStats.objects.bulk_create(
+                [
+                    StoreStats(**row)
+                    for row in Transaction.objects.order_by().values("store_id").annotate(
+                        transaction_count=Count("id"),
+                        stickers_awarded=Sum("stickers_awarded"),
+                    )
+                ],
+                batch_size=StatsRollupService.BULK_BATCH_SIZE,
+            )
+            DailyStoreStats.objects.bulk_create(
+                [
+                    DailyStoreStats(**row)
+                    for row in Transaction.objects.annotate(day=TruncDate("timestamp"))
+                    .order_by()
+                    .values("store_id", "day")
+                    .annotate(
+                        transaction_count=Count("id"),
+                        stickers_awarded=Sum("stickers_awarded"),
+                    )
+                ],
+                batch_size=StatsRollupService.BULK_BATCH_SIZE,
+            )
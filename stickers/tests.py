@@ -1,9 +1,61 @@
+import csv
+import gzip
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import UTC, date, datetime, timedelta
+from decimal import Decimal
+from io import StringIO
+from math import ceil, floor
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest import skipUnless
+from unittest.mock import patch
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.db import transaction as db_transaction
+from django.test import SimpleTestCase, TransactionTestCase, override_settings
 from django.urls import reverse
-from rest_framework.test import APITestCase
+from django.utils import timezone
+from rest_framework.test import APIClient, APITestCase
 from rest_framework import status
 from django.db.models import Sum
+from freezegun import freeze_time
+
+from looplink.django_ext.replicas import _routing_state, _RoutingState
+from looplink.django_ext.testing import QueryBudgetExceeded, QueryBudgetMixin
+
+from .baskets import Basket, BasketItem
+from .models import LedgerSnapshot, PendingTransaction, Shopper, StoreStats, Transaction, TransactionItem, StickerLedger
+from .pagination import stream_shopper_history
+from .partitions import INITIAL_PARTITION, PartitionError, create_partitions, detach_partitions, get_partitions
+from .rules import DEFAULT_RULES, DEFAULT_RULESET, RulesError, compile_rules
+from .serializers import TransactionSerializer, fast_validate_transaction, validate_transaction
+from .services import LedgerService, ShopperSummaryService, StickerCalculationService, TransactionIngestService
+
 
-from .models import Shopper, Transaction, StickerLedger
+# In-process stand-ins for the summary caches, so that tests neither flush
+# a developer's Redis nor read summaries cached by earlier tests or runs
+summary_caches = override_settings(
+    CACHES={
+        **settings.CACHES,
+        "summary-local": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "summary-local"},
+    },
+    STICKER_SUMMARY_CACHE="locmem",
+    STICKER_SUMMARY_LOCAL_CACHE="summary-local",
+)
+
+
+def clear_summary_caches():
+    caches[settings.STICKER_SUMMARY_CACHE].clear()
+    caches[settings.STICKER_SUMMARY_LOCAL_CACHE].clear()
 
 
 class TransactionAPITests(APITestCase):
@@ -126,4 +178,1396 @@ class RedemptionAPITests(APITestCase):
             format="json"
         )
 
-        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
\ No newline at end of file
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+@freeze_time("2025-01-11")  # a Saturday, so no weekday bonus applies
+class BatchTransactionAPITests(APITestCase):
+
+    def setUp(self):
+        self.url = "/api/transactions/batch/"
+
+    def _payload(self, transaction_id, shopper_id="shopper-batch", unit_price="10.00"):
+        return {
+            "transaction_id": transaction_id,
+            "shopper_id": shopper_id,
+            "store_id": "store-01",
+            "items": [
+                {
+                    "sku": "SKU-1",
+                    "name": "Item 1",
+                    "quantity": 2,
+                    "unit_price": unit_price,
+                    "category": "grocery"
+                },
+                {
+                    "sku": "SKU-2",
+                    "name": "Item 2",
+                    "quantity": 1,
+                    "unit_price": "5.00",
+                    "category": "promo"
+                }
+            ]
+        }
+
+    def test_batch_created(self):
+        payload = [self._payload(f"tx-b{i}", shopper_id=f"shopper-{i % 3}") for i in range(5)]
+
+        response = self.client.post(self.url, payload, format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["created"], 5)
+        self.assertEqual([r["status"] for r in response.data["results"]], ["created"] * 5)
+        self.assertEqual(response.data["results"][0]["stickers_awarded"], 3)  # 2 base + 1 promo
+
+        self.assertEqual(Transaction.objects.count(), 5)
+        self.assertEqual(Shopper.objects.count(), 3)
+        self.assertEqual(TransactionItem.objects.count(), 10)
+        self.assertEqual(StickerLedger.objects.filter(type="EARN").count(), 5)
+
+    def test_batch_mixed_results(self):
+        self.client.post("/api/transactions/", self._payload("tx-b1"), format="json")
+
+        invalid = self._payload("tx-b3")
+        del invalid["store_id"]
+
+        payload = [
+            self._payload("tx-b1"),
+            self._payload("tx-b2"),
+            invalid,
+            self._payload("tx-b4", unit_price="-1.00"),
+            self._payload("tx-b2"),
+        ]
+
+        response = self.client.post(self.url, payload, format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        results = response.data["results"]
+        self.assertEqual(
+            [r["status"] for r in results],
+            ["duplicate", "created", "error", "error", "duplicate"]
+        )
+        self.assertEqual(results[0]["stickers_awarded"], 3)
+        self.assertEqual(results[4]["stickers_awarded"], 3)
+        self.assertIn("store_id", results[2]["errors"])
+        self.assertEqual(results[3]["errors"], {"error": "Unit price cannot be negative"})
+        self.assertEqual(
+            (response.data["created"], response.data["duplicate"], response.data["error"]),
+            (1, 2, 2)
+        )
+
+        self.assertEqual(Transaction.objects.count(), 2)
+        self.assertEqual(StickerLedger.objects.filter(shopper_id="shopper-batch").count(), 2)
+
+    def test_batch_oversized_receipt(self):
+        too_many = self._payload("tx-b2")
+        too_many["items"][0]["quantity"] = 3_000_000_000
+        too_expensive = self._payload("tx-b3")
+        too_expensive["items"][0]["quantity"] = 20_000_000
+
+        payload = [self._payload("tx-b1"), too_many, too_expensive, self._payload("tx-b4")]
+        response = self.client.post(self.url, payload, format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        results = response.data["results"]
+        self.assertEqual([r["status"] for r in results], ["created", "error", "error", "created"])
+        self.assertIn("quantity", results[1]["errors"]["items"][0])
+        self.assertIn("items", results[2]["errors"])
+        self.assertEqual(set(Transaction.objects.values_list("id", flat=True)), {"tx-b1", "tx-b4"})
+
+    def test_batch_query_count_is_constant(self):
+        payload = [self._payload(f"tx-q{i}", shopper_id=f"shopper-{i}") for i in range(50)]
+
+        # duplicate lookup + shoppers + transactions + items + ledger + balances
+        # + store and daily stats, plus the savepoint pair around the atomic block
+        with self.assertNumQueries(10):
+            response = self.client.post(self.url, payload, format="json")
+
+        self.assertEqual(response.data["created"], 50)
+
+    def test_batch_requires_list(self):
+        response = self.client.post(self.url, self._payload("tx-b1"), format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+@freeze_time("2025-01-11")
+@summary_caches
+class ShopperBalanceTests(APITestCase):
+
+    def setUp(self):
+        clear_summary_caches()
+        self.payload = {
+            "transaction_id": "tx-4001",
+            "shopper_id": "shopper-balance",
+            "store_id": "store-01",
+            "items": [
+                {
+                    "sku": "SKU-1",
+                    "name": "Item 1",
+                    "quantity": 5,
+                    "unit_price": "10.00",
+                    "category": "grocery"
+                }
+            ]
+        }
+
+    def _ledger_total(self, shopper_id):
+        return StickerLedger.objects.filter(shopper_id=shopper_id).aggregate(total=Sum("delta"))["total"]
+
+    def test_balance_follows_ledger(self):
+        self.client.post("/api/transactions/", self.payload, format="json")
+        self.client.post(
+            "/api/transactions/batch/",
+            [{**self.payload, "transaction_id": f"tx-40{i}"} for i in range(10, 13)],
+            format="json"
+        )
+
+        shopper = Shopper.objects.get(id="shopper-balance")
+        self.assertEqual(shopper.balance, 20)
+        self.assertEqual(shopper.balance, self._ledger_total("shopper-balance"))
+
+        response = self.client.post(
+            "/api/redeem/",
+            {"shopper_id": "shopper-balance", "reward_code": "MUG"},
+            format="json"
+        )
+        self.assertEqual(response.data["remaining_balance"], 10)
+
+        shopper.refresh_from_db()
+        self.assertEqual(shopper.balance, 10)
+        self.assertEqual(shopper.balance, self._ledger_total("shopper-balance"))
+
+        response = self.client.get("/api/shoppers/shopper-balance/")
+        self.assertEqual(response.data["balance"], 10)
+
+    def test_rebuild_balances_command(self):
+        self.client.post("/api/transactions/", self.payload, format="json")
+        Shopper.objects.filter(id="shopper-balance").update(balance=99)
+
+        with self.assertRaises(CommandError):
+            call_command("rebuild_balances", "--verify", stdout=StringIO())
+
+        call_command("rebuild_balances", stdout=StringIO())
+
+        self.assertEqual(Shopper.objects.get(id="shopper-balance").balance, 5)
+        call_command("rebuild_balances", "--verify", stdout=StringIO())
+
+
+@freeze_time("2025-01-11")
+@summary_caches
+@override_settings(STICKER_TRANSACTION_CACHE="locmem")
+class IdempotencyTests(APITestCase):
+
+    def setUp(self):
+        self.url = "/api/transactions/"
+        self.cache = caches[settings.STICKER_TRANSACTION_CACHE]
+        self.cache.clear()
+        self.payload = {
+            "transaction_id": "tx-replay",
+            "shopper_id": "shopper-replay",
+            "store_id": "store-01",
+            "items": [
+                {
+                    "sku": "SKU-1",
+                    "name": "Item 1",
+                    "quantity": 3,
+                    "unit_price": "10.00",
+                    "category": "grocery"
+                }
+            ]
+        }
+
+    def test_replay_answered_from_cache(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(self.url, self.payload, format="json")
+
+        with self.assertNumQueries(0):
+            response = self.client.post(self.url, self.payload, format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["stickers_awarded"], 3)
+
+    def test_replay_falls_back_to_one_query(self):
+        self.client.post(self.url, self.payload, format="json")
+        self.cache.clear()
+
+        with self.assertNumQueries(1):
+            response = self.client.post(self.url, self.payload, format="json")
+
+        self.assertEqual(response.data["stickers_awarded"], 3)
+
+    def test_lost_insert_race_reports_duplicate(self):
+        self.client.post(self.url, self.payload, format="json")
+
+        # As if a concurrent request stored the id after our lookup
+        with patch.object(TransactionIngestService, "processed_stickers", return_value={}):
+            payload = {**self.payload, "items": [{**self.payload["items"][0], "quantity": 1}]}
+            response = self.client.post(self.url, payload, format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["stickers_awarded"], 3)
+        self.assertEqual(StickerLedger.objects.filter(shopper_id="shopper-replay").count(), 1)
+        self.assertEqual(Shopper.objects.get(id="shopper-replay").balance, 3)
+
+
+@summary_caches
+@override_settings(STICKER_TRANSACTION_CACHE="locmem")
+class ConcurrentIngestTests(TransactionTestCase):
+    """
+    Submits the same transaction from parallel threads; exactly one of
+    them may store it.
+    """
+
+    workers = 10
+
+    def setUp(self):
+        caches[settings.STICKER_TRANSACTION_CACHE].clear()
+
+    def test_concurrent_duplicates_collapse_into_one_write(self):
+        barrier = threading.Barrier(self.workers)
+        payload = {
+            "transaction_id": "tx-race",
+            "shopper_id": "shopper-race",
+            "store_id": "store-01",
+            "items": [
+                {"sku": "SKU-1", "name": "Item 1", "quantity": 2, "unit_price": "10.00", "category": "grocery"}
+            ]
+        }
+
+        def ingest():
+            try:
+                barrier.wait()
+                return APIClient().post("/api/transactions/", payload, format="json")
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            responses = list(pool.map(lambda _: ingest(), range(self.workers)))
+
+        self.assertEqual(
+            sorted(r.status_code for r in responses),
+            [status.HTTP_200_OK] * (self.workers - 1) + [status.HTTP_201_CREATED]
+        )
+        self.assertTrue(all(r.data["stickers_awarded"] == 2 for r in responses))
+        self.assertEqual(Transaction.objects.count(), 1)
+        self.assertEqual(TransactionItem.objects.count(), 1)
+        self.assertEqual(StickerLedger.objects.count(), 1)
+        self.assertEqual(Shopper.objects.get(id="shopper-race").balance, 2)
+        self.assertEqual(StoreStats.objects.get(store_id="store-01").transaction_count, 1)
+
+
+@summary_caches
+class ConcurrentRedemptionTests(TransactionTestCase):
+    """
+    Fires parallel redemptions at one shopper from separate threads, each
+    with its own database connection, to check that the balance check and
+    debit cannot interleave.
+    """
+
+    workers = 20
+
+    def setUp(self):
+        Shopper.objects.create(id="shopper-race")
+        with db_transaction.atomic():
+            LedgerService.record("shopper-race", "EARN", 55)
+
+    def test_parallel_redemptions_never_overdraw(self):
+        barrier = threading.Barrier(self.workers)
+
+        def redeem():
+            try:
+                barrier.wait()
+                return APIClient().post(
+                    "/api/redeem/",
+                    {"shopper_id": "shopper-race", "reward_code": "MUG"},
+                    format="json"
+                )
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            responses = list(pool.map(lambda _: redeem(), range(self.workers)))
+
+        succeeded = [r for r in responses if r.status_code == status.HTTP_200_OK]
+        rejected = [r for r in responses if r.status_code == status.HTTP_400_BAD_REQUEST]
+
+        self.assertEqual(len(succeeded), 5)
+        self.assertEqual(len(rejected), self.workers - 5)
+        self.assertTrue(all(r.data["remaining_balance"] >= 0 for r in succeeded))
+        self.assertEqual(
+            sorted(r.data["remaining_balance"] for r in succeeded),
+            [5, 15, 25, 35, 45]
+        )
+
+        shopper = Shopper.objects.get(id="shopper-race")
+        self.assertEqual(shopper.balance, 5)
+        self.assertEqual(
+            StickerLedger.objects.filter(shopper=shopper).aggregate(total=Sum("delta"))["total"],
+            5
+        )
+
+
+@skipUnless(connection.vendor == "postgresql", "query plans are Postgres specific")
+class QueryPlanTests(TransactionTestCase):
+    """
+    Seeds 10,000 transactions and ledger entries across 250 shoppers and
+    checks with EXPLAIN that the hot queries use the indexes from
+    0003_query_indexes.
+    """
+
+    shoppers = 250
+    transactions_per_shopper = 40
+
+    def setUp(self):
+        Shopper.objects.bulk_create(
+            [Shopper(id=f"shopper-{s}") for s in range(self.shoppers)]
+        )
+        txs = [
+            Transaction(
+                id=f"tx-{s}-{t}",
+                shopper_id=f"shopper-{s}",
+                store_id=f"store-{t % 25}",
+                total_amount=Decimal("20.00"),
+                stickers_awarded=2,
+            )
+            for s in range(self.shoppers)
+            for t in range(self.transactions_per_shopper)
+        ]
+        Transaction.objects.bulk_create(txs, batch_size=5000)
+        StickerLedger.objects.bulk_create(
+            [StickerLedger(shopper_id=tx.shopper_id, transaction=tx, type="EARN", delta=2) for tx in txs],
+            batch_size=5000
+        )
+
+        # Index-only scans need an up-to-date visibility map, and the
+        # planner needs statistics for the seeded volume.
+        with connection.cursor() as cursor:
+            cursor.execute("VACUUM ANALYZE transactions")
+            cursor.execute("VACUUM ANALYZE sticker_ledger")
+
+    def _plan(self, sql, params):
+        with connection.cursor() as cursor:
+            cursor.execute(f"EXPLAIN {sql}", params)
+            return "\n".join(row[0] for row in cursor.fetchall())
+
+    def test_shopper_history_uses_index(self):
+        queryset = Transaction.objects.filter(shopper_id="shopper-42").order_by("-timestamp")
+
+        # Pages come straight off the index without a sort step
+        plan = queryset[:20].explain()
+
+        self.assertIn("transactions_shopper_hist_idx", plan)
+        self.assertNotIn("Sort", plan)
+
+    def test_ledger_balance_is_index_only_scan(self):
+        plan = self._plan(
+            "SELECT SUM(delta) FROM sticker_ledger WHERE shopper_id = %s",
+            ["shopper-42"]
+        )
+
+        self.assertIn("Index Only Scan using ledger_shopper_created_idx", plan)
+
+    def test_ledger_history_uses_index(self):
+        queryset = StickerLedger.objects.filter(shopper_id="shopper-42").order_by("created_at")
+
+        plan = queryset[:20].explain()
+
+        self.assertIn("ledger_shopper_created_idx", plan)
+        # The partitions' ordered scans are merged (Merge Append), never sorted
+        self.assertNotRegex(plan, r"(^|->  )Sort  \(")
+
+    def test_store_lookup_uses_index(self):
+        plan = self._plan(
+            "SELECT SUM(stickers_awarded) FROM transactions WHERE store_id = %s",
+            ["store-7"]
+        )
+
+        self.assertIn("transactions_store_idx", plan)
+
+
+class LedgerCompactionTests(APITestCase):
+    """
+    Snapshots plus the entries after them must give the same balances and
+    totals as the full ledger, and partitions can only be detached once
+    their entries are folded into snapshots.
+    """
+
+    def setUp(self):
+        self.initial_end = next(p.end for p in get_partitions() if p.name == INITIAL_PARTITION)
+        self.cutoff = self.initial_end - timedelta(days=10)
+        Shopper.objects.bulk_create([Shopper(id="shopper-1"), Shopper(id="shopper-2"), Shopper(id="shopper-3")])
+
+        with db_transaction.atomic():
+            with freeze_time(self.cutoff - timedelta(days=20)):
+                LedgerService.record("shopper-1", "EARN", 10)
+                LedgerService.record("shopper-2", "EARN", 4)
+            with freeze_time(self.cutoff - timedelta(days=1)):
+                LedgerService.record("shopper-1", "REDEEM", -6)
+            with freeze_time(self.cutoff + timedelta(days=1)):
+                LedgerService.record("shopper-1", "EARN", 3)
+                LedgerService.record("shopper-3", "EARN", 2)
+
+    def _compact(self, before):
+        with freeze_time(before + timedelta(days=2)):
+            return LedgerService.compact(before)
+
+    def _assert_balances_match(self):
+        for shopper in Shopper.objects.all():
+            self.assertEqual(LedgerService.ledger_balance(shopper.id), shopper.balance)
+        call_command("rebuild_balances", "--verify", stdout=StringIO())
+        self.assertEqual(LedgerService.total_earned(), 19)
+
+    def test_compaction_folds_entries_before_cutoff(self):
+        self.assertEqual(self._compact(self.cutoff), 2)
+
+        snapshots = {s.shopper_id: (s.as_of, s.balance, s.earned) for s in LedgerSnapshot.objects.all()}
+        self.assertEqual(snapshots, {
+            "shopper-1": (self.cutoff, 4, 10),
+            "shopper-2": (self.cutoff, 4, 4),
+        })
+        # Entries are never modified, only folded
+        self.assertEqual(StickerLedger.objects.count(), 5)
+        self._assert_balances_match()
+
+    def test_compaction_is_incremental(self):
+        self._compact(self.cutoff - timedelta(days=5))
+        self.assertEqual(self._compact(self.cutoff - timedelta(days=5)), 0)
+        self._compact(self.cutoff + timedelta(days=5))
+
+        snapshots = {s.shopper_id: (s.as_of, s.balance, s.earned) for s in LedgerSnapshot.objects.all()}
+        as_of = self.cutoff + timedelta(days=5)
+        self.assertEqual(snapshots, {
+            "shopper-1": (as_of, 7, 13),
+            "shopper-2": (as_of, 4, 4),
+            "shopper-3": (as_of, 2, 2),
+        })
+        self._assert_balances_match()
+
+    def test_compaction_refuses_recent_cutoff(self):
+        with self.assertRaises(ValueError):
+            LedgerService.compact(timezone.now())
+
+    def test_detach_requires_compaction(self):
+        with self.assertRaises(PartitionError):
+            detach_partitions(self.initial_end)
+
+        self._compact(self.initial_end)
+        self.assertEqual(detach_partitions(self.initial_end), [INITIAL_PARTITION])
+
+        self.assertEqual(StickerLedger.objects.count(), 0)
+        self.assertNotIn(INITIAL_PARTITION, [p.name for p in get_partitions()])
+        self._assert_balances_match()
+
+    def test_create_partitions_moves_rows_from_default(self):
+        # Far beyond the partitions created by the migration
+        with freeze_time("2040-03-15"), db_transaction.atomic():
+            LedgerService.record("shopper-2", "EARN", 1)
+
+        created = create_partitions(months_ahead=1, now=datetime(2040, 3, 15, tzinfo=UTC))
+
+        self.assertEqual(created, ["sticker_ledger_p2040_03", "sticker_ledger_p2040_04"])
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT tableoid::regclass::text FROM sticker_ledger WHERE created_at >= '2040-01-01'")
+            self.assertEqual(cursor.fetchall(), [("sticker_ledger_p2040_03",)])
+        self.assertEqual(create_partitions(months_ahead=1, now=datetime(2040, 3, 15, tzinfo=UTC)), [])
+
+
+@freeze_time("2025-01-11")
+class StatsRollupTests(APITestCase):
+
+    def setUp(self):
+        self.url = "/api/stats/"
+
+        transactions = [
+            {
+                "transaction_id": f"tx-s{i}",
+                "shopper_id": f"shopper-{i % 4}",
+                "store_id": f"store-{i % 3}",
+                "items": [
+                    {
+                        "sku": "SKU-1",
+                        "name": "Item 1",
+                        "quantity": 1 + i % 3,
+                        "unit_price": "10.00",
+                        "category": "grocery"
+                    }
+                ]
+            }
+            for i in range(9)
+        ]
+        self.client.post("/api/transactions/", transactions[0], format="json")
+        self.client.post("/api/transactions/batch/", transactions[1:], format="json")
+        self.client.post("/api/redeem/", {"shopper_id": "shopper-2", "reward_code": "MUG"}, format="json")
+
+    def _normalized(self, data):
+        return {
+            **data,
+            "stickers_per_store": sorted(data["stickers_per_store"], key=lambda row: row["store_id"]),
+        }
+
+    def test_rollups_match_exact_stats(self):
+        with self.assertNumQueries(1):
+            rollup = self.client.get(self.url).data
+
+        exact = self.client.get(self.url, {"exact": "1"}).data
+
+        self.assertEqual(rollup["total_transactions"], 9)
+        self.assertEqual(rollup["total_stickers_awarded"], 18)
+        self.assertEqual(self._normalized(rollup), self._normalized(exact))
+
+    def test_per_day_stats(self):
+        rollup = self.client.get(self.url, {"days": "7"}).data
+        exact = self.client.get(self.url, {"days": "7", "exact": "1"}).data
+
+        self.assertEqual(len(rollup["stickers_per_day"]), 1)
+        self.assertEqual(rollup["stickers_per_day"][0]["transactions"], 9)
+        self.assertEqual(rollup["stickers_per_day"], exact["stickers_per_day"])
+
+    def test_days_out_of_range(self):
+        for params in [{"days": "1000000"}, {"days": "1000000", "exact": "1"}]:
+            with self.subTest(params=params):
+                response = self.client.get(self.url, params)
+                self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self.client.get(self.url, {"days": "3650", "exact": "1"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_rebuild_stats_command(self):
+        expected = self._normalized(self.client.get(self.url).data)
+        StoreStats.objects.all().delete()
+
+        call_command("rebuild_stats", stdout=StringIO())
+
+        self.assertEqual(self._normalized(self.client.get(self.url).data), expected)
+
+
+@override_settings(STICKER_INGEST_ASYNC=True)
+class AsyncIngestTests(APITestCase):
+
+    def setUp(self):
+        self.url = "/api/transactions/"
+
+    def _payload(self, transaction_id, quantity=2, unit_price="10.00"):
+        return {
+            "transaction_id": transaction_id,
+            "shopper_id": "shopper-async",
+            "store_id": "store-01",
+            "items": [
+                {
+                    "sku": "SKU-1",
+                    "name": "Item 1",
+                    "quantity": quantity,
+                    "unit_price": unit_price,
+                    "category": "grocery"
+                }
+            ]
+        }
+
+    def _process_queue(self):
+        out = StringIO()
+        call_command("process_ingest_queue", "--once", stdout=out)
+        return out.getvalue()
+
+    @freeze_time("2025-01-11")
+    def test_accept_then_process(self):
+        response = self.client.post(self.url, self._payload("tx-a1"), format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.data["transaction_id"], "tx-a1")
+        self.assertFalse(Transaction.objects.exists())
+
+        # Polling before a worker gets to it
+        response = self.client.post(self.url, self._payload("tx-a1"), format="json")
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(PendingTransaction.objects.count(), 1)
+
+        self.assertIn("1 created", self._process_queue())
+
+        response = self.client.post(self.url, self._payload("tx-a1"), format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["stickers_awarded"], 2)
+        self.assertEqual(Shopper.objects.get(id="shopper-async").balance, 2)
+        self.assertFalse(PendingTransaction.objects.exists())
+
+    @freeze_time("2025-01-11")
+    def test_failed_transaction_is_reported(self):
+        self.client.post(self.url, self._payload("tx-a1", unit_price="-1.00"), format="json")
+        self.client.post(self.url, self._payload("tx-a2"), format="json")
+
+        self.assertIn("1 created, 0 duplicate, 1 failed", self._process_queue())
+
+        response = self.client.post(self.url, self._payload("tx-a1"), format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data, {"error": "Unit price cannot be negative"})
+        self.assertEqual(PendingTransaction.objects.get(id="tx-a1").status, "FAILED")
+        self.assertFalse(Transaction.objects.filter(id="tx-a1").exists())
+
+    @freeze_time("2025-01-11")
+    @patch("stickers.serializers.MAX_QUANTITY", 10**18)
+    def test_database_error_fails_only_its_transaction(self):
+        # Let a quantity past validation that is out of range for its column
+        self.client.post(self.url, self._payload("tx-a1", quantity=3_000_000_000, unit_price="0.00"), format="json")
+        self.client.post(self.url, self._payload("tx-a2"), format="json")
+
+        self.assertIn("1 created, 0 duplicate, 1 failed", self._process_queue())
+
+        failed = PendingTransaction.objects.get(id="tx-a1")
+        self.assertEqual(failed.status, "FAILED")
+        self.assertIn("out of range", failed.errors["error"])
+        self.assertEqual(list(Transaction.objects.values_list("id", flat=True)), ["tx-a2"])
+        self.assertEqual(Shopper.objects.get(id="shopper-async").balance, 2)
+
+    def test_scored_for_the_hour_it_was_accepted(self):
+        with freeze_time("2025-01-08 23:30") as frozen:  # a Wednesday
+            self.client.post(self.url, self._payload("tx-a1", quantity=4), format="json")
+
+            frozen.move_to("2025-01-09 00:30")
+            self._process_queue()
+
+        # 4 base + 2 Wednesday bonus, capped at 5
+        self.assertEqual(Transaction.objects.get(id="tx-a1").stickers_awarded, 5)
+
+
+@freeze_time("2025-01-11")
+@summary_caches
+@override_settings(STICKER_TRANSACTION_CACHE="locmem")
+class QueryBudgetTests(QueryBudgetMixin, APITestCase):
+    """
+    Query budgets per endpoint, checked at several data sizes so that any
+    per-item or per-row query shows up as a failure.
+    """
+
+    basket_sizes = [1, 10, 100]
+    history_lengths = [0, 5, 120]
+
+    def setUp(self):
+        caches[settings.STICKER_TRANSACTION_CACHE].clear()
+        clear_summary_caches()
+
+    def _transaction(self, transaction_id, shopper_id, basket_size=1):
+        return {
+            "transaction_id": transaction_id,
+            "shopper_id": shopper_id,
+            "store_id": f"store-{basket_size % 3}",
+            "items": [
+                {
+                    "sku": f"SKU-{i}",
+                    "name": f"Item {i}",
+                    "quantity": 1,
+                    "unit_price": "12.50",
+                    "category": "promo" if i % 4 == 0 else "grocery"
+                }
+                for i in range(basket_size)
+            ]
+        }
+
+    def _seed_history(self, shopper_id, length):
+        Shopper.objects.create(id=shopper_id)
+        if length:
+            self.client.post(
+                "/api/transactions/batch/",
+                [self._transaction(f"{shopper_id}-tx-{i}", shopper_id, basket_size=3) for i in range(length)],
+                format="json",
+            )
+
+    def test_transaction_ingest(self):
+        for basket_size in self.basket_sizes:
+            with self.subTest(basket_size=basket_size):
+                payload = self._transaction(f"tx-budget-{basket_size}", "shopper-budget", basket_size)
+
+                # duplicate lookup + savepoint + shopper + transaction + items + ledger
+                # + balance + store and daily stats + release
+                with self.assertQueryBudget(10):
+                    response = self.client.post("/api/transactions/", payload, format="json")
+                self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+                with self.assertQueryBudget(1):
+                    response = self.client.post("/api/transactions/", payload, format="json")
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_shopper_detail(self):
+        for length in self.history_lengths:
+            with self.subTest(history_length=length):
+                shopper_id = f"shopper-detail-{length}"
+                self._seed_history(shopper_id, length)
+
+                # shopper + one page of transactions
+                with self.assertQueryBudget(2):
+                    response = self.client.get(f"/api/shoppers/{shopper_id}/")
+                self.assertEqual(len(response.data["transactions"]), min(length, 50))
+
+                with self.assertQueryBudget(2 + ceil(length / 2000)):
+                    response = self.client.get(f"/api/shoppers/{shopper_id}/", {"stream": "1"})
+                    b"".join(response.streaming_content)
+
+    def test_stats(self):
+        for length in self.history_lengths:
+            with self.subTest(history_length=length):
+                self._seed_history(f"shopper-stats-{length}", length)
+
+                with self.assertQueryBudget(1):
+                    self.client.get("/api/stats/")
+                with self.assertQueryBudget(2):
+                    self.client.get("/api/stats/", {"days": "30"})
+
+    def test_redemption(self):
+        for length in self.history_lengths:
+            with self.subTest(history_length=length):
+                shopper_id = f"shopper-redeem-{length}"
+                self._seed_history(shopper_id, length)
+                Shopper.objects.filter(id=shopper_id).update(balance=20)
+
+                # conditional decrement + savepoint, ledger insert, release
+                with self.assertQueryBudget(4):
+                    response = self.client.post(
+                        "/api/redeem/", {"shopper_id": shopper_id, "reward_code": "MUG"}, format="json"
+                    )
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_portal(self):
+        for length in self.history_lengths:
+            with self.subTest(history_length=length):
+                shopper_id = f"shopper-portal-{length}"
+                self._seed_history(shopper_id, length)
+
+                # session lookups aside: shopper + one page of transactions
+                with self.assertQueryBudget(2):
+                    response = self.client.post(reverse("portal"), {"shopper_id": shopper_id})
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_budget_catches_repeated_queries(self):
+        with self.assertRaisesRegex(QueryBudgetExceeded, "N\\+1"):
+            with self.assertQueryBudget(10):
+                for shopper_id in ["a", "b", "c"]:
+                    Shopper.objects.filter(id=shopper_id).exists()
+
+        with self.assertRaisesRegex(QueryBudgetExceeded, "2 queries executed, budget is 1"):
+            with self.assertQueryBudget(1):
+                Shopper.objects.exists()
+                Transaction.objects.exists()
+
+
+@summary_caches
+class ShopperHistoryTests(APITestCase):
+
+    def setUp(self):
+        clear_summary_caches()
+        self.url = "/api/shoppers/shopper-history/"
+
+        Shopper.objects.create(id="shopper-history", balance=25)
+        start = timezone.now() - timedelta(days=30)
+        txs = Transaction.objects.bulk_create([
+            Transaction(
+                id=f"tx-h{i:03}",
+                shopper_id="shopper-history",
+                store_id="store-01",
+                total_amount=Decimal("10.00"),
+                stickers_awarded=1,
+            )
+            for i in range(25)
+        ])
+        # Two transactions share each timestamp so pages must break ties on id
+        for i, tx in enumerate(txs):
+            Transaction.objects.filter(id=tx.id).update(timestamp=start + timedelta(hours=i // 2))
+
+        self.expected_ids = list(
+            Transaction.objects.order_by("-timestamp", "-id").values_list("id", flat=True)
+        )
+
+    def test_cursor_pagination_walks_full_history(self):
+        seen = []
+        params = {"limit": 10}
+        while True:
+            response = self.client.get(self.url, params)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertLessEqual(len(response.data["transactions"]), 10)
+            seen.extend(tx["transaction_id"] for tx in response.data["transactions"])
+            if not response.data["next_cursor"]:
+                break
+            params = {"limit": 10, "cursor": response.data["next_cursor"]}
+
+        self.assertEqual(seen, self.expected_ids)
+
+    def test_invalid_cursor(self):
+        response = self.client.get(self.url, {"cursor": "not-a-cursor"})
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_stream_matches_pages(self):
+        response = self.client.get(self.url, {"stream": "1"})
+
+        self.assertTrue(response.streaming)
+        streamed = json.loads(b"".join(response.streaming_content))
+
+        page = self.client.get(self.url, {"limit": 100}, HTTP_ACCEPT="application/json")
+        paged = json.loads(page.content)
+        del paged["next_cursor"]
+
+        self.assertEqual(streamed, paged)
+        self.assertEqual([tx["transaction_id"] for tx in streamed["transactions"]], self.expected_ids)
+
+    def test_stream_reads_from_request_replica(self):
+        # The response streams after ReplicaRoutingMiddleware has reset the
+        # routing state, the replica must be picked while the view runs
+        token = _routing_state.set(_RoutingState(replica="replica_0"))
+        try:
+            chunks = stream_shopper_history("shopper-history", 25)
+        finally:
+            _routing_state.reset(token)
+
+        with patch("django.db.models.query.QuerySet.iterator", autospec=True, return_value=iter([])) as iterator:
+            content = "".join(chunks)
+
+        self.assertEqual(iterator.call_args.args[0].db, "replica_0")
+        self.assertEqual(json.loads(content)["transactions"], [])
+
+
+def reference_calculate(items, weekday):
+    """
+    The original single-basket StickerCalculationService.calculate, kept
+    verbatim (minus the weekday lookup) as the oracle for equivalence tests.
+    """
+    total_amount = Decimal("0.00")
+    promo_bonus = 0
+
+    for item in items:
+        quantity = item["quantity"]
+        unit_price = Decimal(str(item["unit_price"]))
+
+        if quantity < 0:
+            raise ValueError("Quantity cannot be negative")
+
+        if unit_price < 0:
+            raise ValueError("Unit price cannot be negative")
+
+        total_amount += quantity * unit_price
+
+        if item.get("category") == "promo":
+            promo_bonus += quantity
+
+    base_stickers = floor(total_amount / Decimal("10"))
+    if weekday in [2, 4]:
+        wed_or_fri_special = floor(base_stickers * 0.5)
+    else:
+        wed_or_fri_special = 0
+
+    total_stickers = min(base_stickers + promo_bonus + wed_or_fri_special, 5)
+
+    return {
+        "total_amount": total_amount,
+        "stickers_awarded": total_stickers
+    }
+
+
+@freeze_time("2025-01-11")
+@summary_caches
+@override_settings(STICKER_TRANSACTION_CACHE="locmem")
+class ShopperSummaryCacheTests(APITestCase):
+
+    def setUp(self):
+        caches[settings.STICKER_TRANSACTION_CACHE].clear()
+        clear_summary_caches()
+        self.url = "/api/shoppers/shopper-summary/"
+        self.payload = {
+            "transaction_id": "tx-5001",
+            "shopper_id": "shopper-summary",
+            "store_id": "store-01",
+            "items": [
+                {"sku": "SKU-1", "name": "Item 1", "quantity": 5, "unit_price": "10.00", "category": "grocery"}
+            ]
+        }
+
+    def ingest(self, transaction_id):
+        # Invalidation happens on commit, which the test transaction never does
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                "/api/transactions/",
+                {**self.payload, "transaction_id": transaction_id},
+                format="json"
+            )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+    def test_lookups_served_from_cache(self):
+        self.ingest("tx-5001")
+        first = self.client.get(self.url)
+        self.assertEqual(first.data["balance"], 5)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(self.url).data, first.data)
+            response = self.client.post(reverse("portal"), {"shopper_id": "shopper-summary"})
+        self.assertEqual(response.context["shopper_data"]["balance"], 5)
+
+        # The local copy answers while it lasts, the shared cache after that
+        caches[settings.STICKER_SUMMARY_CACHE].clear()
+        with self.assertNumQueries(0):
+            self.client.get(self.url)
+        caches[settings.STICKER_SUMMARY_LOCAL_CACHE].clear()
+        self.client.get(self.url)
+        with self.assertNumQueries(0):
+            caches[settings.STICKER_SUMMARY_LOCAL_CACHE].clear()
+            self.client.get(self.url)
+
+        # Missing shoppers are cached too, pages other than the first are not
+        for _ in range(2):
+            self.assertEqual(self.client.get("/api/shoppers/nobody/").status_code, status.HTTP_404_NOT_FOUND)
+        with self.assertNumQueries(0):
+            self.client.get("/api/shoppers/nobody/")
+        self.assertEqual(len(self.client.get(self.url, {"limit": 1}).data["transactions"]), 1)
+
+    def test_ledger_writes_invalidate(self):
+        self.ingest("tx-5001")
+        self.assertEqual(self.client.get(self.url).data["balance"], 5)
+
+        self.ingest("tx-5002")
+        response = self.client.get(self.url)
+        self.assertEqual(response.data["balance"], 10)
+        self.assertEqual([tx["transaction_id"] for tx in response.data["transactions"]], ["tx-5002", "tx-5001"])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            LedgerService.redeem("shopper-summary", 10)
+        self.assertEqual(self.client.get(self.url).data["balance"], 0)
+
+    def test_summary_computed_during_a_write_is_not_served(self):
+        self.ingest("tx-5001")
+        compute = ShopperSummaryService.compute
+
+        def compute_racing_a_write(shopper_id):
+            summary = compute(shopper_id)
+            ShopperSummaryService._new_versions([shopper_id])
+            return summary
+
+        with patch.object(ShopperSummaryService, "compute", side_effect=compute_racing_a_write) as racing:
+            ShopperSummaryService.get("shopper-summary")
+            caches[settings.STICKER_SUMMARY_LOCAL_CACHE].clear()
+            ShopperSummaryService.get("shopper-summary")
+        self.assertEqual(racing.call_count, 2)
+
+    def test_concurrent_misses_compute_once(self):
+        summary = {"shopper_id": "hot", "balance": 1, "transactions": [], "next_cursor": None}
+
+        def slow_compute(shopper_id):
+            time.sleep(0.2)
+            return summary
+
+        with patch.object(ShopperSummaryService, "compute", side_effect=slow_compute) as compute:
+            with ThreadPoolExecutor(max_workers=16) as executor:
+                results = list(executor.map(ShopperSummaryService.get, ["hot"] * 16))
+
+        self.assertEqual(compute.call_count, 1)
+        self.assertEqual(results, [summary] * 16)
+
+
+class ExportTests(APITestCase):
+
+    def setUp(self):
+        self.client.force_login(User.objects.create_user("finance", is_staff=True))
+        for day, transaction_id, store_id in [
+            ("2025-01-09", "tx-e1", "store-01"),
+            ("2025-01-10", "tx-e2", "store-02"),
+            ("2025-01-11", "tx-e3", "store-01"),
+        ]:
+            with freeze_time(day):
+                TransactionIngestService.ingest_many([{
+                    "transaction_id": transaction_id,
+                    "shopper_id": "shopper-export",
+                    "store_id": store_id,
+                    "items": [
+                        {"sku": "SKU-1", "name": "Mug, large", "quantity": 2, "unit_price": Decimal("12.50"),
+                         "category": "grocery"},
+                        {"sku": "SKU-2", "name": "Tea", "quantity": 1, "unit_price": Decimal("5.00"),
+                         "category": "household"},
+                    ],
+                }])
+        with freeze_time("2025-01-12"):
+            LedgerService.redeem("shopper-export", 2)
+
+    def export(self, dataset, **params):
+        response = self.client.get(f"/api/exports/{dataset}/", params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response, b"".join(response.streaming_content)
+
+    def test_csv(self):
+        response, content = self.export("transactions")
+        self.assertEqual(response["Content-Type"], "text/csv; charset=utf-8")
+        self.assertEqual(response["Content-Disposition"], 'attachment; filename="transactions.csv"')
+
+        rows = sorted(csv.DictReader(content.decode().splitlines()), key=lambda row: row["transaction_id"])
+        self.assertEqual([row["transaction_id"] for row in rows], ["tx-e1", "tx-e2", "tx-e3"])
+        self.assertEqual(rows[0]["total_amount"], "30.00")
+        self.assertEqual(rows[0]["timestamp"], "2025-01-09T00:00:00Z")
+
+        # Quoting survives the round trip
+        _, content = self.export("items", store="store-01", start="2025-01-10")
+        rows = list(csv.DictReader(content.decode().splitlines()))
+        self.assertEqual({row["transaction_id"] for row in rows}, {"tx-e3"})
+        self.assertIn("Mug, large", {row["name"] for row in rows})
+
+    def test_ndjson_gzip(self):
+        response, content = self.export("ledger", format="ndjson", gzip="1", end="2025-01-13")
+        self.assertEqual(response["Content-Type"], "application/gzip")
+        self.assertEqual(response["Content-Disposition"], 'attachment; filename="ledger-20250113.ndjson.gz"')
+
+        entries = [json.loads(line) for line in gzip.decompress(content).decode().splitlines()]
+        self.assertEqual(sorted(entry["type"] for entry in entries), ["EARN", "EARN", "EARN", "REDEEM"])
+        redeem = next(entry for entry in entries if entry["type"] == "REDEEM")
+        self.assertEqual((redeem["delta"], redeem["transaction_id"], redeem["store_id"]), (-2, None, None))
+
+        _, content = self.export("items", format="ndjson")
+        self.assertIn('"unit_price":"12.50"', content.decode())
+
+    def test_streams_in_chunks(self):
+        with patch("stickers.exports.EXPORT_CHUNK_SIZE", 2):
+            response = self.client.get("/api/exports/items/")
+            chunks = list(response.streaming_content)
+        # Header, then 6 items two at a time
+        self.assertEqual(len(chunks), 4)
+        self.assertEqual(len(b"".join(chunks).decode().splitlines()), 7)
+
+    def test_invalid_requests(self):
+        for url, params, expected in [
+            ("/api/exports/shoppers/", {}, status.HTTP_404_NOT_FOUND),
+            ("/api/exports/ledger/", {"format": "xml"}, status.HTTP_400_BAD_REQUEST),
+            ("/api/exports/ledger/", {"start": "01/10/2025"}, status.HTTP_400_BAD_REQUEST),
+            ("/api/exports/ledger/", {"start": "2025-01-10", "end": "2025-01-10"}, status.HTTP_400_BAD_REQUEST),
+            ("/api/exports/ledger/", {"start": "2025-01-11", "end": "2025-01-10"}, status.HTTP_400_BAD_REQUEST),
+        ]:
+            with self.subTest(url=url, params=params):
+                self.assertEqual(self.client.get(url, params).status_code, expected)
+
+        self.client.force_login(User.objects.create_user("shopper"))
+        self.assertEqual(self.client.get("/api/exports/ledger/").status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_command_matches_endpoint(self):
+        _, expected = self.export("items", format="ndjson", store="store-02")
+        with TemporaryDirectory() as directory:
+            path = Path(directory) / "items.ndjson.gz"
+            call_command(
+                "export_stickers", "items", "--format", "ndjson", "--store", "store-02", "--gzip",
+                "--output", str(path), stderr=StringIO()
+            )
+            self.assertEqual(gzip.decompress(path.read_bytes()), expected)
+
+
+class StickerCalculationEquivalenceTests(SimpleTestCase):
+    """
+    Property-style tests: seeded random baskets must score identically
+    through calculate, calculate_many and the original algorithm.
+    """
+
+    seed = 20250111
+    examples = 500
+
+    # 2025-01-06 is a Monday
+    days = [date(2025, 1, 6) + timedelta(days=offset) for offset in range(7)]
+
+    def _price(self, rng):
+        cents = rng.choice([0, 1, 99, 500, 999, 1000, 1999, rng.randrange(0, 100_000)])
+        if rng.random() < 0.05:
+            cents = -cents - 1
+        form = rng.randrange(6)
+        if form == 0:
+            return f"{cents / 100:.2f}"
+        if form == 1:
+            return Decimal(cents).scaleb(-2)
+        if form == 2:
+            return cents // 100  # whole dollars as int
+        if form == 3:
+            return f"{cents / 100:.1f}"
+        if form == 4:
+            return f"{cents}.{rng.randrange(10)}e-2"  # sub-cent precision
+        return cents / 100  # float
+
+    def _basket(self, rng):
+        return [
+            {
+                "sku": f"SKU-{rng.randrange(50)}",
+                "name": "Item",
+                "quantity": rng.choice([0, 1, 2, 3, 10, rng.randrange(100)]) * (-1 if rng.random() < 0.03 else 1),
+                "unit_price": self._price(rng),
+                "category": rng.choice(["grocery", "promo", "household"]),
+            }
+            for _ in range(rng.choice([0, 1, 2, 5, 20, rng.randrange(200)]))
+        ]
+
+    def _expected(self, items, day):
+        try:
+            return reference_calculate(items, day.weekday())
+        except ValueError as e:
+            return e
+
+    def _assert_same(self, actual, expected):
+        if isinstance(expected, ValueError):
+            self.assertIsInstance(actual, ValueError)
+            self.assertEqual(str(actual), str(expected))
+        else:
+            self.assertEqual(actual, expected)
+
+    def test_calculate_matches_original(self):
+        rng = random.Random(self.seed)
+        for _ in range(self.examples):
+            items = self._basket(rng)
+            day = rng.choice(self.days)
+            expected = self._expected(items, day)
+
+            with self.subTest(items=items, day=day):
+                try:
+                    actual = StickerCalculationService.calculate(items, at=day)
+                except ValueError as e:
+                    actual = e
+                self._assert_same(actual, expected)
+
+    def test_calculate_many_matches_original(self):
+        rng = random.Random(self.seed + 1)
+        for _ in range(20):
+            baskets = [self._basket(rng) for _ in range(rng.randrange(1, 100))]
+            day = rng.choice(self.days)
+
+            results = StickerCalculationService.calculate_many(baskets, at=day, return_exceptions=True)
+
+            self.assertEqual(len(results), len(baskets))
+            for items, actual in zip(baskets, results):
+                with self.subTest(items=items, day=day):
+                    self._assert_same(actual, self._expected(items, day))
+
+    def test_calculate_many_raises_by_default(self):
+        baskets = [
+            [{"quantity": 1, "unit_price": "10.00", "category": "grocery"}],
+            [{"quantity": -1, "unit_price": "10.00", "category": "grocery"}],
+        ]
+
+        with self.assertRaisesMessage(ValueError, "Quantity cannot be negative"):
+            StickerCalculationService.calculate_many(baskets)
+
+    def test_weekday_bonus(self):
+        items = [{"quantity": 4, "unit_price": "10.00", "category": "grocery"}]
+
+        self.assertEqual(StickerCalculationService.calculate(items, at=date(2025, 1, 8))["stickers_awarded"], 5)
+        self.assertEqual(StickerCalculationService.calculate(items, at=date(2025, 1, 9))["stickers_awarded"], 4)
+
+    def test_basket_matches_item_dicts(self):
+        rng = random.Random(self.seed + 2)
+        for _ in range(self.examples):
+            items = self._basket(rng)
+            day = rng.choice(self.days)
+            try:
+                basket = Basket.from_items(items)
+            except ValueError:
+                # Sub-cent prices never pass validation
+                continue
+
+            with self.subTest(items=items, day=day):
+                try:
+                    actual = StickerCalculationService.calculate(basket, at=day)
+                except ValueError as e:
+                    actual = e
+                self._assert_same(actual, self._expected(items, day))
+
+    def test_basket_item_reads_like_a_dict(self):
+        item = BasketItem.from_dict({
+            "sku": "SKU-1",
+            "name": "Milk",
+            "quantity": 2,
+            "unit_price": "1.5",
+            "category": "grocery",
+        })
+
+        self.assertEqual(item.unit_price_cents, 150)
+        self.assertEqual(str(item["unit_price"]), "1.50")
+        self.assertEqual(item["quantity"], 2)
+        self.assertIsNone(item.get("store_id"))
+        with self.assertRaises(KeyError):
+            item["unit_price_cents"]
+        self.assertEqual(item.as_dict()["sku"], "SKU-1")
+
+
+class FastValidationTests(SimpleTestCase):
+    """
+    Differential tests: fuzzed payloads must get the same decision, the
+    same validated data and the same errors from validate_transaction as
+    from TransactionSerializer.
+    """
+
+    seed = 20250301
+    examples = 2000
+
+    odd_values = [
+        None, "", " ", "x", " x", "x ", "x\x00", "\ud800", "é", 0, 1, -1, 3.0, 3.5, True, False,
+        [], {}, ["x"], "3", "3.0", " 3", 10**30, 2**31 - 1, 2**31, -2**31 - 1,
+    ]
+    odd_prices = [
+        "1", "1.5", "1.50", "-1.00", "0", "-0", "1.", ".5", "1.234", "1e2", "NaN", "Infinity", " 1.00",
+        "0000000001.00", "12345678.99", "123456789.00", "١.٠٠", 1, 1.5, 1.234, Decimal("2.5"),
+    ]
+
+    def _payload(self, rng):
+        return {
+            "transaction_id": f"tx-{rng.randrange(1000)}",
+            "shopper_id": f"shopper-{rng.randrange(100)}",
+            "store_id": "store-1",
+            "items": [
+                {
+                    "sku": f"SKU-{rng.randrange(50)}",
+                    "name": "Item",
+                    "quantity": rng.randrange(10),
+                    "unit_price": f"{rng.randrange(100_000) / 100:.2f}",
+                    "category": rng.choice(["grocery", "promo"]),
+                }
+                for _ in range(rng.choice([0, 1, 3, 10]))
+            ],
+        }
+
+    def _mutate(self, payload, rng):
+        roll = rng.random()
+        if roll < 0.02:
+            return rng.choice([None, [], "payload", [payload]])
+        if roll < 0.25:
+            key = rng.choice(["transaction_id", "shopper_id", "store_id", "items"])
+            if rng.random() < 0.2:
+                del payload[key]
+            else:
+                payload[key] = rng.choice(self.odd_values)
+            return payload
+        if roll < 0.7 and payload["items"]:
+            item = rng.choice(payload["items"])
+            key = rng.choice(["sku", "name", "quantity", "unit_price", "category"])
+            if rng.random() < 0.1:
+                del item[key]
+            elif key == "unit_price":
+                item[key] = rng.choice(self.odd_prices)
+            else:
+                item[key] = rng.choice(self.odd_values)
+            return payload
+        if roll < 0.75 and payload["items"]:
+            payload["items"][0] = rng.choice(self.odd_values)
+        return payload
+
+    def _serializer_result(self, payload):
+        serializer = TransactionSerializer(data=payload)
+        if serializer.is_valid():
+            return serializer.validated_data, None
+        return None, serializer.errors
+
+    def test_matches_serializer_on_fuzzed_payloads(self):
+        rng = random.Random(self.seed)
+        fast_path = 0
+        for _ in range(self.examples):
+            payload = self._mutate(self._payload(rng), rng)
+
+            with self.subTest(payload=payload):
+                if fast_validate_transaction(payload) is not None:
+                    fast_path += 1
+                # repr, so that values of different types never compare equal
+                self.assertEqual(repr(validate_transaction(payload)), repr(self._serializer_result(payload)))
+
+        # The fast path handles the payloads that weren't made invalid
+        self.assertGreater(fast_path, self.examples // 3)
+
+    def test_setting_disables_fast_path(self):
+        payload = self._payload(random.Random(self.seed))
+
+        with self.settings(STICKER_FAST_VALIDATION=False), patch(
+            "stickers.serializers.fast_validate_transaction"
+        ) as fast_validate:
+            data, errors = validate_transaction(payload)
+
+        fast_validate.assert_not_called()
+        self.assertIsNone(errors)
+        self.assertEqual(data["transaction_id"], payload["transaction_id"])
+
+
+class PromotionRulesTests(SimpleTestCase):
+
+    # A Thursday, outside the default Wed/Fri bonus
+    at = datetime(2025, 1, 9, 14, 30)
+
+    def _ruleset(self, *rules):
+        return compile_rules({"rules": [*DEFAULT_RULES["rules"], *rules]})
+
+    def _stickers(self, ruleset, items, store_id=None, at=None):
+        with patch("stickers.services.get_active_ruleset", return_value=ruleset):
+            return StickerCalculationService.calculate(items, at=at or self.at, store_id=store_id)["stickers_awarded"]
+
+    def _item(self, sku="SKU-1", category="grocery", quantity=1, unit_price="10.00"):
+        return {"sku": sku, "name": "Item", "quantity": quantity, "unit_price": unit_price, "category": category}
+
+    def test_default_ruleset_matches_built_in_behaviour(self):
+        items = [self._item(quantity=3), self._item(category="promo", quantity=1, unit_price="5.00")]
+
+        self.assertEqual(self._stickers(DEFAULT_RULESET, items), 4)  # 3 base + 1 promo
+        self.assertEqual(self._stickers(DEFAULT_RULESET, items, at=datetime(2025, 1, 8, 9)), 5)  # +1 Wed bonus, capped
+
+    def test_sku_bonus_and_category_multiplier(self):
+        ruleset = self._ruleset(
+            {"id": "sku", "kind": "unit_bonus", "sku": "SKU-9", "stickers_per_unit": 2},
+            {"id": "dairy", "kind": "spend_multiplier", "category": "dairy", "multiplier": "1.5"},
+            {"id": "cap", "kind": "cap", "max_stickers": 100},
+        )
+
+        self.assertEqual(self._stickers(ruleset, [self._item(sku="SKU-9", quantity=2)]), 2 + 4)
+        # $20 of dairy counts as $30
+        self.assertEqual(self._stickers(ruleset, [self._item(category="dairy", quantity=2)]), 3)
+        # Sub-cent prices take the Decimal path with the same rules
+        self.assertEqual(self._stickers(ruleset, [self._item(category="dairy", quantity=2, unit_price="10.001")]), 3)
+
+    def test_store_overrides(self):
+        ruleset = self._ruleset(
+            {"id": "store-cap", "kind": "cap", "stores": ["store-42"], "max_stickers": 20},
+            {"id": "store-rate", "kind": "base_rate", "stores": ["store-42"], "cents_per_sticker": 500},
+        )
+        items = [self._item(quantity=5)]
+
+        self.assertEqual(self._stickers(ruleset, items, store_id="store-01"), 5)
+        self.assertEqual(self._stickers(ruleset, items, store_id="store-42"), 10)
+
+    def test_time_windows(self):
+        ruleset = self._ruleset(
+            {
+                "id": "happy-hour", "kind": "unit_bonus", "category": "grocery", "stickers_per_unit": 1,
+                "hours": [14, 16]
+            },
+            {
+                "id": "january", "kind": "unit_bonus", "sku": "SKU-1", "stickers_per_unit": 1,
+                "start_date": "2025-01-01", "end_date": "2025-01-31"
+            },
+        )
+        items = [self._item(quantity=1, unit_price="1.00")]
+
+        self.assertEqual(self._stickers(ruleset, items), 2)
+        self.assertEqual(self._stickers(ruleset, items, at=datetime(2025, 1, 9, 17)), 1)
+        self.assertEqual(self._stickers(ruleset, items, at=datetime(2025, 2, 9, 14)), 1)
+        # A bare date cannot satisfy an hour window
+        self.assertEqual(self._stickers(ruleset, items, at=date(2025, 1, 9)), 1)
+
+    def test_invalid_rules(self):
+        invalid = [
+            {"rules": [{"kind": "unit_bonus", "category": "promo", "stickers_per_unit": 1}]},
+            {"rules": [*DEFAULT_RULES["rules"], {"kind": "unit_bonus", "stickers_per_unit": 1}]},
+            {"rules": [*DEFAULT_RULES["rules"], {"kind": "mystery", "category": "promo"}]},
+            {"rules": [*DEFAULT_RULES["rules"], {"kind": "cap", "max_stickers": -1}]},
+            {"rules": [*DEFAULT_RULES["rules"], {"kind": "cap", "max_stickers": 1, "hours": [16, 14]}]},
+        ]
+        for data in invalid:
+            with self.subTest(data=data), self.assertRaises(RulesError):
+                compile_rules(data)
+
+    def test_rules_file_hot_reload(self):
+        with TemporaryDirectory() as directory:
+            path = Path(directory) / "rules.json"
+            path.write_text(json.dumps(DEFAULT_RULES))
+
+            with self.settings(STICKER_RULES_FILE=str(path), STICKER_RULES_RELOAD_INTERVAL=0):
+                items = [self._item(category="toys", quantity=1, unit_price="1.00")]
+                self.assertEqual(StickerCalculationService.calculate(items, at=self.at)["stickers_awarded"], 0)
+
+                rules = {"rules": [
+                    *DEFAULT_RULES["rules"],
+                    {"id": "toys", "kind": "unit_bonus", "category": "toys", "stickers_per_unit": 3},
+                ]}
+                path.write_text(json.dumps(rules))
+                os.utime(path, ns=(time.time_ns(), time.time_ns() + 1_000_000_000))
+                self.assertEqual(StickerCalculationService.calculate(items, at=self.at)["stickers_awarded"], 3)
+
+                # A broken file keeps the last good rules in service
+                path.write_text("{not json")
+                os.utime(path, ns=(time.time_ns(), time.time_ns() + 2_000_000_000))
+                self.assertEqual(StickerCalculationService.calculate(items, at=self.at)["stickers_awarded"], 3)
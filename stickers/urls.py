@@ -1,13 +1,16 @@
 from django.urls import path
-from .views import RedemptionView, TransactionIngestView
+from .views import RedemptionView, TransactionBatchIngestView, TransactionIngestView
 from .views import ShopperDetailView 
 from .views import StatsView,portal_view
+from .views import ExportView
 
 urlpatterns = [
     path("transactions/", TransactionIngestView.as_view(), name="transaction-ingest"),
+    path("transactions/batch/", TransactionBatchIngestView.as_view(), name="transaction-batch-ingest"),
     path("shoppers/<str:shopper_id>/", ShopperDetailView.as_view()),
     path("stats/", StatsView.as_view()),
     path("redeem/", RedemptionView.as_view()),
+    path("exports/<str:dataset>/", ExportView.as_view(), name="export"),
     
     path("portal/", portal_view, name="portal"),
 ]
\ No newline at end of file
@@ -1,27 +1,45 @@
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
-from django.db import transaction as db_transaction
-from .models import Shopper, Transaction, TransactionItem, StickerLedger
-from .serializers import TransactionSerializer
-from .services import StickerCalculationService
-from rest_framework.permissions import AllowAny
+from .models import DailyStoreStats, Shopper, StoreStats, Transaction
+from .serializers import validate_transaction
+from .services import (
+    IngestQueueService,
+    InsufficientStickersError,
+    LedgerService,
+    ShopperSummaryService,
+    TransactionIngestService,
+)
+from .pagination import InvalidCursorError, parse_limit, stream_shopper_history, transaction_page
+from .exports import CONTENT_TYPES, EXPORTS, FORMATS, parse_date, stream_export
+from rest_framework.negotiation import BaseContentNegotiation
+from rest_framework.permissions import AllowAny, IsAdminUser
+from django.conf import settings
 from django.db.models import Sum,Count
+from django.db.models.functions import TruncDate
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from datetime import timedelta
 import structlog
 
+from looplink.django_ext.replicas import replica_reads
+
 logger = structlog.get_logger()
 
 class TransactionIngestView(APIView):
-    
+    """
+    Ingests one transaction. With STICKER_INGEST_ASYNC the transaction is
+    queued and answered with 202; re-posting it returns 202 until a worker
+    has processed it, and then the usual duplicate response.
+    """
+
     permission_classes = [AllowAny]
 
     def post(self, request):
-        serializer = TransactionSerializer(data=request.data)
+        data, errors = validate_transaction(request.data)
 
-        if not serializer.is_valid():
-            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
-
-        data = serializer.validated_data
+        if errors is not None:
+            return Response(errors, status=status.HTTP_400_BAD_REQUEST)
 
         transaction_id = data["transaction_id"]
 
@@ -29,73 +47,122 @@ class TransactionIngestView(APIView):
 
         log.info("Transaction received")
 
-        # Idempotency check
-        if Transaction.objects.filter(id=transaction_id).exists():
-            existing_tx = Transaction.objects.get(id=transaction_id)
+        if settings.STICKER_INGEST_ASYNC:
+            result = IngestQueueService.enqueue(data)
+        else:
+            result = TransactionIngestService.ingest_many([data])[0]
 
+        if result["status"] == "pending":
+            log.info("Transaction queued")
             return Response({
-                "transaction_id": existing_tx.id,
-                "stickers_awarded": existing_tx.stickers_awarded,
+                "transaction_id": result["transaction_id"],
+                "message": "Transaction accepted for processing"
+            }, status=status.HTTP_202_ACCEPTED)
+
+        if result["status"] == "duplicate":
+            return Response({
+                "transaction_id": result["transaction_id"],
+                "stickers_awarded": result["stickers_awarded"],
                 "message": "Transaction already processed"
             })
 
-        try:
-            with db_transaction.atomic():
+        if result["status"] == "error":
+            return Response(result["errors"], status=status.HTTP_400_BAD_REQUEST)
+
+        log.info("Transaction Created")
 
-                # Get or create shopper
-                shopper, _ = Shopper.objects.get_or_create(id=data["shopper_id"])
+        return Response({
+            "transaction_id": result["transaction_id"],
+            "stickers_awarded": result["stickers_awarded"]
+        }, status=status.HTTP_201_CREATED)
 
-                # Calculate stickers
-                calculation = StickerCalculationService.calculate(data["items"])
 
-                # Create transaction
-                tx = Transaction.objects.create(
-                    id=transaction_id,
-                    shopper=shopper,
-                    store_id=data["store_id"],
-                    total_amount=calculation["total_amount"],
-                    stickers_awarded=calculation["stickers_awarded"],
-                )
-                
-                log.info("Transaction Created")
-
-                # Create items
-                for item in data["items"]:
-                    TransactionItem.objects.create(
-                        transaction=tx,
-                        sku=item["sku"],
-                        name=item["name"],
-                        quantity=item["quantity"],
-                        unit_price=item["unit_price"],
-                        category=item["category"],
-                    )
-
-                # Create ledger entry
-                StickerLedger.objects.create(
-                    shopper=shopper,
-                    transaction=tx,
-                    type="EARN",
-                    delta=calculation["stickers_awarded"]
-                )
+class TransactionBatchIngestView(APIView):
+    """
+    Ingests a list of transactions in one request, e.g. when a POS gateway
+    replays receipts after coming back online. Each transaction is reported
+    as "created", "duplicate" or "error" without failing the others.
+    """
 
-            return Response({
-                "transaction_id": tx.id,
-                "stickers_awarded": tx.stickers_awarded
-            }, status=status.HTTP_201_CREATED)
+    permission_classes = [AllowAny]
+    max_batch_size = 1000
 
-        except ValueError as e:
+    def post(self, request):
+        if not isinstance(request.data, list):
             return Response(
-                {"error": str(e)},
+                {"error": "Expected a list of transactions"},
                 status=status.HTTP_400_BAD_REQUEST
             )
-            
 
+        if len(request.data) > self.max_batch_size:
+            return Response(
+                {"error": f"A batch may contain at most {self.max_batch_size} transactions"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        logger.info("Transaction batch received", size=len(request.data))
+
+        results = [None] * len(request.data)
+        valid = []
+
+        # Entries are validated one by one, so one bad entry doesn't stop
+        # the others from being ingested
+        for index, payload in enumerate(request.data):
+            data, errors = validate_transaction(payload)
+            if errors is None:
+                valid.append((index, data))
+            else:
+                results[index] = {
+                    "transaction_id": _raw_transaction_id(payload),
+                    "status": "error",
+                    "errors": errors,
+                }
+
+        if valid:
+            ingested = TransactionIngestService.ingest_many([data for _, data in valid])
+            for (index, _), result in zip(valid, ingested):
+                results[index] = result
+
+        summary = {"created": 0, "duplicate": 0, "error": 0}
+        for result in results:
+            summary[result["status"]] += 1
+
+        logger.info("Transaction batch processed", **summary)
+
+        return Response({**summary, "results": results})
+
+
+def _raw_transaction_id(payload):
+    if isinstance(payload, dict):
+        return payload.get("transaction_id")
+    return None
 
 
 class ShopperDetailView(APIView):
+    """
+    Returns a shopper's balance and one page of their transactions, newest
+    first. Pass ``limit`` (default 50, max 500) and the ``next_cursor`` of
+    the previous page as ``cursor`` to walk the history.
+
+    ``?stream=1`` streams the whole history as a single JSON document.
+
+    The first page with the default ``limit`` is served from the shopper
+    summary cache (see ShopperSummaryService).
+    """
+
     permission_classes = [AllowAny]
+    replica_reads = True
 
     def get(self, request, shopper_id):
+        if not request.query_params.keys() & {"stream", "limit", "cursor"}:
+            summary = ShopperSummaryService.get(shopper_id)
+            if summary is None:
+                return Response(
+                    {"error": "Shopper not found"},
+                    status=status.HTTP_404_NOT_FOUND
+                )
+            return Response(summary)
+
         try:
             shopper = Shopper.objects.get(id=shopper_id)
         except Shopper.DoesNotExist:
@@ -104,39 +171,101 @@ class ShopperDetailView(APIView):
                 status=status.HTTP_404_NOT_FOUND
             )
 
-        # Calculate balance from ledger
-        balance = shopper.ledger_entries.aggregate(
-            total=Sum("delta")
-        )["total"] or 0
-
-        transactions = shopper.transactions.all().order_by("-timestamp")
+        if request.query_params.get("stream") == "1":
+            return StreamingHttpResponse(
+                stream_shopper_history(shopper.id, shopper.balance),
+                content_type="application/json"
+            )
 
-        tx_list = [
-            {
-                "transaction_id": tx.id,
-                "stickers_awarded": tx.stickers_awarded,
-                "total_amount": tx.total_amount,
-                "timestamp": tx.created_at,
-            }
-            for tx in transactions
-        ]
+        try:
+            limit = parse_limit(request.query_params.get("limit"))
+            tx_list, next_cursor = transaction_page(
+                shopper.id,
+                limit=limit,
+                cursor=request.query_params.get("cursor")
+            )
+        except ValueError as e:
+            return Response(
+                {"error": str(e)},
+                status=status.HTTP_400_BAD_REQUEST
+            )
 
         return Response({
             "shopper_id": shopper.id,
-            "balance": balance,
-            "transactions": tx_list
+            "balance": shopper.balance,
+            "transactions": tx_list,
+            "next_cursor": next_cursor
         })
 
 
 class StatsView(APIView):
+    """
+    Serves the precomputed StoreStats / DailyStoreStats rollups, so the cost
+    depends on the number of stores rather than the number of transactions.
+
+    ``?exact=1`` recomputes everything from the raw tables instead, and
+    ``?days=N`` adds per-day totals for the last N days (at most
+    ``MAX_DAYS``).
+    """
+
     permission_classes = [AllowAny]
+    replica_reads = True
+    MAX_DAYS = 3650
 
     def get(self, request):
+        exact = request.query_params.get("exact") == "1"
+
+        try:
+            days = int(request.query_params.get("days", 0))
+        except ValueError:
+            return Response(
+                {"error": "days must be an integer"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        if days > self.MAX_DAYS:
+            return Response(
+                {"error": f"days must be at most {self.MAX_DAYS}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        stats = self._exact_stats(days) if exact else self._rollup_stats(days)
+        return Response(stats)
+
+    def _rollup_stats(self, days):
+        stores = list(
+            StoreStats.objects
+            .values("store_id", "transaction_count", "stickers_awarded")
+            .order_by("-stickers_awarded")
+        )
+
+        stats = {
+            "total_stickers_awarded": sum(store["stickers_awarded"] for store in stores),
+            "total_transactions": sum(store["transaction_count"] for store in stores),
+            "stickers_per_store": [
+                {"store_id": store["store_id"], "stickers_awarded": store["stickers_awarded"]}
+                for store in stores
+            ],
+        }
+
+        if days > 0:
+            stats["stickers_per_day"] = list(
+                DailyStoreStats.objects
+                .filter(day__gt=timezone.localdate() - timedelta(days=days))
+                .values("day")
+                .annotate(
+                    transactions=Sum("transaction_count"),
+                    stickers_awarded=Sum("stickers_awarded"),
+                )
+                .order_by("day")
+            )
+
+        return stats
+
+    def _exact_stats(self, days):
 
         # Total stickers awarded (only EARN entries)
-        total_stickers = StickerLedger.objects.filter(
-            type="EARN"
-        ).aggregate(total=Sum("delta"))["total"] or 0
+        total_stickers = LedgerService.total_earned()
 
         # Total transactions
         total_transactions = Transaction.objects.count()
@@ -149,14 +278,101 @@ class StatsView(APIView):
             .order_by("-stickers_awarded")
         )
 
-        return Response({
+        stats = {
             "total_stickers_awarded": total_stickers,
             "total_transactions": total_transactions,
             "stickers_per_store": list(stickers_per_store),
-        })
-        
+        }
+
+        if days > 0:
+            stats["stickers_per_day"] = list(
+                Transaction.objects
+                .annotate(day=TruncDate("timestamp"))
+                .filter(day__gt=timezone.localdate() - timedelta(days=days))
+                .values("day")
+                .annotate(
+                    transactions=Count("id"),
+                    stickers_awarded=Sum("stickers_awarded"),
+                )
+                .order_by("day")
+            )
+
+        return stats
 
 
+class _FirstRendererNegotiation(BaseContentNegotiation):
+    # Exports pick their format with ?format=, and errors are always JSON
+    def select_parser(self, request, parsers):
+        return parsers[0]
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        return renderers[0], renderers[0].media_type
+
+
+class ExportView(APIView):
+    """
+    Streams one of the ``stickers.exports`` datasets (transactions, items or
+    ledger) as a file, for staff users.
+
+    ``?start=`` and ``?end=`` (YYYY-MM-DD, end exclusive) limit the date
+    range, ``?store=`` the store. ``?format=ndjson`` switches from CSV, and
+    ``?gzip=1`` compresses the file.
+    """
+
+    permission_classes = [IsAdminUser]
+    content_negotiation_class = _FirstRendererNegotiation
+    replica_reads = True
+
+    def get(self, request, dataset):
+        if dataset not in EXPORTS:
+            return Response(
+                {"error": f"Unknown export, expected one of {', '.join(EXPORTS)}"},
+                status=status.HTTP_404_NOT_FOUND
+            )
+
+        output_format = request.query_params.get("format", "csv")
+        if output_format not in FORMATS:
+            return Response(
+                {"error": f"format must be one of {', '.join(FORMATS)}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        try:
+            start, end = (
+                parse_date(request.query_params[name]) if request.query_params.get(name) else None
+                for name in ("start", "end")
+            )
+        except ValueError:
+            return Response(
+                {"error": "start and end must be dates, YYYY-MM-DD"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        if start and end and start >= end:
+            return Response(
+                {"error": "start must be before end"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        compress = request.query_params.get("gzip") == "1"
+        chunks = stream_export(
+            dataset,
+            output_format,
+            start=start,
+            end=end,
+            store_id=request.query_params.get("store"),
+            compress=compress,
+        )
+
+        filename = "-".join([dataset] + [f"{value:%Y%m%d}" for value in (start, end) if value]) + f".{output_format}"
+        if compress:
+            response = StreamingHttpResponse(chunks, content_type="application/gzip")
+            filename += ".gz"
+        else:
+            response = StreamingHttpResponse(chunks, content_type=CONTENT_TYPES[output_format])
+        response["Content-Disposition"] = f'attachment; filename="{filename}"'
+        return response
+
 
 from .rewards import REWARDS
 
@@ -179,67 +395,66 @@ class RedemptionView(APIView):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
+        cost = REWARDS[reward_code]
+
         try:
-            shopper = Shopper.objects.get(id=shopper_id)
+            remaining_balance = LedgerService.redeem(shopper_id, cost)
         except Shopper.DoesNotExist:
             return Response(
                 {"error": "Shopper not found"},
                 status=status.HTTP_404_NOT_FOUND
             )
-
-        cost = REWARDS[reward_code]
-
-        # Calculate balance
-        balance = shopper.ledger_entries.aggregate(
-            total=Sum("delta")
-        )["total"] or 0
-
-        if balance < cost:
+        except InsufficientStickersError:
             return Response(
                 {"error": "Insufficient stickers"},
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        with db_transaction.atomic():
-            StickerLedger.objects.create(
-                shopper=shopper,
-                type="REDEEM",
-                delta=-cost
-            )
-
         return Response({
             "message": f"{reward_code} redeemed successfully",
-            "remaining_balance": balance - cost
+            "remaining_balance": remaining_balance
         })
 
 from django.shortcuts import render
 
+# Only reads, though the lookup form posts
+@replica_reads
 def portal_view(request):
     shopper_data = None
     error = None
 
     if request.method == "POST":
         shopper_id = request.POST.get("shopper_id")
+        cursor = request.POST.get("cursor")
 
         try:
-            shopper = Shopper.objects.get(id=shopper_id)
-
-            balance = shopper.ledger_entries.aggregate(
-                total=Sum("delta")
-            )["total"] or 0
-
-            transactions = shopper.transactions.all().order_by("-timestamp")
+            if cursor:
+                shopper = Shopper.objects.get(id=shopper_id)
+                transactions, next_cursor = transaction_page(shopper.id, cursor=cursor)
+                summary = {
+                    "shopper_id": shopper.id,
+                    "balance": shopper.balance,
+                    "transactions": transactions,
+                    "next_cursor": next_cursor
+                }
+            else:
+                summary = ShopperSummaryService.get(shopper_id)
+                if summary is None:
+                    raise Shopper.DoesNotExist
 
             shopper_data = {
-                "id": shopper.id,
-                "balance": balance,
-                "transactions": transactions
+                "id": summary["shopper_id"],
+                "balance": summary["balance"],
+                "transactions": summary["transactions"],
+                "next_cursor": summary["next_cursor"]
             }
 
         except Shopper.DoesNotExist:
             error = "Shopper not found"
+        except InvalidCursorError as e:
+            error = str(e)
 
     return render(request, "stickers/portal.html", {
         "shopper_data": shopper_data,
         "error": error
-    })
\ No newline at end of file
+    })
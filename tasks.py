@@ -1,4 +1,5 @@
 import textwrap
+from datetime import datetime
 from pathlib import Path
 
 from invoke import Context, Exit, call, task
@@ -124,6 +125,72 @@ def webpack(c: Context):
     c.run("npm run build", echo=True)
 
 
+@task(
+    help={
+        "seed": "Seed benchmark data first (shoppers x transactions, items per basket)",
+        "url": "Base URL of a running server",
+        "output": "JSON file for the results (default: benchmarks/results/load-<timestamp>.json)",
+    }
+)
+def loadtest(
+    c: Context,
+    seed=False,
+    shoppers=1000,
+    transactions=20,
+    items=5,
+    url="http://127.0.0.1:8000",
+    concurrency=8,
+    duration=30,
+    output=None,
+):
+    """
+    Load test the sticker API against a running server, see benchmarks/load.py.
+    """
+    if seed:
+        c.run(
+            f"python -m benchmarks.load seed --shoppers {shoppers} --transactions {transactions} --items {items}",
+            echo=True,
+            pty=True,
+        )
+    if output is None:
+        output = f"benchmarks/results/load-{datetime.now():%Y%m%d-%H%M%S}.json"
+    c.run(
+        f"python -m benchmarks.load run --url {url} --concurrency {concurrency} --duration {duration} "
+        f"--shoppers {shoppers} --items {items} --output {output}",
+        echo=True,
+        pty=True,
+    )
+
+
+@task(
+    help={
+        "save": "Record the results as the new baseline",
+        "tolerance": "Percent slower or larger than the baseline that fails the run",
+    }
+)
+def microbench(c: Context, save=False, tolerance=10.0):
+    """
+    Micro-benchmark sticker calculation and serializers against the stored baseline, see benchmarks/micro.py.
+    """
+    command = f"python -m benchmarks.micro --tolerance {tolerance}"
+    if save:
+        command += " --save-baseline"
+    c.run(command, echo=True, pty=True)
+
+
+@task(
+    help={
+        "requests": "Requests per thread and connection mode",
+        "concurrency": "Threads per process, as in a threaded worker",
+    }
+)
+def connbench(c: Context, requests=1000, concurrency=1):
+    """
+    Compare request latency with fresh, persistent and pooled database connections, see benchmarks/connections.py.
+    """
+    c.run(f"python -m benchmarks.connections --requests {requests} --concurrency {concurrency}", echo=True, pty=True)
+
+
 def _run_with_confirm(c: Context, message, command, step=False):
     cprint(f"\n{message}", "green")
     if not step or _confirm("\tOK?", _exit=False):